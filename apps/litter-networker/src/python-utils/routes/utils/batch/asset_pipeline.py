@@ -0,0 +1,259 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import concurrent.futures
+import multiprocessing
+from collections import deque
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from tqdm import tqdm
+
+from routes.utils.images import image_utils, asset_fingerprints
+from routes.utils.batch.aws_concurrency import controllers
+from routes.utils.images.image_utils import upload_image_bytes
+from routes.utils.images.asset_fingerprints import record_fingerprint
+
+# Number of worker threads running whole tasks in thread mode. In process mode the
+# upload threads are sized to the S3 controller's ceiling instead, and its adaptive
+# limit decides how many uploads actually run at once.
+max_io_workers = 10
+
+# Memory allowed for tasks in flight: the estimated render memory of running tasks plus
+# the encoded images waiting for upload. Sized for a small build box.
+max_inflight_bytes = 1024 * 1024 * 1024
+
+# Estimated render memory of a task that does not give its own
+default_task_bytes = 64 * 1024 * 1024
+
+
+def render_task(func, args):
+    """
+    Run a generator in a render worker, capturing its encoded images instead of uploading them.
+
+    Parameters:
+        func (callable): Generator function, e.g. `generate_flyer`.
+        args (tuple): Positional arguments for `func`.
+
+    Returns:
+        list: `(s3_key, data, metadata)` tuples for every image the generator saved.
+    """
+    outputs = []
+    image_utils.use_upload_sink(
+        lambda s3_key, data, metadata: outputs.append((s3_key, data, metadata))
+    )
+    try:
+        func(*args)
+    finally:
+        image_utils.use_upload_sink(None)
+    return outputs
+
+
+def upload_outputs(outputs):
+    """
+    Upload the encoded images produced by one render task and record their fingerprints.
+
+    Entries are removed from `outputs` as they are uploaded, so each encoded image is released as soon as it is stored.
+
+    Parameters:
+        outputs (list): `(s3_key, data, metadata)` tuples as returned by `render_task`.
+    """
+    outputs.reverse()
+    while outputs:
+        s3_key, data, metadata = outputs.pop()
+        upload_image_bytes(data, s3_key, metadata)
+        if metadata and "input-fingerprint" in metadata:
+            record_fingerprint([s3_key], metadata["input-fingerprint"])
+
+
+def _init_render_worker(inventory, fingerprint_store, output_settings):
+    """
+    Give a render worker process the parent's asset inventory, fingerprint store and output settings.
+
+    Workers are spawned rather than forked, so these arrive pickled: storage backends rebuild their boto3 clients on unpickling instead of sharing the parent's connection pools.
+    """
+    image_utils.use_asset_inventory(inventory)
+    image_utils.apply_output_settings(output_settings)
+    asset_fingerprints.use_fingerprint_store(fingerprint_store)
+
+
+@dataclass
+class AssetTask:
+    """
+    One unit of asset generation in the task graph.
+
+    Attributes:
+        task_id (str): Unique identifier, e.g. "qr:anfieldlitter".
+        func (callable): Generator function; must be a module-level function for the process mode.
+        args (tuple): Positional arguments for `func`.
+        deps (list[str]): Ids of tasks whose outputs must be uploaded before this task starts.
+        memory_bytes (int): Estimated peak memory while the task renders (decoded images, thumbnail levels and encoded renditions); 0 uses `default_task_bytes`.
+    """
+
+    task_id: str
+    func: Callable
+    args: tuple = ()
+    deps: List[str] = field(default_factory=list)
+    memory_bytes: int = 0
+
+
+def run_task_graph(
+    tasks,
+    desc,
+    use_processes=False,
+    render_workers=None,
+    upload_workers=None,
+    max_pending=None,
+    max_bytes=None,
+):
+    """
+    Run asset tasks as soon as their dependencies have finished, on one shared pool.
+
+    Instead of running stages behind hard barriers, every task whose dependencies are complete is eligible to run, so total runtime follows the critical path rather than the sum of the slowest task in each stage. A task is complete once its images are uploaded. If a task fails, the tasks depending on it are skipped and reported.
+
+    In thread mode each task renders and uploads on a thread pool. In process mode rendering and encoding run in a process pool sized to the CPU count (rendering is CPU bound and limited by the GIL on threads) and the returned encoded images are uploaded by a separate I/O thread pool. Render processes are started with "spawn", so they never inherit the parent's threads, boto3 clients or connection pools.
+
+    Memory is bounded in bytes rather than tasks: a task only starts while its estimated render memory fits in `max_bytes` alongside everything else in flight (a task is always started when nothing else is running, so an oversized one cannot stall the run). Ready tasks that fit may start ahead of an older one that does not, until that one has been passed over `max_pending` times; then it keeps its place and starts as soon as there is room. In process mode, once a task's images are encoded its reservation shrinks to their encoded size until they are uploaded, so slow uploads hold back new renders instead of letting encoded images pile up. At most `max_pending` tasks are in flight as well.
+
+    Parameters:
+        tasks (list[AssetTask]): Tasks to run; dependencies on ids outside this list are ignored.
+        desc (str): Progress bar description.
+        use_processes (bool): If True, use the process-pool render / thread-pool upload mode.
+        render_workers (int, optional): Number of render processes. Defaults to the CPU count.
+        upload_workers (int, optional): Number of I/O threads. Defaults to `max_io_workers` in thread mode and the S3 controller's maximum limit in process mode.
+        max_pending (int, optional): Maximum tasks in flight. Defaults to the I/O threads in thread mode and twice the render workers in process mode.
+        max_bytes (int, optional): Memory budget for tasks in flight. Defaults to `max_inflight_bytes`.
+
+    Returns:
+        dict: Lists of task ids under the keys "done", "failed" and "skipped".
+    """
+    render_workers = render_workers or os.cpu_count() or 1
+    s3_controller = controllers["s3"]
+    upload_workers = upload_workers or (
+        s3_controller.limiter.maximum if use_processes else max_io_workers
+    )
+    if max_pending is None:
+        max_pending = render_workers * 2 if use_processes else upload_workers
+    max_bytes = max_bytes or max_inflight_bytes
+
+    by_id = {task.task_id: task for task in tasks}
+    waiting_on = {
+        task.task_id: {dep for dep in task.deps if dep in by_id} for task in tasks
+    }
+    dependents = {task_id: [] for task_id in by_id}
+    for task_id, deps in waiting_on.items():
+        for dep in deps:
+            dependents[dep].append(task_id)
+
+    ready = deque(task.task_id for task in tasks if not waiting_on[task.task_id])
+    results = {"done": [], "failed": [], "skipped": []}
+    running = {}
+    reserved = 0
+    head_skips = 0
+
+    with ExitStack() as stack:
+        io_pool = stack.enter_context(
+            concurrent.futures.ThreadPoolExecutor(max_workers=upload_workers)
+        )
+        render_pool = None
+        if use_processes:
+            render_pool = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=render_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_render_worker,
+                    initargs=(
+                        image_utils.asset_inventory,
+                        asset_fingerprints.fingerprint_store,
+                        image_utils.output_settings(),
+                    ),
+                )
+            )
+        progress = stack.enter_context(tqdm(total=len(tasks), desc=desc))
+
+        def finish(task_id, outcome):
+            results[outcome].append(task_id)
+            progress.set_postfix_str(
+                f"{task_id} (s3 limit {s3_controller.limiter.limit}, "
+                f"{s3_controller.throttles} throttled)"
+            )
+            progress.update(1)
+            for dependent in dependents[task_id]:
+                if outcome == "done":
+                    waiting_on[dependent].discard(task_id)
+                    if not waiting_on[dependent]:
+                        ready.append(dependent)
+                elif dependent not in results["skipped"]:
+                    print(
+                        f"Skipping {dependent}: dependency {task_id} did not complete"
+                    )
+                    finish(dependent, "skipped")
+
+        while True:
+            # Start ready tasks while there is room for more in flight: the first that
+            # fits the remaining budget, so small tasks are not held up behind a large
+            # one, unless the oldest task has already been passed over `max_pending`
+            # times, in which case it waits for room and nothing overtakes it
+            while ready and len(running) < max_pending:
+                chosen = None
+                for index, task_id in enumerate(ready):
+                    if index and head_skips >= max_pending:
+                        break
+                    task_bytes = by_id[task_id].memory_bytes or default_task_bytes
+                    if not running or reserved + task_bytes <= max_bytes:
+                        chosen = index
+                        break
+                if chosen is None:
+                    break
+                task = by_id[ready[chosen]]
+                del ready[chosen]
+                head_skips = head_skips + 1 if chosen else 0
+                reserved += task_bytes
+                if render_pool is not None:
+                    future = render_pool.submit(render_task, task.func, task.args)
+                    running[future] = (task.task_id, "render", task_bytes)
+                else:
+                    future = io_pool.submit(task.func, *task.args)
+                    running[future] = (task.task_id, "run", task_bytes)
+
+            if not running:
+                break
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                task_id, stage, task_bytes = running.pop(future)
+                reserved -= task_bytes
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error in {stage} of {task_id}: {e}")
+                    finish(task_id, "failed")
+                    continue
+
+                if stage == "render":
+                    # Hand the encoded images over to the upload threads, holding
+                    # their encoded size against the budget until they are stored
+                    encoded_bytes = sum(len(data) for _, data, _ in result)
+                    reserved += encoded_bytes
+                    running[io_pool.submit(upload_outputs, result)] = (
+                        task_id,
+                        "upload",
+                        encoded_bytes,
+                    )
+                else:
+                    finish(task_id, "done")
+
+    unresolved = [
+        task_id
+        for task_id in by_id
+        if not any(task_id in ids for ids in results.values())
+    ]
+    if unresolved:
+        print(f"Tasks not run due to circular dependencies: {', '.join(unresolved)}")
+        results["skipped"].extend(unresolved)
+
+    return results
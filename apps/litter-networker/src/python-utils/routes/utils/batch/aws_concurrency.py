@@ -0,0 +1,289 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import random
+import threading
+import time
+
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+# Error codes meaning "slow down": they shrink the concurrency limit before retrying
+THROTTLE_CODES = {
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "RequestThrottled",
+}
+
+# Transient server-side errors that are retried without shrinking the limit
+TRANSIENT_CODES = {
+    "InternalError",
+    "ServiceUnavailable",
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "500",
+    "502",
+    "503",
+    "504",
+}
+
+# Network failures raised by botocore before a response arrives (e.g. EndpointConnectionError,
+# ConnectionClosedError, ReadTimeoutError): retried without shrinking the limit
+NETWORK_ERRORS = (ConnectionError, HTTPClientError)
+
+# botocore client settings for calls made through a controller: the controller does the
+# retrying (of throttling, transient and network errors), so throttling reaches it (and
+# shrinks the limit) instead of being absorbed
+CLIENT_CONFIG = Config(retries={"total_max_attempts": 1, "mode": "standard"})
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate at which calls start.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Parameters:
+            rate (float): Tokens added per second.
+            burst (int): Bucket capacity, i.e. how many calls may start back to back.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, waiting until one is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted with additive-increase / multiplicative-decrease (AIMD).
+
+    Every successful call raises the limit by `increase / limit` (about `increase` per round of calls), and a throttled call multiplies it by `decrease`. Decreases are applied at most once per `cooldown` seconds, so a burst of throttles from calls that were already in flight counts as one signal.
+    """
+
+    def __init__(
+        self, initial, minimum=1, maximum=64, increase=1.0, decrease=0.5, cooldown=1.0
+    ):
+        """
+        Parameters:
+            initial (int): Starting limit.
+            minimum (int): Lowest the limit may fall to.
+            maximum (int): Highest the limit may rise to.
+            increase (float): Additive increase per round of successful calls.
+            decrease (float): Multiplier applied on throttling.
+            cooldown (float): Minimum seconds between decreases.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """
+        The current whole-number concurrency limit.
+        """
+        return max(self.minimum, int(self._limit))
+
+    @property
+    def in_flight(self):
+        """
+        The number of calls currently holding a slot.
+        """
+        return self._in_flight
+
+    def acquire(self):
+        """
+        Wait for a free slot under the current limit and take it.
+        """
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, throttled=False):
+        """
+        Give a slot back and adjust the limit.
+
+        Parameters:
+            throttled (bool): Whether the call was throttled by the service.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self._limit = min(
+                    self.maximum, self._limit + self.increase / self._limit
+                )
+            self._condition.notify_all()
+
+
+class ServiceController:
+    """
+    Shared limits for one AWS service: a token bucket on call starts, an adaptive concurrency limit, and jittered exponential-backoff retries.
+    """
+
+    def __init__(
+        self,
+        name,
+        rate,
+        burst,
+        initial,
+        maximum,
+        max_attempts=8,
+        base_delay=0.1,
+        max_delay=10.0,
+    ):
+        """
+        Parameters:
+            name (str): Service name used in reports, e.g. "s3".
+            rate (float): Sustained calls started per second.
+            burst (int): Calls that may start back to back.
+            initial (int): Starting concurrency limit.
+            maximum (int): Highest concurrency limit.
+            max_attempts (int): Attempts per call before giving up.
+            base_delay (float): Backoff for the first retry, in seconds.
+            max_delay (float): Longest backoff between attempts, in seconds.
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(initial, maximum=maximum)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call an AWS API function within the service's limits, retrying throttled, transient and network failures.
+
+        Parameters:
+            func (callable): The boto3 call, e.g. `client.put_object`.
+            *args, **kwargs: Arguments for `func`.
+
+        Returns:
+            The result of `func`.
+
+        Raises:
+            ClientError: Non-retryable errors, or the last error once `max_attempts` is reached.
+            BotoCoreError: The last network error (see `NETWORK_ERRORS`) once `max_attempts` is reached.
+        """
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            self.limiter.acquire()
+            self._count("calls")
+            throttled = False
+            try:
+                return func(*args, **kwargs)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code", "")
+                throttled = code in THROTTLE_CODES
+                if throttled:
+                    self._count("throttles")
+                if (
+                    not throttled and code not in TRANSIENT_CODES
+                ) or attempt + 1 == self.max_attempts:
+                    raise
+            except NETWORK_ERRORS:
+                if attempt + 1 == self.max_attempts:
+                    raise
+            finally:
+                self.limiter.release(throttled)
+
+            # Full jitter: sleep a random time up to the exponential backoff
+            self._count("retries")
+            time.sleep(
+                random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+            )
+
+    def stats(self):
+        """
+        Return the current limit, calls in flight and call / retry / throttle counts.
+        """
+        return {
+            "limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttles": self.throttles,
+        }
+
+
+# One controller per service, shared by every module in the process
+controllers = {
+    "s3": ServiceController("s3", rate=300, burst=100, initial=16, maximum=64),
+    "dynamodb": ServiceController(
+        "dynamodb", rate=100, burst=50, initial=8, maximum=32
+    ),
+}
+
+
+def throttled_call(service, func, *args, **kwargs):
+    """
+    Call an AWS API function through the shared controller of a service (see `ServiceController.call`).
+
+    Parameters:
+        service (str): Key in `controllers`, e.g. "s3" or "dynamodb".
+        func (callable): The boto3 call.
+        *args, **kwargs: Arguments for `func`.
+
+    Returns:
+        The result of `func`.
+    """
+    return controllers[service].call(func, *args, **kwargs)
+
+
+def controller_stats():
+    """
+    Return `ServiceController.stats()` for every service.
+    """
+    return {name: controller.stats() for name, controller in controllers.items()}
+
+
+def format_controller_stats():
+    """
+    Return a one-line summary of the controller stats, e.g. for the end of a batch run.
+    """
+    return "; ".join(
+        f"{name}: limit {stats['limit']}, {stats['calls']} calls, "
+        f"{stats['retries']} retries, {stats['throttles']} throttled"
+        for name, stats in controller_stats().items()
+    )
@@ -0,0 +1,211 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import heapq
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+
+# CloudFront distribution serving cdn.litternetworks.org (the lnweb-public bucket)
+CDN_DISTRIBUTION_ID = "EWXIG6ZADYHMA"
+
+# CloudFront allows at most 15 wildcard paths in progress at once, and every path
+# (wildcard or not) counts towards the monthly free allowance, so keep requests small
+MAX_INVALIDATION_PATHS = 15
+
+# Key segments, each starting at a "/", "-" or "." separator; wildcards go between segments
+_SEGMENT_PATTERN = re.compile(r"[/.-][^/.-]*|[^/.-]+")
+
+
+def _build_trie(paths):
+    """
+    Build a trie of paths split into segments, recording how many paths sit under each node.
+    """
+    root = {"children": {}, "end": False, "count": 0}
+    for path in paths:
+        node = root
+        node["count"] += 1
+        for segment in _SEGMENT_PATTERN.findall(path):
+            node = node["children"].setdefault(
+                segment, {"children": {}, "end": False, "count": 0}
+            )
+            node["count"] += 1
+        node["end"] = True
+    return root
+
+
+def _descend(prefix, node):
+    """
+    Follow single-child chains, which can be expanded without adding patterns.
+    """
+    while len(node["children"]) == 1 and not node["end"]:
+        segment, node = next(iter(node["children"].items()))
+        prefix += segment
+    return prefix, node
+
+
+def collapse_paths(keys, max_paths=MAX_INVALIDATION_PATHS):
+    """
+    Collapse S3 keys into at most `max_paths` CloudFront invalidation paths.
+
+    Keys are arranged in a trie of path segments (split before "/", "-" and "."). Starting from a single wildcard covering every key, the widest wildcard is repeatedly replaced by its children while the total stays within `max_paths`, so the result is the most specific set of patterns that fits. Wildcards may cover a few unchanged objects; that only costs cache misses.
+
+    Parameters:
+        keys (iterable[str]): S3 keys (without a leading "/").
+        max_paths (int): Largest number of paths to return.
+
+    Returns:
+        list[str]: Sorted invalidation paths, each starting with "/"; exact paths for single keys, "prefix*" for groups.
+    """
+    paths = sorted({"/" + key.lstrip("/") for key in keys})
+    if len(paths) <= max_paths:
+        return paths
+
+    # Heap of (-count, prefix, node) for wildcards that may still be expanded
+    start_prefix, start_node = _descend("", _build_trie(paths))
+    patterns = {start_prefix: start_node}
+    heap = [(-start_node["count"], start_prefix, start_node)]
+
+    while heap:
+        _, prefix, node = heapq.heappop(heap)
+        expansion = len(node["children"]) + (1 if node["end"] else 0)
+        if len(patterns) - 1 + expansion > max_paths:
+            continue
+
+        del patterns[prefix]
+        if node["end"]:
+            patterns[prefix] = {"children": {}, "end": True, "count": 1}
+        for segment, child in node["children"].items():
+            child_prefix, child = _descend(prefix + segment, child)
+            patterns[child_prefix] = child
+            if child["children"]:
+                heapq.heappush(heap, (-child["count"], child_prefix, child))
+
+    return sorted(
+        prefix if not node["children"] else prefix + "*"
+        for prefix, node in patterns.items()
+    )
+
+
+class InvalidationCollector:
+    """
+    Collects the S3 keys overwritten during a run and invalidates them on the CDN in one request.
+
+    Register `add` as the upload listener (see `image_utils.use_upload_listener`), then call `submit` once the run is complete and `watch` to follow the invalidation in the background.
+    """
+
+    def __init__(
+        self, distribution_id=CDN_DISTRIBUTION_ID, client=None, max_paths=None
+    ):
+        """
+        Parameters:
+            distribution_id (str): CloudFront distribution to invalidate.
+            client: boto3 CloudFront client; created on first use when omitted.
+            max_paths (int | None): Largest number of paths per request; defaults to `MAX_INVALIDATION_PATHS`.
+        """
+        self.distribution_id = distribution_id
+        self.client = client
+        self.max_paths = max_paths or MAX_INVALIDATION_PATHS
+        self.invalidation_id = None
+        self.status = None
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    def add(self, s3_key):
+        """
+        Record a key whose object changed.
+        """
+        with self._lock:
+            self._keys.add(s3_key)
+
+    def paths(self):
+        """
+        Return the collapsed invalidation paths for the keys recorded so far.
+        """
+        with self._lock:
+            keys = list(self._keys)
+        return collapse_paths(keys, self.max_paths)
+
+    def submit(self):
+        """
+        Submit a single invalidation covering every recorded key.
+
+        Returns:
+            str | None: The invalidation id, or `None` if nothing changed or the request failed.
+        """
+        paths = self.paths()
+        if not paths:
+            print("CDN: no invalidation required")
+            return None
+
+        if self.client is None:
+            self.client = boto3.client("cloudfront")
+
+        print(
+            f"CDN: invalidating {len(paths)} paths for {len(self._keys)} changed objects"
+        )
+        try:
+            response = self.client.create_invalidation(
+                DistributionId=self.distribution_id,
+                InvalidationBatch={
+                    "Paths": {"Quantity": len(paths), "Items": paths},
+                    "CallerReference": f"network-assets-{datetime.now(timezone.utc).timestamp()}",
+                },
+            )
+        except ClientError as e:
+            print(f"Error: CDN invalidation failed: {e}")
+            return None
+
+        self.invalidation_id = response["Invalidation"]["Id"]
+        self.status = response["Invalidation"]["Status"]
+        return self.invalidation_id
+
+    def poll(self):
+        """
+        Fetch the current status of the submitted invalidation without waiting for it.
+
+        Returns:
+            str | None: "InProgress", "Completed", or `None` if nothing was submitted or the status could not be fetched.
+        """
+        if self.invalidation_id is None:
+            return None
+        try:
+            response = self.client.get_invalidation(
+                DistributionId=self.distribution_id, Id=self.invalidation_id
+            )
+        except ClientError as e:
+            print(f"Warning: Cannot fetch CDN invalidation status: {e}")
+            return None
+        self.status = response["Invalidation"]["Status"]
+        return self.status
+
+    def watch(self, interval=20, timeout=900):
+        """
+        Poll the submitted invalidation on a daemon thread, reporting when it completes, so the caller can carry on.
+
+        Parameters:
+            interval (float): Seconds between polls.
+            timeout (float): Seconds after which to stop polling.
+
+        Returns:
+            threading.Thread | None: The polling thread, or `None` if nothing was submitted.
+        """
+        if self.invalidation_id is None:
+            return None
+
+        def run():
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                if self.poll() == "Completed":
+                    print(f"CDN: invalidation {self.invalidation_id} completed")
+                    return
+                time.sleep(interval)
+            print(f"CDN: invalidation {self.invalidation_id} still {self.status}")
+
+        thread = threading.Thread(target=run, name="cdn-invalidation", daemon=True)
+        thread.start()
+        return thread
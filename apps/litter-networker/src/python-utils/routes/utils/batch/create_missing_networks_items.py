@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+from dataclasses import replace
 
 os.environ.setdefault("AWS_PROFILE", "ln")
 os.environ.setdefault("AWS_REGION", "eu-west-2")
@@ -11,21 +12,67 @@ from routes.utils.info.network_info import get_network_info, get_all_network_ids
 from routes.utils.maps.update_proximities import update_proximities
 from routes.utils.images.flyer_generate import generate_flyer
 from routes.utils.images.qr_generate import generate_qr
-from routes.utils.images.logo_generate import generate_logo, ImageStyle
+from routes.utils.images.logo_generate import generate_logo_set, ImageStyle
+from routes.utils.images.favicons_generate import generate_favicons
+from routes.utils.images.asset_inventory import build_asset_inventory
+from routes.utils.images.asset_fingerprints import build_fingerprint_store
+from routes.utils.images.asset_manifest import publish_manifest
+from routes.utils.images.encoding import ENCODER_POLICIES
+from routes.utils.images.storage import build_storage, LocalStorage
+from routes.utils.images.image_utils import (
+    use_storage,
+    use_encoder_policy,
+    use_companion_formats,
+    use_skip_unchanged,
+    use_upload_listener,
+    reset_upload_counts,
+)
+from routes.utils.batch.asset_pipeline import AssetTask, run_task_graph
+from routes.utils.batch.cdn_invalidation import InvalidationCollector
+from routes.utils.batch.aws_concurrency import format_controller_stats
 
-from tqdm import tqdm
-import concurrent.futures
+# Measured peak render memory per task (with WebP and AVIF companions, whose encoders
+# dominate), used to bound how many tasks are in flight at once
+TASK_MEMORY_BYTES = {
+    "qr": 16 * 1024 * 1024,
+    "logo": 480 * 1024 * 1024,
+    "flyer": 128 * 1024 * 1024,
+    "favicons": 32 * 1024 * 1024,
+}
 
 
-def create_missing_networks_items(specific_network="", force_generate=False):
+def create_missing_networks_items(
+    specific_network="",
+    force_generate=False,
+    inventory_cache=None,
+    use_processes=False,
+    png_policy="optimized",
+    report_sizes=False,
+    companions=("webp", "avif"),
+    companion_quality=None,
+    skip_unchanged=True,
+    invalidate_cdn=True,
+    storage_location=None,
+    max_inflight_bytes=None,
+):
     """
     Generate any missing QR codes, flyer images, and logo images for the given network(s), then update global proximity mappings.
 
-    When a specific network uniqueId is provided, only that network and a global "all" group are processed; otherwise all networks and the "all" group are processed. After ensuring assets exist (or are regenerated when requested), proximity information is updated globally.
+    When a specific network uniqueId is provided, only that network and a global "all" group are processed; otherwise all networks, the "all" group and the site icons are processed. After ensuring assets exist (or are regenerated when requested), the asset manifest is published and proximity information is updated globally.
 
     Args:
         specific_network (str, optional): UniqueId of a single network to process. If empty, all networks are processed. Defaults to "".
-        force_generate (bool, optional): If True, existing assets will be regenerated; if False, existing assets will be left intact when possible. Defaults to False.
+        force_generate (bool, optional): If True, existing assets will be regenerated; if False, only missing assets and assets whose input fingerprint changed are regenerated. Defaults to False.
+        inventory_cache (str, optional): Path of a JSON file persisting the S3 asset listing between runs, so it can be refreshed incrementally. Only new objects are picked up from it, so objects changed or deleted outside this tool are missed (and their cached ETags are not used to skip uploads); delete the file to list in full again. Defaults to None (list in full every run).
+        use_processes (bool, optional): If True, render and encode in a process pool sized to the CPU count and upload from a separate thread pool; otherwise render and upload on a shared thread pool. Defaults to False.
+        png_policy (str, optional): Name of the PNG encoder policy in `ENCODER_POLICIES` ("default" keeps Pillow's settings). Defaults to "optimized".
+        report_sizes (bool, optional): If True, print each asset's default-encoded and policy-encoded size. Defaults to False.
+        companions (iterable[str], optional): Companion formats written next to every PNG under sibling keys (unsupported formats are skipped). Defaults to ("webp", "avif").
+        companion_quality (dict, optional): Encoder quality per companion format. Defaults to each format's default.
+        skip_unchanged (bool, optional): If True, skip uploads whose bytes match the ETag listed in the asset inventory this run, so forced regeneration only rewrites what actually changed. Pass False (`--upload-unchanged`) to rewrite every rendered asset regardless, e.g. to repair objects altered outside this tool. Defaults to True.
+        invalidate_cdn (bool, optional): If True, invalidate the overwritten assets on the CDN in one batched request after generation. Defaults to True.
+        storage_location (str, optional): Where to write the assets: "s3://<bucket>" or a local directory. Rendering into a local directory skips the CDN invalidation and the proximity update. Defaults to None (the configured storage, normally the lnweb-public bucket).
+        max_inflight_bytes (int, optional): Memory budget for tasks being rendered plus encoded images waiting for upload. Defaults to None (`asset_pipeline.max_inflight_bytes`).
     """
 
     if specific_network:
@@ -35,43 +82,33 @@ def create_missing_networks_items(specific_network="", force_generate=False):
 
     network_ids.append("all")
 
-    # Define the network ID to force-generate for
-    force_for_network_id = "norrisgreenlitternetwork" if force_generate else False
+    # Choose where assets are read from and written to
+    publishing = True
+    if storage_location:
+        storage = build_storage(storage_location)
+        use_storage(storage)
+        publishing = not isinstance(storage, LocalStorage)
+    invalidate_cdn = invalidate_cdn and publishing
 
-    # Define the number of worker threads
-    max_workers = 10  # Adjust based on your system's capabilities
+    # List existing assets once up front, so existence checks need no HEAD requests
+    inventory = build_asset_inventory(inventory_cache)
 
-    # Ensure QR Codes (needed for flyer images)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        qr_tasks = []
-        for network_id in network_ids:
-            qr_tasks.append(
-                executor.submit(generate_qr, network_id, True, force_generate)
-            )
-            qr_tasks.append(
-                executor.submit(generate_qr, network_id, False, force_generate)
-            )
+    # Load input fingerprints, so assets whose network details changed get regenerated
+    fingerprints = build_fingerprint_store()
+
+    # Choose how generated PNGs are encoded
+    use_encoder_policy(replace(ENCODER_POLICIES[png_policy], report=report_sizes))
+    use_companion_formats(companions, companion_quality)
+    use_skip_unchanged(skip_unchanged)
+    reset_upload_counts()
 
-        for _ in tqdm(
-            concurrent.futures.as_completed(qr_tasks),
-            total=len(qr_tasks),
-            desc="Ensuring QR Codes (needed for flyer images)",
-        ):
-            pass  # The actual generation is handled by generate_qr
-
-    # Ensure Flyer Images
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        flyer_tasks = [
-            executor.submit(generate_flyer, network_id, force_generate)
-            for network_id in network_ids
-        ]
-
-        for _ in tqdm(
-            concurrent.futures.as_completed(flyer_tasks),
-            total=len(flyer_tasks),
-            desc="Ensuring Flyer Images",
-        ):
-            pass
+    # Collect overwritten keys, so the CDN copies can be invalidated in one request
+    invalidations = InvalidationCollector()
+    if invalidate_cdn:
+        use_upload_listener(invalidations.add)
+
+    # Define the network ID to force-generate for
+    force_for_network_id = "norrisgreenlitternetwork" if force_generate else False
 
     # Define a list of ImageStyles to process
     image_styles = [
@@ -85,23 +122,87 @@ def create_missing_networks_items(specific_network="", force_generate=False):
         ImageStyle.WHITE_ALPHA,
     ]
 
-    # Ensure Logo Images for each ImageStyle
-    for style in tqdm(image_styles, desc="Ensuring Logo Images"):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            logo_tasks = [
-                executor.submit(generate_logo, network_id, style, force_generate)
-                for network_id in network_ids
-            ]
-
-            for _ in tqdm(
-                concurrent.futures.as_completed(logo_tasks),
-                total=len(logo_tasks),
-                desc=f"Ensuring {style.name} Logo Images",
-            ):
-                pass
+    # Ensure QR Codes, Flyer Images and Logo Images (all ImageStyles of a network in one pass).
+    # Flyers embed the network's QR code, so each flyer waits for that network's QR only.
+    tasks = []
+    for network_id in network_ids:
+        tasks.append(
+            AssetTask(
+                f"qr:{network_id}",
+                generate_qr,
+                (network_id, False, force_generate),
+                memory_bytes=TASK_MEMORY_BYTES["qr"],
+            )
+        )
+        tasks.append(
+            AssetTask(
+                f"qr-nobg:{network_id}",
+                generate_qr,
+                (network_id, True, force_generate),
+                memory_bytes=TASK_MEMORY_BYTES["qr"],
+            )
+        )
+        tasks.append(
+            AssetTask(
+                f"logo:{network_id}",
+                generate_logo_set,
+                (network_id, image_styles, force_generate),
+                memory_bytes=TASK_MEMORY_BYTES["logo"],
+            )
+        )
+        tasks.append(
+            AssetTask(
+                f"flyer:{network_id}",
+                generate_flyer,
+                (network_id, force_generate),
+                deps=[f"qr:{network_id}"],
+                memory_bytes=TASK_MEMORY_BYTES["flyer"],
+            )
+        )
+    if not specific_network:
+        tasks.append(
+            AssetTask(
+                "favicons",
+                generate_favicons,
+                (force_generate,),
+                memory_bytes=TASK_MEMORY_BYTES["favicons"],
+            )
+        )
+    run_task_graph(
+        tasks,
+        "Ensuring Network Images",
+        use_processes,
+        max_bytes=max_inflight_bytes,
+    )
+
+    upload_counts = reset_upload_counts()
+    print(
+        f"Uploads: {upload_counts['uploaded']} written, "
+        f"{upload_counts['unchanged']} skipped as unchanged"
+    )
+    print(f"AWS calls: {format_controller_stats()}")
+
+    # Submit the invalidation now and follow it in the background while the run finishes
+    use_upload_listener(None)
+    if invalidate_cdn:
+        invalidations.submit()
+        invalidations.watch()
+
+    # Publish the index of every network's resources, including this run's uploads
+    manifest = publish_manifest(inventory, network_ids, merge=bool(specific_network))
+    print(f"Manifest: revision {manifest['revision']}")
+
+    inventory.save()
+    fingerprints.save()
 
     # Update proximity info - uses mapping to determine closest N networks to each, thus is always done globally:
-    update_proximities()
+    if publishing:
+        update_proximities()
+
+    if invalidations.invalidation_id is not None:
+        print(
+            f"CDN: invalidation {invalidations.invalidation_id} is {invalidations.status}"
+        )
 
 
 def main():
@@ -117,5 +218,78 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate network assets")
     parser.add_argument("--network", "-n", help="Specific network uniqueId to process")
     parser.add_argument("--force", "-f", action="store_true", help="Force regeneration")
+    parser.add_argument(
+        "--inventory-cache",
+        help=(
+            "JSON file to persist the S3 asset listing between runs; only new objects "
+            "are listed, so delete it after changing or deleting assets by hand"
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Render in a process pool and upload from a thread pool",
+    )
+    parser.add_argument(
+        "--png-policy",
+        choices=sorted(ENCODER_POLICIES),
+        default="optimized",
+        help="PNG encoder policy for generated images",
+    )
+    parser.add_argument(
+        "--report-sizes",
+        action="store_true",
+        help="Print default vs. policy-encoded bytes for each asset",
+    )
+    parser.add_argument(
+        "--companions",
+        default="webp,avif",
+        help="Comma-separated companion formats to write next to each PNG ('' for none)",
+    )
+    parser.add_argument(
+        "--companion-quality",
+        type=int,
+        help="Encoder quality (0-100) for all companion formats",
+    )
+    parser.add_argument(
+        "--upload-unchanged",
+        action="store_true",
+        help=(
+            "Upload every rendered image, even if identical to the stored object "
+            "(use with --force to repair assets changed outside this tool)"
+        ),
+    )
+    parser.add_argument(
+        "--skip-invalidation",
+        action="store_true",
+        help="Do not invalidate overwritten assets on the CDN",
+    )
+    parser.add_argument(
+        "--storage",
+        help="Write assets to 's3://<bucket>' or a local directory instead of the default bucket",
+    )
+    parser.add_argument(
+        "--max-inflight-mb",
+        type=int,
+        help="Memory budget in MiB for tasks being rendered and images awaiting upload",
+    )
     args = parser.parse_args()
-    create_missing_networks_items(args.network or "", args.force)
+    companions = [name for name in args.companions.split(",") if name]
+    create_missing_networks_items(
+        args.network or "",
+        args.force,
+        args.inventory_cache,
+        args.processes,
+        args.png_policy,
+        args.report_sizes,
+        companions,
+        (
+            {name: args.companion_quality for name in companions}
+            if args.companion_quality is not None
+            else None
+        ),
+        not args.upload_unchanged,
+        not args.skip_invalidation,
+        args.storage,
+        args.max_inflight_mb * 1024 * 1024 if args.max_inflight_mb else None,
+    )
@@ -0,0 +1,196 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from io import BytesIO
+
+from routes.utils.images import image_utils
+from routes.utils.images.image_utils import image_exists_on_s3, companion_keys
+from routes.utils.images.storage import S3Storage
+
+# Manifest mapping each generated asset key to the fingerprint of its inputs
+FINGERPRINTS_KEY = "proc/images/resources/fingerprints.json"
+
+# Optional store consulted by `assets_are_current`; when unset only existence is checked
+fingerprint_store = None
+
+
+@lru_cache(maxsize=None)
+def file_digest(path):
+    """
+    Return the SHA-256 hex digest of a local file, cached per path for the life of the process.
+
+    Parameters:
+        path (str): Path of the file to hash.
+
+    Returns:
+        str | None: The hex digest, or `None` if the file cannot be read.
+    """
+    try:
+        with open(path, "rb") as handle:
+            return hashlib.sha256(handle.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def compute_fingerprint(renderer, version, fields, files=()):
+    """
+    Compute a stable fingerprint of everything that determines a generated asset.
+
+    Parameters:
+        renderer (str): Name of the generator (e.g. "flyer").
+        version (int): Renderer version; bump it whenever the rendering code changes its output.
+        fields (dict): Network fields and options that affect the output.
+        files (iterable[str]): Template images and fonts read by the renderer; their contents are hashed.
+
+    Returns:
+        str: A 32-character hexadecimal fingerprint.
+    """
+    payload = {
+        "renderer": renderer,
+        "version": version,
+        "fields": fields,
+        "files": {os.path.basename(path): file_digest(path) for path in files},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+class FingerprintStore:
+    """
+    Manifest of input fingerprints for generated assets, stored as one JSON object next to the assets.
+    """
+
+    def __init__(self, s3_key=FINGERPRINTS_KEY, bucket=None, client=None, storage=None):
+        """
+        Parameters:
+            s3_key (str): Key of the JSON manifest.
+            bucket (str | None): S3 bucket holding the manifest, instead of the configured storage.
+            client: boto3 S3 client for `bucket`; defaults to the client used by `image_utils`.
+            storage (S3Storage | LocalStorage | None): Backend holding the manifest; defaults to the storage used by `image_utils`.
+        """
+        if bucket or client:
+            storage = S3Storage(
+                bucket or image_utils.s3_bucket, client or image_utils.s3_client
+            )
+        self.s3_key = s3_key
+        self.storage = storage or image_utils.storage
+        self._fingerprints = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled; workers get their own
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, s3_key):
+        """
+        Return the recorded fingerprint of an asset, or `None` if it has none.
+        """
+        return self._fingerprints.get(s3_key)
+
+    def record(self, s3_key, fingerprint):
+        """
+        Record the fingerprint an asset was generated from.
+        """
+        with self._lock:
+            if self._fingerprints.get(s3_key) != fingerprint:
+                self._fingerprints[s3_key] = fingerprint
+                self._dirty = True
+
+    def load(self):
+        """
+        Load the manifest from storage; a missing manifest leaves the store empty.
+        """
+        body = self.storage.read(self.s3_key)
+        if body is None:
+            return
+
+        data = json.loads(body)
+        with self._lock:
+            self._fingerprints = data.get("assets", {})
+            self._dirty = False
+
+    def save(self):
+        """
+        Write the manifest back to storage if any fingerprint changed since it was loaded.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            body = json.dumps({"assets": self._fingerprints}, sort_keys=True)
+            self._dirty = False
+
+        self.storage.write(
+            self.s3_key,
+            BytesIO(body.encode("utf-8")),
+            "application/json",
+            cache_control="no-cache",
+        )
+
+
+def use_fingerprint_store(store):
+    """
+    Make the generators compare input fingerprints against a store (or `None` to only check existence).
+    """
+    global fingerprint_store
+    fingerprint_store = store
+
+
+def build_fingerprint_store():
+    """
+    Load the fingerprint manifest from storage and make the generators use it.
+
+    Returns:
+        FingerprintStore: The loaded store; call `save()` once the run is complete.
+    """
+    store = FingerprintStore()
+    store.load()
+    use_fingerprint_store(store)
+    return store
+
+
+def _with_companions(s3_keys):
+    """
+    Return the given PNG keys plus the keys of their active companion renditions.
+    """
+    return [key for s3_key in s3_keys for key in [s3_key, *companion_keys(s3_key)]]
+
+
+def assets_are_current(s3_keys, fingerprint):
+    """
+    Return whether every asset (and its companion renditions) exists and, when a fingerprint store is in use, was generated from the given inputs.
+
+    Parameters:
+        s3_keys (list[str]): Keys of the PNG assets produced together by one render.
+        fingerprint (str): Fingerprint of the current inputs.
+
+    Returns:
+        bool: `True` if the assets can be left as they are.
+    """
+    s3_keys = _with_companions(s3_keys)
+    if not all(image_exists_on_s3(s3_key) for s3_key in s3_keys):
+        return False
+    if fingerprint_store is None:
+        return True
+    return all(fingerprint_store.get(s3_key) == fingerprint for s3_key in s3_keys)
+
+
+def record_fingerprint(s3_keys, fingerprint):
+    """
+    Record the fingerprint of freshly generated assets (and their companion renditions) in the active store, if any.
+    """
+    if fingerprint_store is None:
+        return
+    for s3_key in _with_companions(s3_keys):
+        fingerprint_store.record(s3_key, fingerprint)
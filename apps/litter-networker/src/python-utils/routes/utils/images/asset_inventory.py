@@ -0,0 +1,203 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import threading
+
+from routes.utils.images import image_utils
+from routes.utils.images.storage import S3Storage
+
+# Prefixes holding the generated per-network resources and site icons
+RESOURCE_PREFIXES = [
+    "proc/images/resources/qr/",
+    "proc/images/resources/flyer/",
+    "proc/images/resources/logo/",
+    "proc/images/icons/",
+]
+
+
+class AssetInventory:
+    """
+    In-memory listing of the objects under a set of key prefixes in a storage backend (by default the S3 bucket).
+
+    Lists each prefix once (with `list_objects_v2` on S3) and then answers existence and metadata lookups locally, instead of issuing one `HeadObject` per asset. The listing can optionally be persisted to a JSON file and refreshed incrementally on the next run; entries loaded from that file are not confirmed by the incremental listing, so `is_current` reports them as possibly stale.
+    """
+
+    def __init__(
+        self, prefixes=None, bucket=None, client=None, cache_path=None, storage=None
+    ):
+        """
+        Parameters:
+            prefixes (list[str] | None): Key prefixes to list; defaults to `RESOURCE_PREFIXES`.
+            bucket (str | None): S3 bucket to list instead of the configured storage.
+            client: boto3 S3 client for `bucket`; defaults to the client used by `image_utils`.
+            cache_path (str | None): Optional JSON file used to persist the listing between runs.
+            storage (S3Storage | LocalStorage | None): Backend to list; defaults to the storage used by `image_utils`.
+        """
+        if bucket or client:
+            storage = S3Storage(
+                bucket or image_utils.s3_bucket, client or image_utils.s3_client
+            )
+        self.prefixes = list(prefixes or RESOURCE_PREFIXES)
+        self.storage = storage or image_utils.storage
+        self.bucket = self.storage.location
+        self.cache_path = cache_path
+        self._objects = {}
+        # Keys loaded from the persisted listing and not seen in storage since
+        self._unconfirmed = set()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled; workers get their own
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def covers(self, s3_key):
+        """
+        Return whether the key falls under one of the listed prefixes, i.e. whether the inventory can answer for it.
+        """
+        return any(s3_key.startswith(prefix) for prefix in self.prefixes)
+
+    def exists(self, s3_key):
+        """
+        Return `True` if the key was present in the listing (or recorded since).
+        """
+        return s3_key in self._objects
+
+    def is_current(self, s3_key):
+        """
+        Return `True` if the key's entry was listed or recorded during this run, rather than only loaded from the persisted listing (which may predate changes or deletions made outside this tool).
+        """
+        return s3_key in self._objects and s3_key not in self._unconfirmed
+
+    def get(self, s3_key):
+        """
+        Return the recorded metadata for a key.
+
+        Returns:
+            dict | None: A dict with `etag` and `size` entries (plus `width` and `height` for PNGs recorded during this run), or `None` if the key is unknown.
+        """
+        return self._objects.get(s3_key)
+
+    def keys(self, prefix=""):
+        """
+        Return the sorted list of known keys, optionally restricted to a prefix.
+        """
+        return sorted(key for key in self._objects if key.startswith(prefix))
+
+    def record(self, s3_key, etag=None, size=None, dimensions=None):
+        """
+        Record an object that was written during this run so later lookups see it without re-listing.
+
+        Parameters:
+            s3_key (str): Object key.
+            etag (str, optional): Content MD5 (the ETag of single-part uploads).
+            size (int, optional): Size in bytes.
+            dimensions (tuple, optional): Pixel `(width, height)` of an image, kept for the asset manifest.
+        """
+        entry = {"etag": etag, "size": size}
+        if dimensions:
+            entry["width"], entry["height"] = dimensions
+        with self._lock:
+            self._objects[s3_key] = entry
+            self._unconfirmed.discard(s3_key)
+
+    def refresh(self, incremental=False):
+        """
+        List every configured prefix and update the in-memory inventory.
+
+        A full refresh replaces what is known about each prefix. An incremental refresh keeps the existing entries and only lists keys sorting after the last known key of each prefix (via `StartAfter`), which picks up newly added assets cheaply but not changes to existing ones.
+
+        Parameters:
+            incremental (bool): If True, list only keys after the last known key of each prefix.
+
+        Returns:
+            int: The number of objects returned by the listing calls.
+        """
+        listed = 0
+        for prefix in self.prefixes:
+            start_after = None
+            if incremental:
+                known = self.keys(prefix)
+                start_after = known[-1] if known else None
+
+            objects = self.storage.list(prefix, start_after)
+            listed += len(objects)
+
+            with self._lock:
+                if not incremental:
+                    for key in [k for k in self._objects if k.startswith(prefix)]:
+                        del self._objects[key]
+                        self._unconfirmed.discard(key)
+                self._objects.update(objects)
+                self._unconfirmed.difference_update(objects)
+
+        return listed
+
+    def load(self):
+        """
+        Load a previously persisted listing from `cache_path`, if one exists for the same bucket (or directory).
+
+        Returns:
+            bool: `True` if a persisted listing was loaded.
+        """
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            print(f"Warning: Ignoring unreadable asset inventory {self.cache_path}")
+            return False
+
+        if data.get("bucket") != self.bucket:
+            return False
+
+        with self._lock:
+            self._objects = {
+                key: value
+                for key, value in data.get("objects", {}).items()
+                if self.covers(key)
+            }
+            self._unconfirmed = set(self._objects)
+        return True
+
+    def save(self):
+        """
+        Persist the current listing to `cache_path` (no-op when no path is configured).
+        """
+        if not self.cache_path:
+            return
+
+        with self._lock:
+            data = {"bucket": self.bucket, "objects": dict(self._objects)}
+
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(data, handle)
+        os.replace(tmp_path, self.cache_path)
+
+
+def build_asset_inventory(cache_path=None):
+    """
+    Create an inventory of the generated network resources and make `image_utils` use it for existence checks.
+
+    When `cache_path` points at a persisted listing it is loaded and refreshed incrementally; otherwise the prefixes are listed in full. An incremental refresh does not notice objects changed or deleted outside this tool, so such objects still count as existing; delete the cache file to list in full again.
+
+    Parameters:
+        cache_path (str | None): Optional JSON file used to persist the listing between runs.
+
+    Returns:
+        AssetInventory: The populated inventory.
+    """
+    inventory = AssetInventory(cache_path=cache_path)
+    inventory.refresh(incremental=inventory.load())
+    image_utils.use_asset_inventory(inventory)
+    return inventory
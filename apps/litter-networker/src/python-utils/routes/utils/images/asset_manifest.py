@@ -0,0 +1,226 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+
+from routes.utils.images import image_utils
+from routes.utils.images.encoding import PNG_HEADER_BYTES, png_dimensions
+from routes.utils.images.thumbnails import THUMBNAIL_LEVELS, level_size
+
+# Published index of every generated per-network resource
+MANIFEST_KEY = "proc/images/resources/manifest.json"
+
+# Bump whenever the manifest layout changes in a way consumers must know about
+MANIFEST_VERSION = 1
+
+# Per-network resource kinds listed in the manifest, with the prefix holding each
+MANIFEST_PREFIXES = {
+    "qr": "proc/images/resources/qr/",
+    "flyer": "proc/images/resources/flyer/",
+    "logo": "proc/images/resources/logo/",
+}
+
+# Pyramid level sizes by key suffix, and the order levels are listed in
+LEVEL_SIZES = dict(THUMBNAIL_LEVELS)
+LEVEL_ORDER = ["full"] + [suffix[1:] for suffix, _ in THUMBNAIL_LEVELS]
+
+# Worker threads for reading PNG headers of images with unknown dimensions
+max_header_workers = 16
+
+
+def parse_asset_key(s3_key, network_ids):
+    """
+    Split a resource key into the network, variant, pyramid level and format it holds.
+
+    For example "proc/images/resources/logo/logo-anfield-2line-w640.webp" gives ("anfield", "logo-2line", "w640", "webp"). When several network ids match, the longest wins.
+
+    Parameters:
+        s3_key (str): Key under one of `MANIFEST_PREFIXES`.
+        network_ids (set[str]): Known network ids.
+
+    Returns:
+        tuple | None: `(network, variant, level, format)`, or `None` if the key is not a per-network resource.
+    """
+    for kind, prefix in MANIFEST_PREFIXES.items():
+        if s3_key.startswith(prefix):
+            break
+    else:
+        return None
+
+    stem, extension = os.path.splitext(s3_key[len(prefix) :])
+    if not stem.startswith(f"{kind}-") or not extension:
+        return None
+    rest = stem[len(kind) + 1 :]
+
+    # Network ids may contain "-", so try every split point and keep the longest match
+    candidates = [rest] + [rest[:i] for i, c in enumerate(rest) if c == "-"]
+    network = max((c for c in candidates if c in network_ids), key=len, default=None)
+    if network is None:
+        return None
+
+    variant_rest = rest[len(network) :]
+    level = "full"
+    for suffix in LEVEL_SIZES:
+        if variant_rest.endswith(suffix):
+            variant_rest = variant_rest[: -len(suffix)]
+            level = suffix[1:]
+            break
+
+    return network, f"{kind}{variant_rest}", level, extension[1:].lower()
+
+
+def load_manifest(storage=None):
+    """
+    Return the published manifest, or `None` if there is none (or it cannot be parsed).
+    """
+    storage = storage or image_utils.storage
+    body = storage.read(MANIFEST_KEY)
+    if body is None:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        print(f"Warning: Ignoring unreadable asset manifest {MANIFEST_KEY}")
+        return None
+
+
+def _read_png_dimensions(storage, s3_key):
+    header = storage.read(s3_key, PNG_HEADER_BYTES)
+    return png_dimensions(header) if header else None
+
+
+def build_manifest(inventory, network_ids, previous=None, storage=None):
+    """
+    Build the manifest entries for the resources of the given networks from the asset inventory.
+
+    Content hash (the MD5 ETag) and byte size come from the inventory listing. Pixel dimensions are only needed for each variant's full-size PNG, as pyramid levels and companion formats follow from it; they are taken from the inventory (recorded when the PNG was uploaded this run), else from the previous manifest when the PNG is unchanged, else read from the first bytes of the stored PNG.
+
+    Parameters:
+        inventory (AssetInventory): Listing of the resource prefixes.
+        network_ids (iterable[str]): Networks to describe.
+        previous (dict, optional): The previously published manifest.
+        storage (optional): Backend to read PNG headers from; defaults to the storage used by `image_utils`.
+
+    Returns:
+        dict: Mapping of network id to variant name to a list of file entries (`key`, `level`, `format`, `bytes`, `hash`, `width`, `height`).
+    """
+    storage = storage or image_utils.storage
+    network_ids = set(network_ids)
+
+    files = {}
+    for prefix in MANIFEST_PREFIXES.values():
+        for s3_key in inventory.keys(prefix):
+            parsed = parse_asset_key(s3_key, network_ids)
+            if parsed is not None:
+                files[s3_key] = parsed
+
+    previous_files = {
+        entry["key"]: entry
+        for variants in ((previous or {}).get("networks") or {}).values()
+        for entries in variants.values()
+        for entry in entries
+    }
+
+    # Full-size dimensions per variant, from the full-size PNG
+    full_sizes = {}
+    to_read = {}
+    for s3_key, (network, variant, level, file_format) in files.items():
+        if level != "full" or file_format != "png":
+            continue
+        known = inventory.get(s3_key) or {}
+        earlier = previous_files.get(s3_key) or {}
+        if "width" in known:
+            full_sizes[(network, variant)] = (known["width"], known["height"])
+        elif earlier.get("hash") == known.get("etag") and earlier.get("width"):
+            full_sizes[(network, variant)] = (earlier["width"], earlier["height"])
+        else:
+            to_read[(network, variant)] = s3_key
+
+    if to_read:
+        with ThreadPoolExecutor(max_workers=max_header_workers) as pool:
+            headers = pool.map(
+                lambda s3_key: _read_png_dimensions(storage, s3_key),
+                to_read.values(),
+            )
+            for variant_id, size in zip(to_read, headers):
+                if size:
+                    full_sizes[variant_id] = size
+
+    networks = {}
+    for s3_key, (network, variant, level, file_format) in files.items():
+        known = inventory.get(s3_key) or {}
+        full_size = full_sizes.get((network, variant))
+        if full_size and level != "full":
+            full_size = level_size(full_size, LEVEL_SIZES[f"-{level}"])
+        networks.setdefault(network, {}).setdefault(variant, []).append(
+            {
+                "key": s3_key,
+                "level": level,
+                "format": file_format,
+                "bytes": known.get("size"),
+                "hash": known.get("etag"),
+                "width": full_size[0] if full_size else None,
+                "height": full_size[1] if full_size else None,
+            }
+        )
+
+    for variants in networks.values():
+        for entries in variants.values():
+            entries.sort(
+                key=lambda entry: (LEVEL_ORDER.index(entry["level"]), entry["format"])
+            )
+    return networks
+
+
+def publish_manifest(inventory, network_ids, merge=False, storage=None):
+    """
+    Write the versioned asset manifest to `MANIFEST_KEY`, so consumers can build URLs and cache-busting query strings without probing storage.
+
+    The manifest holds `version` (the layout version, `MANIFEST_VERSION`), `revision` (a hash of the listed files, changing whenever any of them changes), `generated` (UTC time of that revision) and `networks` (see `build_manifest`). Nothing is written when the revision is unchanged.
+
+    Parameters:
+        inventory (AssetInventory): Listing of the resource prefixes, including this run's uploads.
+        network_ids (iterable[str]): Networks to describe.
+        merge (bool): If True, keep the previously published entries of networks not in `network_ids` (for single-network runs).
+        storage (optional): Backend to publish to; defaults to the storage used by `image_utils`.
+
+    Returns:
+        dict: The published (or unchanged) manifest.
+    """
+    storage = storage or image_utils.storage
+    previous = load_manifest(storage)
+
+    networks = {}
+    if merge and previous:
+        networks.update(previous.get("networks") or {})
+    networks.update(build_manifest(inventory, network_ids, previous, storage))
+
+    revision = hashlib.md5(
+        json.dumps(networks, sort_keys=True).encode("utf-8"),
+        usedforsecurity=False,
+    ).hexdigest()
+    if (
+        previous
+        and previous.get("version") == MANIFEST_VERSION
+        and previous.get("revision") == revision
+    ):
+        return previous
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "revision": revision,
+        "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "networks": networks,
+    }
+    storage.write(
+        MANIFEST_KEY,
+        BytesIO(json.dumps(manifest, sort_keys=True).encode("utf-8")),
+        "application/json",
+        cache_control="no-cache",
+    )
+    return manifest
@@ -0,0 +1,232 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import struct
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageChops, features
+
+# Colours that can be stored exactly as a 1-bit image
+BLACK_AND_WHITE = {(0, 0, 0), (255, 255, 255)}
+
+
+@dataclass
+class EncoderPolicy:
+    """
+    Settings controlling how generated images are encoded as PNG.
+
+    Attributes:
+        reduce_mode (bool): Losslessly store images in the smallest mode that holds them exactly: 1-bit for black-and-white art, a palette for few-colour art, greyscale for grey art and RGB when fully opaque.
+        max_palette_colours (int): Largest number of distinct colours stored as a palette (0 disables palettes).
+        compress_level (int | None): zlib level 0-9, or None for Pillow's default.
+        optimize (bool): Let the PNG encoder search for the smallest output (slower).
+        strip_metadata (bool): Drop ICC profiles, text chunks and other ancillary metadata.
+        report (bool): Print the default-encoded and policy-encoded size of each saved asset.
+    """
+
+    reduce_mode: bool = False
+    max_palette_colours: int = 0
+    compress_level: Optional[int] = None
+    optimize: bool = False
+    strip_metadata: bool = False
+    report: bool = False
+
+
+# Named presets selectable from the command line
+ENCODER_POLICIES = {
+    "default": EncoderPolicy(),
+    "optimized": EncoderPolicy(
+        reduce_mode=True,
+        max_palette_colours=256,
+        compress_level=9,
+        optimize=True,
+        strip_metadata=True,
+    ),
+}
+
+
+def _is_lossless(original, reduced):
+    """
+    Return whether a mode-reduced image converts back to exactly the original pixels.
+    """
+    restored = reduced.convert(original.mode)
+    return ImageChops.difference(restored, original).getbbox() is None
+
+
+def reduce_image_mode(image, max_palette_colours=256):
+    """
+    Convert an image to the smallest mode that still represents it exactly.
+
+    Tries, in order: 1-bit for opaque black-and-white images (e.g. QR codes), a palette (with per-entry transparency) when there are at most `max_palette_colours` distinct colours, greyscale when all RGB bands are equal, and RGB when the alpha band is fully opaque. Every candidate is checked against the original, so the result is always lossless.
+
+    Parameters:
+        image (PIL.Image.Image): Image to reduce.
+        max_palette_colours (int): Largest number of distinct colours to store as a palette (0 disables palettes).
+
+    Returns:
+        PIL.Image.Image: The reduced image, or the original if no reduction applies.
+    """
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    opaque = image.mode == "RGB" or image.getchannel("A").getextrema() == (255, 255)
+    colours = image.getcolors(maxcolors=max(max_palette_colours, 2))
+
+    if colours is not None:
+        rgb_colours = {colour[:3] for _, colour in colours}
+        if opaque and rgb_colours <= BLACK_AND_WHITE:
+            return image.convert("1", dither=Image.Dither.NONE)
+
+        if max_palette_colours and len(colours) <= max_palette_colours:
+            if opaque:
+                candidate = image.convert("RGB").convert(
+                    "P", palette=Image.Palette.ADAPTIVE, colors=len(colours)
+                )
+            else:
+                candidate = image.quantize(
+                    colors=len(colours),
+                    method=Image.Quantize.FASTOCTREE,
+                    dither=Image.Dither.NONE,
+                )
+            if _is_lossless(image, candidate):
+                return candidate
+
+    r, g, b = image.split()[:3]
+    greyscale = (
+        ImageChops.difference(r, g).getbbox() is None
+        and ImageChops.difference(r, b).getbbox() is None
+    )
+
+    if opaque:
+        return r if greyscale else image.convert("RGB")
+    if greyscale:
+        return Image.merge("LA", (r, image.getchannel("A")))
+    return image
+
+
+def encode_png(image, policy=None):
+    """
+    Encode an image as PNG according to an encoder policy.
+
+    Parameters:
+        image (PIL.Image.Image): Image to encode.
+        policy (EncoderPolicy | None): Policy to apply; None uses Pillow's defaults.
+
+    Returns:
+        bytes: The encoded PNG data.
+    """
+    params = {}
+    if policy is not None:
+        if policy.reduce_mode:
+            image = reduce_image_mode(image, policy.max_palette_colours)
+        if policy.strip_metadata:
+            # Keep only what is needed to decode the pixels correctly
+            image = image.copy()
+            image.info = {
+                key: value for key, value in image.info.items() if key == "transparency"
+            }
+        if policy.compress_level is not None:
+            params["compress_level"] = policy.compress_level
+        if policy.optimize:
+            params["optimize"] = True
+
+    image_buffer = BytesIO()
+    image.save(image_buffer, format="PNG", **params)
+    return image_buffer.getvalue()
+
+
+# Companion renditions: name -> (Pillow format, content type, default quality)
+COMPANION_FORMATS = {
+    "webp": ("WEBP", "image/webp", 80),
+    "avif": ("AVIF", "image/avif", 60),
+}
+
+# Content types of everything the image generators write, by file extension
+CONTENT_TYPES = {
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".ico": "image/x-icon",
+    ".json": "application/json",
+}
+
+
+# PNG files start with the signature and the IHDR chunk holding the pixel dimensions
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_HEADER_BYTES = 24
+
+
+def png_dimensions(data):
+    """
+    Read the pixel dimensions of a PNG from its first `PNG_HEADER_BYTES` bytes, without decoding it.
+
+    Parameters:
+        data (bytes): The PNG data, or at least its first `PNG_HEADER_BYTES` bytes.
+
+    Returns:
+        tuple | None: `(width, height)`, or `None` if the data does not start with a PNG header.
+    """
+    if data[:8] != PNG_SIGNATURE or data[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def supported_companion_formats(names):
+    """
+    Filter companion format names down to those this Pillow build can encode.
+
+    Parameters:
+        names (iterable[str]): Requested names, e.g. ["webp", "avif"].
+
+    Returns:
+        tuple: The supported names, in the requested order.
+
+    Raises:
+        ValueError: If a name is not a known companion format.
+    """
+    supported = []
+    for name in names:
+        if name not in COMPANION_FORMATS:
+            raise ValueError(f"Unknown companion format: {name}")
+        if features.check(name):
+            supported.append(name)
+        else:
+            print(f"Warning: Pillow cannot encode {name}; skipping {name} renditions")
+    return tuple(supported)
+
+
+def companion_key(s3_key, name):
+    """
+    Return the sibling key of a companion rendition, e.g. "logo-x.png" -> "logo-x.webp".
+    """
+    base, _ = os.path.splitext(s3_key)
+    return f"{base}.{name}"
+
+
+def encode_companion(image, name, quality=None):
+    """
+    Encode a companion rendition of an image.
+
+    Parameters:
+        image (PIL.Image.Image): Image to encode.
+        name (str): Companion format name from `COMPANION_FORMATS`.
+        quality (int, optional): Encoder quality (0-100); defaults to the format's default.
+
+    Returns:
+        bytes: The encoded data.
+    """
+    pillow_format, _, default_quality = COMPANION_FORMATS[name]
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    image_buffer = BytesIO()
+    image.save(
+        image_buffer,
+        format=pillow_format,
+        quality=quality if quality is not None else default_quality,
+    )
+    return image_buffer.getvalue()
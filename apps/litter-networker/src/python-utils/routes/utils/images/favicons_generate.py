@@ -1,10 +1,23 @@
 # Copyright Clean and Green Communities CIC / Litter Networks
 # SPDX-License-Identifier: Apache-2.0
 
-from PIL import Image, ImageDraw
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageDraw
 
-from routes.utils.images.image_utils import save_image_to_s3
+from routes.utils.images.image_utils import save_image_to_s3, save_bytes_to_s3
+from routes.utils.images.asset_fingerprints import (
+    compute_fingerprint,
+    assets_are_current,
+    record_fingerprint,
+)
+from routes.utils.images.thumbnails import build_thumbnail_pyramid
+
+# Bump whenever a change to this module alters the generated images
+RENDERER_VERSION = 1
 
 # Define the required icon sizes
 icon_sizes = [
@@ -19,62 +32,201 @@ icon_sizes = [
     (16, 16),
 ]
 
-# Define input and output paths
+# Sizes packed into the multi-resolution favicon.ico
+ico_sizes = [(16, 16), (32, 32), (48, 48)]
+
+# Sizes listed in the web manifest snippet
+manifest_sizes = [(192, 192), (512, 512)]
 
+# Define input and output paths
 base_dir = os.path.dirname(os.path.abspath(__file__))
 input_image_path = os.path.join(base_dir, "source", "favicon-source.png")
 output_dir = "proc/images/icons/"
 
-# Create the output directory if it doesn't exist
-os.makedirs(output_dir, exist_ok=True)
+# Public URL the icons are served from
+cdn_base_url = "https://cdn.litternetworks.org/"
+
+# Number of concurrent icon uploads
+max_upload_workers = 8
+
+
+def icon_key(size, variant=""):
+    """
+    Return the S3 key of an icon, e.g. ((32, 32), "-bw") -> "proc/images/icons/icon-32x32-bw.png".
+    """
+    return output_dir + f"icon-{size[0]}x{size[1]}{variant}.png"
+
+
+def get_favicon_keys():
+    """
+    Return every S3 key written by `generate_favicons`.
+    """
+    return [
+        *(icon_key(size, variant) for size in icon_sizes for variant in ("", "-bw")),
+        output_dir + "favicon.ico",
+        output_dir + "manifest-icons.json",
+    ]
 
-# Open the input image
-with Image.open(input_image_path) as img:
-    # Ensure the input image is square
-    if img.width != img.height:
+
+def round_corners(image):
+    """
+    Give a square image smooth rounded corners through its alpha band.
+
+    Parameters:
+        image (PIL.Image.Image): Square source image.
+
+    Returns:
+        PIL.Image.Image: An RGBA copy with the rounded-corner mask as alpha.
+
+    Raises:
+        ValueError: If the image is not square.
+    """
+    if image.width != image.height:
         raise ValueError("Input image must be square.")
 
     # Create a mask with smooth rounded corners
-    mask = Image.new("L", (img.width, img.height), 0)
+    mask = Image.new("L", image.size, 0)
     draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle((0, 0, img.width, img.height), radius=45, fill=255)
+    draw.rounded_rectangle((0, 0, image.width, image.height), radius=45, fill=255)
 
     # Apply anti-aliasing by resizing mask to a larger size first, then back down to smooth edges
-    mask = mask.resize((img.width * 2, img.height * 2), Image.LANCZOS).resize(
-        (img.width, img.height), Image.LANCZOS
+    mask = mask.resize((image.width * 2, image.height * 2), Image.LANCZOS).resize(
+        image.size, Image.LANCZOS
     )
 
-    # Apply the mask for rounded corners
-    img.putalpha(mask)
+    image = image.convert("RGBA")
+    image.putalpha(mask)
+    return image
 
-    # Generate icons in the specified sizes
-    for size in icon_sizes:
-        # Resize the image
-        resized_img = img.resize(size, Image.LANCZOS)
 
-        # Ensure the resized image retains transparency and rounded corners
-        rounded_icon = Image.new("RGBA", size)
-        rounded_icon.paste(resized_img, (0, 0), resized_img)
+def render_icons(source):
+    """
+    Render every icon size and its black-and-white variant from the rounded source image.
 
-        # Save the resized image with the size in the filename
-        s3_key = output_dir + f"icon-{size[0]}x{size[1]}.png"
-        save_image_to_s3(rounded_icon, s3_key)
+    Sizes are stepped down from earlier, larger sizes (see `build_thumbnail_pyramid`) rather than each being resized from the full source. The black-and-white variant is built with band operations on the finished colour icon.
 
-        print(f"Saved icon to s3: {s3_key}")
+    Parameters:
+        source (PIL.Image.Image): Square RGBA source with rounded corners.
 
-        # Create a black-and-white version while retaining transparency
-        # Split the RGBA channels
-        r, g, b, alpha = rounded_icon.split()
+    Returns:
+        dict: Mapping of each size in `icon_sizes` to its `(colour, black_and_white)` icons.
+    """
+    levels = build_thumbnail_pyramid(source, [(size, size[0]) for size in icon_sizes])
 
-        # Merge grayscale RGB channels back with original alpha channel
-        bw_rgb = Image.merge("RGB", (r, g, b)).convert("L")  # Convert to grayscale
-        bw_icon = Image.merge(
-            "RGBA", (bw_rgb, bw_rgb, bw_rgb, alpha)
-        )  # Reassemble with the alpha channel
+    icons = {}
+    for size, resized_img in levels:
+        # Ensure the resized image retains transparency and rounded corners
+        rounded_icon = Image.new("RGBA", size)
+        rounded_icon.paste(resized_img, (0, 0), resized_img)
 
-        # Save the black-and-white icon
-        bw_s3_key = output_dir + f"icon-{size[0]}x{size[1]}-bw.png"
-        save_image_to_s3(bw_icon, bw_s3_key)
-        print(f"Saved black-and-white icon to s3: {bw_s3_key}")
+        # Greyscale RGB bands reassembled with the original alpha band
+        grey = rounded_icon.convert("L")
+        bw_icon = Image.merge("RGBA", (grey, grey, grey, rounded_icon.getchannel("A")))
+
+        icons[size] = (rounded_icon, bw_icon)
+    return icons
+
+
+def encode_ico(icons):
+    """
+    Encode a multi-resolution favicon.ico from already rendered icons.
+
+    Parameters:
+        icons (dict): Output of `render_icons`; must contain every size in `ico_sizes`.
+
+    Returns:
+        bytes: The encoded ICO data.
+    """
+    frames = [icons[size][0] for size in sorted(ico_sizes, reverse=True)]
+    ico_buffer = BytesIO()
+    frames[0].save(ico_buffer, format="ICO", sizes=ico_sizes, append_images=frames[1:])
+    return ico_buffer.getvalue()
+
+
+def build_manifest_icons():
+    """
+    Return the `icons` member of a web app manifest pointing at the generated icons.
+    """
+    return {
+        "icons": [
+            {
+                "src": cdn_base_url + icon_key(size),
+                "sizes": f"{size[0]}x{size[1]}",
+                "type": "image/png",
+                "purpose": "any",
+            }
+            for size in manifest_sizes
+        ]
+    }
+
+
+def generate_favicons(force_generate=False):
+    """
+    Generate the site icons and upload them to S3.
+
+    Rounds the corners of the favicon source, renders every size in `icon_sizes` in colour and black-and-white, and uploads them concurrently together with a multi-resolution `favicon.ico` and a web manifest snippet (`manifest-icons.json`).
+
+    Parameters:
+        force_generate (bool): If True, regenerate even if every icon exists and was generated from the current source image.
+
+    Returns:
+        dict: The web manifest snippet.
+    """
+    manifest = build_manifest_icons()
+    s3_keys = get_favicon_keys()
+    input_fingerprint = compute_fingerprint(
+        "favicons",
+        RENDERER_VERSION,
+        {"icon_sizes": icon_sizes, "ico_sizes": ico_sizes, "manifest": manifest},
+        [input_image_path],
+    )
 
-print("Icon generation complete.")
+    if force_generate is False:
+        if assets_are_current(s3_keys, input_fingerprint):
+            return manifest
+
+    with Image.open(input_image_path) as img:
+        source = round_corners(img)
+
+    icons = render_icons(source)
+    metadata = {"input-fingerprint": input_fingerprint}
+
+    with ThreadPoolExecutor(max_workers=max_upload_workers) as pool:
+        uploads = [
+            pool.submit(save_image_to_s3, icon, icon_key(size, variant), metadata)
+            for size, pair in icons.items()
+            for variant, icon in zip(("", "-bw"), pair)
+        ]
+        uploads.append(
+            pool.submit(
+                save_bytes_to_s3,
+                encode_ico(icons),
+                output_dir + "favicon.ico",
+                metadata,
+            )
+        )
+        uploads.append(
+            pool.submit(
+                save_bytes_to_s3,
+                json.dumps(manifest, indent=2).encode("utf-8"),
+                output_dir + "manifest-icons.json",
+                metadata,
+            )
+        )
+        for upload in uploads:
+            upload.result()
+
+    record_fingerprint(s3_keys, input_fingerprint)
+    return manifest
+
+
+def main():
+    """
+    Generate and upload every site icon.
+    """
+    generate_favicons(force_generate=True)
+    print("Icon generation complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,24 +2,35 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
-from PIL import Image, ImageDraw, ImageFont
-from routes.utils.info.network_info import get_network_info, get_all_network_ids
-from routes.utils.images.image_utils import (
-    save_image_to_s3,
-    load_image_from_s3,
-    image_exists_on_s3,
+from PIL import Image, ImageDraw
+from routes.utils.info.network_info import require_network_info, get_all_network_ids
+from routes.utils.images.image_utils import load_image_from_s3
+from routes.utils.images.asset_fingerprints import (
+    compute_fingerprint,
+    assets_are_current,
+    record_fingerprint,
 )
+from routes.utils.images.resource_cache import get_font, get_composite
+from routes.utils.images.text_fit import fit_font_size, measure_text
+from routes.utils.images.stage_timing import start_stages, end_stage
+from routes.utils.images.thumbnails import pyramid_keys, save_image_pyramid
+
+# Bump whenever a change to this module alters the generated images
+RENDERER_VERSION = 3
 
 
 def generate_flyer(net, force_generate=False):
     """
-    Generate and upload a flyer image and its thumbnail for a network to S3.
+    Generate and upload a flyer image and its thumbnail pyramid for a network to S3.
 
-    Creates a composed flyer by combining a background and foreground template, overlaying the network QR code, rendering the network name (with automatic scaling and line-wrapping), optional "Litter Network" label, contact email, website URL, and Facebook/branding text. Saves the full-size image and a 1/5-size thumbnail to predetermined S3 paths.
+    Creates a composed flyer by combining a background and foreground template, overlaying the network QR code, rendering the network name (with automatic scaling and line-wrapping), optional "Litter Network" label, contact email, website URL, and Facebook/branding text. Saves the full-size image and its thumbnail pyramid (see `THUMBNAIL_LEVELS`, including the 1/5-size `-thumb` image) to predetermined S3 paths.
 
     Parameters:
         net (str): Network identifier to generate the flyer for, or the literal "all" to generate the generic flyer.
-        force_generate (bool): If True, regenerate and upload images even if both full and thumbnail already exist on S3. If False, the function exits early when both images are present.
+        force_generate (bool): If True, regenerate and upload images even if they already exist on S3. If False, the function exits early when every image is present and were generated from the current inputs (network fields, templates, fonts and renderer version).
+
+    Raises:
+        LookupError: If the network's info cannot be retrieved, or lacks its short id or name; nothing is rendered.
 
     Notes:
         - If required source images, QR image, or font files cannot be opened or loaded, the function prints an error and returns without saving images.
@@ -29,15 +40,7 @@ def generate_flyer(net, force_generate=False):
 
     # firstly let's generate output file-paths...
     file_name_full = f"flyer-{net}.png"
-    file_name_thumb = f"flyer-{net}-thumb.png"
-
     file_path_full = f"proc/images/resources/flyer/{file_name_full}"
-    file_path_thumb = f"proc/images/resources/flyer/" + file_name_thumb
-
-    # ... and see if they already exist on s3:
-    if force_generate is False:
-        if image_exists_on_s3(file_path_full) and image_exists_on_s3(file_path_thumb):
-            return
 
     # Determine the base directory where the script is located
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -52,8 +55,8 @@ def generate_flyer(net, force_generate=False):
     font_poppins_m = os.path.join(base_dir, "fonts/Poppins-Medium.otf")
     font_poppins_b = os.path.join(base_dir, "fonts/Poppins-Bold.otf")
 
-    # Get network info
-    selected_network_info = get_network_info(net)
+    # Get network info (raises if the lookup failed, rather than rendering empty fields)
+    selected_network_info = require_network_info(net, ("shortId", "fullName"))
 
     # Image templates
     image_path_template = os.path.join(base_dir, "source", "flyer-template.png")
@@ -61,30 +64,47 @@ def generate_flyer(net, force_generate=False):
         base_dir, "source", "flyer-defaultbackground.png"
     )
 
-    try:
-        image_fg = Image.open(image_path_template).convert("RGBA")
-    except IOError:
-        print(f"Error: Cannot open foreground template {image_path_template}")
-        return
+    input_fingerprint = compute_fingerprint(
+        "flyer",
+        RENDERER_VERSION,
+        {
+            field: selected_network_info.get(field)
+            for field in ("shortId", "fullName", "logoName", "contactEmail")
+        },
+        [
+            image_path_template,
+            image_path_background,
+            font_source_serif,
+            font_poppins_m,
+            font_poppins_b,
+        ],
+    )
+
+    # ... and see if they already exist, up to date, on s3:
+    if force_generate is False:
+        if assets_are_current(pyramid_keys(file_path_full), input_fingerprint):
+            return
 
+    start_stages()
+
+    # Foreground overlaid onto background; identical for every network, so composited once per process
     try:
-        image = Image.open(image_path_background).convert("RGBA")
-    except IOError:
-        print(f"Error: Cannot open background image {image_path_background}")
+        image = get_composite(image_path_background, image_path_template)
+    except IOError as e:
+        print(f"Error: Cannot open flyer background or template: {e}")
         return
 
-    # Overlay foreground onto background
-    image = Image.alpha_composite(image, image_fg)
-
     had_errors = False
 
     # Add QR code to image
     image_qr = load_image_from_s3(f"proc/images/resources/qr/qr-{net}.png")
+    end_stage("load")
 
     # Resize QR code to 360x360
     image_qr = image_qr.resize((360, 360), Image.Resampling.LANCZOS)
     # Paste QR code at (2020, 2450)
     image.paste(image_qr, (2020, 2450), image_qr)
+    end_stage("composite")
 
     # Add network name to image
     selected_network_logo_name = selected_network_info.get(
@@ -101,31 +121,17 @@ def generate_flyer(net, force_generate=False):
     draw = ImageDraw.Draw(image)
 
     for line in lines:
-        # Load font
+        # Load the largest font (up to the default size) that fits 90% of the width
         try:
-            font = ImageFont.truetype(font_source_serif, font_scale * font_size)
+            line_font_size = fit_font_size(
+                font_source_serif, line, image.width * 0.9, font_scale * font_size
+            )
+            font = get_font(font_source_serif, line_font_size)
         except IOError:
             print(f"Error: Cannot load font {font_source_serif}")
             return
 
-        # Calculate text size
-        text_box = draw.textbbox((0, 0), line, font=font)
-        text_width = text_box[2] - text_box[0]
-        text_height = text_box[3] - text_box[1]
-
-        # Scale text if too wide
-        line_scale = 1.0
-        if text_width > (image.width * 0.9):
-            line_scale = (image.width * 0.9) / text_width
-            scaled_font_size = int(font_scale * font_size * line_scale)
-            try:
-                font = ImageFont.truetype(font_source_serif, scaled_font_size)
-            except IOError:
-                print(f"Error: Cannot load font {font_source_serif}")
-                return
-            text_box = draw.textbbox((0, 0), line, font=font)
-            text_width = text_box[2] - text_box[0]
-            text_height = text_box[3] - text_box[1]
+        text_width, text_height = measure_text(font_source_serif, line_font_size, line)
 
         # Calculate X position to center the text
         line_x = (image.width / 2) - (text_width / 2)
@@ -143,14 +149,12 @@ def generate_flyer(net, force_generate=False):
         line = "Litter Network"
 
         try:
-            font_litter = ImageFont.truetype(font_poppins_m, font_size_litter)
+            font_litter = get_font(font_poppins_m, font_size_litter)
         except IOError:
             print(f"Error: Cannot load font {font_poppins_m}")
             return
 
-        text_box = draw.textbbox((0, 0), line, font=font_litter)
-        text_width = text_box[2] - text_box[0]
-        text_height = text_box[3] - text_box[1]
+        text_width, text_height = measure_text(font_poppins_m, font_size_litter, line)
 
         line_x = (image.width / 2) - (text_width / 2)
         draw.text((line_x, text_y), line, font=font_litter, fill=text_colour)
@@ -172,19 +176,10 @@ def generate_flyer(net, force_generate=False):
     )
 
     try:
-        font_email = ImageFont.truetype(font_poppins_m, lower_font_size)
-    except IOError:
-        print(f"Error: Cannot load font {font_poppins_m}")
-        return
-
-    text_box = draw.textbbox((0, 0), email_text, font=font_email)
-    text_width = text_box[2] - text_box[0]
-
-    text_scale = min(max_width_left_side / text_width, 1.0)
-    scaled_font_size = int(lower_font_size * text_scale)
-
-    try:
-        font_email_scaled = ImageFont.truetype(font_poppins_m, scaled_font_size)
+        scaled_font_size = fit_font_size(
+            font_poppins_m, email_text, max_width_left_side, lower_font_size
+        )
+        font_email_scaled = get_font(font_poppins_m, scaled_font_size)
     except IOError:
         print(f"Error: Cannot load font {font_poppins_m}")
         return
@@ -202,14 +197,11 @@ def generate_flyer(net, force_generate=False):
         else f"litternetworks.org/{selected_network_info.get('shortId', '')}"
     )
 
-    text_box = draw.textbbox((0, 0), selected_network_url, font=font_email_scaled)
-    text_width = text_box[2] - text_box[0]
-
-    text_scale = min(max_width_left_side / text_width, 1.0)
-    scaled_font_size = int(lower_font_size * text_scale)
-
     try:
-        font_url_scaled = ImageFont.truetype(font_poppins_m, scaled_font_size)
+        scaled_font_size = fit_font_size(
+            font_poppins_m, selected_network_url, max_width_left_side, lower_font_size
+        )
+        font_url_scaled = get_font(font_poppins_m, scaled_font_size)
     except IOError:
         print(f"Error: Cannot load font {font_poppins_m}")
         return
@@ -237,14 +229,14 @@ def generate_flyer(net, force_generate=False):
     for line in fb_lines:
         actual_line = line
         try:
-            font_fb = ImageFont.truetype(font_poppins_b, font_size_fb)
+            font_fb = get_font(font_poppins_b, font_size_fb)
         except IOError:
             print(f"Error: Cannot load font {font_poppins_b}")
             return
 
-        text_box = draw.textbbox((0, 0), actual_line, font=font_fb)
-        text_width = text_box[2] - text_box[0]
-        text_height = text_box[3] - text_box[1]
+        text_width, text_height = measure_text(
+            font_poppins_b, font_size_fb, actual_line
+        )
 
         line_x = text_x - (text_width / 2)
 
@@ -255,13 +247,12 @@ def generate_flyer(net, force_generate=False):
 
     # Save image with alpha channel preserved
     image = image.convert("RGBA")
+    end_stage("text")
 
-    # Handle thumbnail
-    thumbnail_size = (image.width // 5, image.height // 5)
-    image_thumb = image.resize(thumbnail_size, Image.Resampling.LANCZOS)
-
-    save_image_to_s3(image, file_path_full)
-    save_image_to_s3(image_thumb, file_path_thumb)
+    # Save the full-size image and every thumbnail size
+    metadata = {"input-fingerprint": input_fingerprint}
+    save_image_pyramid(image, file_path_full, metadata=metadata)
+    record_fingerprint(pyramid_keys(file_path_full), input_fingerprint)
 
 
 def main():
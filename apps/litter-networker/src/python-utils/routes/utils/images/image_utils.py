@@ -1,82 +1,449 @@
 # Copyright Clean and Green Communities CIC / Litter Networks
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
+import os
+import threading
+
 import boto3
-from botocore.exceptions import ClientError
-from PIL import Image
+from PIL import Image, ImageChops
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from routes.utils.images.encoding import (
+    CONTENT_TYPES,
+    companion_key,
+    encode_companion,
+    encode_png,
+    png_dimensions,
+    supported_companion_formats,
+)
+from routes.utils.batch.aws_concurrency import CLIENT_CONFIG
+from routes.utils.images.storage import S3Storage, build_storage
+from routes.utils.images.stage_timing import timed_stage
 
-# Initialize the S3 client
-s3_client = boto3.client("s3")
+# Initialize the S3 client (retries are left to the shared concurrency controller)
+s3_client = boto3.client("s3", config=CLIENT_CONFIG)
 
 # Define S3 bucket
 s3_bucket = "lnweb-public"
 
+# Backend the generators read and write images through; LN_IMAGE_STORAGE may name
+# another bucket ("s3://<bucket>") or a local directory to render into instead
+storage = (
+    build_storage(os.environ["LN_IMAGE_STORAGE"])
+    if os.environ.get("LN_IMAGE_STORAGE")
+    else S3Storage(s3_bucket, s3_client)
+)
+
+# Supported transparency keying modes
+KEY_EXACT = "exact"
+KEY_THRESHOLD = "threshold"
+KEY_LUMINANCE = "luminance"
+
+# Optional listing of known objects, used to answer existence checks without HEAD requests
+asset_inventory = None
+
+# Optional callable receiving encoded images in place of uploading them
+upload_sink = None
+
+# Optional callable told about every existing object overwritten by `upload_image_bytes`
+upload_listener = None
+
+# PNG encoder policy applied by `encode_image`; None keeps Pillow's defaults
+encoder_policy = None
+
+# Companion renditions (e.g. "webp", "avif") written next to every saved PNG
+companion_formats = ()
+companion_quality = {}
+
+# When True, uploads whose content matches the inventory's ETag for the key are skipped
+skip_unchanged = False
+
+# Number of uploads written and skipped as unchanged since the last reset
+upload_counts = {"uploaded": 0, "unchanged": 0}
+_counts_lock = threading.Lock()
+
+# Encodes the PNG and its companions in parallel (Pillow releases the GIL while encoding)
+_encode_pool = ThreadPoolExecutor(max_workers=3)
+
+
+def use_storage(backend):
+    """
+    Read and write generated images through another storage backend.
+
+    Parameters:
+        backend (S3Storage | LocalStorage): The backend, e.g. from `storage.build_storage`.
+    """
+    global storage
+    storage = backend
+
+
+def use_asset_inventory(inventory):
+    """
+    Answer `image_exists_on_s3` from an asset inventory instead of per-key HEAD requests.
+
+    Keys outside the inventory's prefixes still fall back to the storage backend (a `head_object` on S3). Uploads made through `save_image_to_s3` are recorded in the inventory.
+
+    Parameters:
+        inventory (AssetInventory | None): The inventory to use, or `None` to go back to HEAD requests.
+    """
+    global asset_inventory
+    asset_inventory = inventory
+
 
 def image_exists_on_s3(s3_key):
     """
-    Check whether an object exists in the configured S3 bucket at the given key.
+    Check whether an object exists in the configured storage (by default the S3 bucket) at the given key.
+
+    When an asset inventory covering the key is in use, the answer comes from its listing and no request is made.
 
     Parameters:
-        s3_key (str): S3 object key to check.
+        s3_key (str): Object key to check.
 
     Returns:
-        bool: `True` if the object exists, `False` if S3 reports a 404 (not found).
+        bool: `True` if the object exists, `False` if it does not (S3 reports a 404).
 
     Raises:
         ClientError: Re-raises any S3 ClientError that is not a 404 (not found).
     """
-    try:
-        s3_client.head_object(Bucket=s3_bucket, Key=s3_key)
-        return True  # Image exists
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            return False  # Image does not exist
-        else:
-            # Re-raise if it's a different error
-            raise
+    if asset_inventory is not None and asset_inventory.covers(s3_key):
+        return asset_inventory.exists(s3_key)
+
+    return storage.exists(s3_key)
 
 
-def save_image_to_s3(image, s3_key):
-    # Save image to a buffer (to avoid writing to local file)
+def use_upload_sink(sink):
+    """
+    Divert `save_image_to_s3` uploads to a callable instead of S3.
+
+    Used by render worker processes, which encode images and hand the bytes back to the parent process for uploading.
+
+    Parameters:
+        sink (callable | None): Called as `sink(s3_key, data, metadata)` for each saved image, or `None` to upload directly again.
+    """
+    global upload_sink
+    upload_sink = sink
+
+
+def use_upload_listener(listener):
+    """
+    Report the keys of existing objects overwritten by uploads (e.g. to invalidate them on the CDN).
+
+    Newly created objects are not reported, as they cannot be cached yet. Keys outside the asset inventory are always reported, since whether they existed is unknown.
+
+    Parameters:
+        listener (callable | None): Called as `listener(s3_key)` after each such upload, or `None` to stop reporting.
+    """
+    global upload_listener
+    upload_listener = listener
+
+
+def use_encoder_policy(policy):
+    """
+    Set the PNG encoder policy used for every saved image.
+
+    Parameters:
+        policy (EncoderPolicy | None): The policy to apply, or `None` for Pillow's defaults.
+    """
+    global encoder_policy
+    encoder_policy = policy
+
+
+def use_companion_formats(names, quality=None):
+    """
+    Also write companion renditions in other formats next to every saved PNG.
+
+    Formats the installed Pillow cannot encode are skipped with a warning.
+
+    Parameters:
+        names (iterable[str]): Companion format names, e.g. ["webp", "avif"]; empty to disable.
+        quality (dict, optional): Encoder quality per format name, overriding the format defaults.
+    """
+    global companion_formats, companion_quality
+    companion_formats = supported_companion_formats(names)
+    companion_quality = dict(quality or {})
+
+
+def use_skip_unchanged(enabled):
+    """
+    Turn compare-before-put on or off for `upload_image_bytes`.
+
+    When on, the MD5 of each encoded buffer is compared with the ETag recorded by the asset inventory (taken from its listing, so no HEAD request is made) and the upload is skipped if they match. Keys the inventory does not cover, entries only loaded from a persisted listing (see `AssetInventory.is_current`), or objects with multipart ETags, are always uploaded.
+
+    Parameters:
+        enabled (bool): Whether to skip uploads of unchanged content.
+    """
+    global skip_unchanged
+    skip_unchanged = enabled
+
+
+def reset_upload_counts():
+    """
+    Reset the uploaded / unchanged counters and return their previous values.
+    """
+    with _counts_lock:
+        counts = dict(upload_counts)
+        for name in upload_counts:
+            upload_counts[name] = 0
+    return counts
+
+
+def _count_upload(name):
+    with _counts_lock:
+        upload_counts[name] += 1
+
+
+def companion_keys(s3_key):
+    """
+    Return the keys of the companion renditions written alongside a PNG key (none for other keys).
+    """
+    if not s3_key.endswith(".png"):
+        return []
+    return [companion_key(s3_key, name) for name in companion_formats]
+
+
+def output_settings():
+    """
+    Return the module-level output settings, so they can be applied in worker processes.
+    """
+    return {
+        "storage": storage,
+        "encoder_policy": encoder_policy,
+        "companion_formats": companion_formats,
+        "companion_quality": companion_quality,
+    }
+
+
+def apply_output_settings(settings):
+    """
+    Apply output settings previously returned by `output_settings`.
+    """
+    global storage, encoder_policy, companion_formats, companion_quality
+    storage = settings["storage"]
+    encoder_policy = settings["encoder_policy"]
+    companion_formats = settings["companion_formats"]
+    companion_quality = settings["companion_quality"]
+
+
+def encode_image(image):
+    """
+    Encode a PIL Image as PNG using the active encoder policy.
+
+    Parameters:
+        image (PIL.Image.Image): The image to encode.
+
+    Returns:
+        bytes: The encoded PNG data.
+    """
+    return encode_png(image, encoder_policy)
+
+
+def encode_renditions(image, s3_key):
+    """
+    Encode an image as PNG plus every active companion format, in parallel.
+
+    Parameters:
+        image (PIL.Image.Image): The image to encode.
+        s3_key (str): Key of the PNG; companion keys are derived from it.
+
+    Returns:
+        list: `(s3_key, data)` pairs, PNG first.
+    """
+    futures = [(s3_key, _encode_pool.submit(encode_image, image))]
+    for name in companion_formats:
+        futures.append(
+            (
+                companion_key(s3_key, name),
+                _encode_pool.submit(
+                    encode_companion, image, name, companion_quality.get(name)
+                ),
+            )
+        )
+    return [(key, future.result()) for key, future in futures]
+
+
+def upload_image_bytes(data, s3_key, metadata=None):
+    """
+    Upload encoded image data to the configured storage (by default the S3 bucket) and set caching headers.
+
+    The content type is derived from the key's file extension. When compare-before-put is on (see `use_skip_unchanged`) and the inventory shows the same content is already stored, nothing is uploaded.
+
+    Parameters:
+        data (bytes): Encoded image data.
+        s3_key (str): Destination object key within the configured storage.
+        metadata (dict, optional): User metadata to store on the object (e.g. the input fingerprint).
+
+    Returns:
+        bool: `True` if the data was uploaded, `False` if the upload was skipped as unchanged.
+    """
+    tracked = asset_inventory is not None and asset_inventory.covers(s3_key)
+    content_md5 = hashlib.md5(data, usedforsecurity=False).hexdigest()
+    # PNG dimensions are kept in the inventory for the asset manifest
+    dimensions = png_dimensions(data) if tracked else None
+
+    # Only trust ETags listed this run; a persisted listing may be out of date
+    if skip_unchanged and tracked and asset_inventory.is_current(s3_key):
+        known = asset_inventory.get(s3_key)
+        if known.get("etag") == content_md5:
+            if dimensions and "width" not in known:
+                asset_inventory.record(s3_key, content_md5, len(data), dimensions)
+            _count_upload("unchanged")
+            return False
+    replaced = asset_inventory.exists(s3_key) if tracked else True
+
+    extension = os.path.splitext(s3_key)[1].lower()
+
+    # Upload the image with Cache-Control headers
+    storage.write(
+        s3_key,
+        BytesIO(data),
+        CONTENT_TYPES.get(extension, "application/octet-stream"),
+        cache_control="public, max-age=3600, immutable",
+        metadata=metadata,
+    )
+
+    # Single-part uploads get the content MD5 as their ETag
+    if tracked:
+        asset_inventory.record(
+            s3_key, etag=content_md5, size=len(data), dimensions=dimensions
+        )
+    _count_upload("uploaded")
+    if replaced and upload_listener is not None:
+        upload_listener(s3_key)
+    return True
+
+
+def save_image_to_s3(image, s3_key, metadata=None):
     """
     Upload a PIL Image to the configured S3 bucket as a PNG and set caching headers.
 
+    Any active companion formats (see `use_companion_formats`) are encoded from the same image and uploaded under sibling keys. When an upload sink is in use, the encoded images are handed to it instead of being uploaded.
+
     Parameters:
         image (PIL.Image.Image): The image to upload.
         s3_key (str): Destination object key within the configured S3 bucket.
+        metadata (dict, optional): User metadata to store on the object (e.g. the input fingerprint).
     """
-    image_buffer = BytesIO()
-    image.save(image_buffer, format="PNG")
-    image_buffer.seek(0)
+    # Save image to buffers (to avoid writing to local files)
+    with timed_stage("encode"):
+        renditions = encode_renditions(image, s3_key)
 
-    # Upload the image to S3 with Cache-Control headers
-    s3_client.upload_fileobj(
-        image_buffer,
-        s3_bucket,
-        s3_key,
-        ExtraArgs={
-            "ContentType": "image/png",
-            "CacheControl": "public, max-age=3600, immutable",
-        },
-    )
+    if encoder_policy is not None and encoder_policy.report:
+        default_size = len(encode_png(image))
+        png_size = len(renditions[0][1])
+        companions = "".join(
+            f", {os.path.splitext(key)[1][1:]} {len(data)}"
+            for key, data in renditions[1:]
+        )
+        print(
+            f"Encoded {s3_key}: {default_size} -> {png_size} bytes "
+            f"({png_size - default_size:+d}){companions}"
+        )
+
+    with timed_stage("store"):
+        for rendition_key, data in renditions:
+            save_bytes_to_s3(data, rendition_key, metadata)
+
+
+def save_bytes_to_s3(data, s3_key, metadata=None):
+    """
+    Upload already-encoded data (e.g. an ICO file), or hand it to the upload sink when one is in use.
+
+    Parameters:
+        data (bytes): Encoded data.
+        s3_key (str): Destination object key within the configured S3 bucket.
+        metadata (dict, optional): User metadata to store on the object.
+    """
+    if upload_sink is not None:
+        upload_sink(s3_key, data, metadata)
+    else:
+        upload_image_bytes(data, s3_key, metadata)
 
 
 def load_image_from_s3(s3_key):
     """
-    Load an image from the configured S3 bucket by key.
+    Load an image from the configured storage (by default the S3 bucket) by key.
 
     Parameters:
-        s3_key (str): S3 object key identifying the image to load.
+        s3_key (str): Object key identifying the image to load.
 
     Returns:
         PIL.Image.Image: The image loaded and converted to RGBA, or a new 400x400 transparent RGBA image if the object is missing or cannot be read.
     """
     try:
-        response = s3_client.get_object(Bucket=s3_bucket, Key=s3_key)
-        image_loaded = Image.open(BytesIO(response["Body"].read())).convert("RGBA")
-    except (s3_client.exceptions.NoSuchKey, IOError):
+        data = storage.read(s3_key)
+        if data is None:
+            raise FileNotFoundError(s3_key)
+        image_loaded = Image.open(BytesIO(data)).convert("RGBA")
+    except IOError:
         image_loaded = Image.new("RGBA", (400, 400), (0, 0, 0, 0))  # Transparent image
         had_errors = True
 
     return image_loaded
+
+
+def build_key_mask(image, mode=KEY_EXACT, colour=(0, 0, 0), threshold=0):
+    """
+    Build a mask marking the pixels of an image that match a transparency key.
+
+    The mask is computed on whole bands (via `Image.point` lookup tables and `ImageChops`) rather than per pixel, so it costs roughly the same as a single band copy regardless of image size.
+
+    Parameters:
+        image (PIL.Image.Image): Source image; converted to RGB for colour comparisons.
+        mode (str): One of `KEY_EXACT` (RGB equals `colour`), `KEY_THRESHOLD` (every RGB component lies within `threshold` of `colour`) or `KEY_LUMINANCE` (luminance is at least `threshold`; `colour` is ignored).
+        colour (tuple): RGB key colour used by the exact and threshold modes.
+        threshold (int): Per-component tolerance for `KEY_THRESHOLD`, or the minimum luminance (0-255) for `KEY_LUMINANCE`.
+
+    Returns:
+        PIL.Image.Image: An "L" mask that is 255 where the pixel matches the key and 0 elsewhere.
+
+    Raises:
+        ValueError: If `mode` is not a supported keying mode.
+    """
+    if mode == KEY_LUMINANCE:
+        return image.convert("L").point(lambda v: 255 if v >= threshold else 0)
+
+    if mode == KEY_EXACT:
+        tolerance = 0
+    elif mode == KEY_THRESHOLD:
+        tolerance = threshold
+    else:
+        raise ValueError(f"Unsupported key mode: {mode}")
+
+    # One lookup table per band, then AND the band masks together
+    band_masks = [
+        band.point(lambda v, c=c: 255 if abs(v - c) <= tolerance else 0)
+        for band, c in zip(image.convert("RGB").split(), colour)
+    ]
+    mask = band_masks[0]
+    for band_mask in band_masks[1:]:
+        mask = ImageChops.multiply(mask, band_mask)
+    return mask
+
+
+def apply_transparency_key(
+    image, mode=KEY_EXACT, colour=(0, 0, 0), threshold=0, invert=False
+):
+    """
+    Make the pixels matching (or, with `invert`, not matching) a key fully transparent.
+
+    Keyed pixels become (0, 0, 0, 0); all other pixels keep their original RGBA values.
+
+    Parameters:
+        image (PIL.Image.Image): Image to process; converted to RGBA.
+        mode (str): Keying mode, see `build_key_mask`.
+        colour (tuple): RGB key colour for the exact and threshold modes.
+        threshold (int): Tolerance or luminance threshold, see `build_key_mask`.
+        invert (bool): If True, keep the matching pixels and make everything else transparent.
+
+    Returns:
+        PIL.Image.Image: A new RGBA image with the keyed pixels made transparent.
+    """
+    image = image.convert("RGBA")
+    mask = build_key_mask(image, mode=mode, colour=colour, threshold=threshold)
+    if invert:
+        mask = ImageChops.invert(mask)
+
+    transparent = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    return Image.composite(transparent, image, mask)
@@ -1,11 +1,27 @@
 # Copyright Clean and Green Communities CIC / Litter Networks
 # SPDX-License-Identifier: Apache-2.0
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw
 import os
+from collections import Counter
 from enum import Enum, auto
-from routes.utils.info.network_info import get_network_info, get_all_network_ids
-from routes.utils.images.image_utils import save_image_to_s3, image_exists_on_s3
+from routes.utils.info.network_info import require_network_info, get_all_network_ids
+from routes.utils.images.asset_fingerprints import (
+    compute_fingerprint,
+    assets_are_current,
+    record_fingerprint,
+)
+from routes.utils.images.resource_cache import get_font, get_template
+from routes.utils.images.text_fit import measure_text
+from routes.utils.images.stage_timing import start_stages, end_stage
+from routes.utils.images.thumbnails import (
+    build_thumbnail_pyramid,
+    pyramid_keys,
+    save_image_pyramid,
+)
+
+# Bump whenever a change to this module alters the generated images
+RENDERER_VERSION = 2
 
 
 # Enum for image styles
@@ -20,180 +36,153 @@ class ImageStyle(Enum):
     WHITE_ALPHA = auto()
 
 
-# Function to generate the image and upload it to S3
-def generate_logo(net, image_style=ImageStyle.BANNER_ON_WHITE, force_generate=False):
+# General settings
+text_colour_green = (155, 187, 60)
+font_size = 95
+url_text_size = 46
+volunteer_font_size = 160
+text_y_bw = 1780
+text_sep_y = 100
+extra_text_sep_y_url = 0
+extra_text_sep_y_url_2lines = 20
+crop_width = 750
+banner_text_y = 640
+url_text = "litternetworks.org"
+volunteer_text = "Volunteer"
+
+# Determine the base directory where the script is located
+base_dir = os.path.dirname(os.path.abspath(__file__))
+font_path = os.path.join(base_dir, "fonts", "calibri.ttf")
+font_path_bold = os.path.join(base_dir, "fonts", "calibrib.ttf")
 
-    # Determine the base directory where the script is located
-    """
-    Generate and upload a styled network logo and a thumbnail to S3.
 
-    Creates a full-size PNG and a thumbnail PNG for the given network ID using the specified ImageStyle, rendering the network display name (from `logoName` or `fullName`, split on "|" into separate lines), a centered "litternetworks.org" URL line, and an optional "Volunteer" label for volunteer styles. If both output files already exist on S3 and `force_generate` is False, the function returns without modifying remote assets. The final images are uploaded to S3 at paths of the form `proc/images/resources/logo/logo-{net}{extra_tokens}.png` and `...-thumb.png`.
+def get_style_settings(image_style, num_lines):
+    """
+    Describe how a logo style is rendered.
 
     Parameters:
-        net (str): Network identifier used to look up display name and to name output files.
-        image_style (ImageStyle): Visual style to apply (controls template, colors, scaling, and whether a "Volunteer" label is included).
-        force_generate (bool): If True, regenerate and upload images even if they already exist on S3; if False, skip generation when both files are present.
+        image_style (ImageStyle): Style to describe.
+        num_lines (int): Number of lines in the network display name (selects 1- or 2-line templates).
+
+    Returns:
+        dict: Settings with keys `extra_tokens` (file name suffix), `text_colour`, `template` (source file name), `scaled` (whether sizes are scaled to the template width), `text_y`, `volunteer` (whether the "Volunteer" label is drawn) and `invert` (whether RGB is inverted after drawing).
     """
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # General settings
-    text_colour = (155, 187, 60)
-    font_path = os.path.join(base_dir, "fonts", "calibri.ttf")
-    font_path_bold = os.path.join(base_dir, "fonts", "calibrib.ttf")
-    font_size = 95
-    url_text_size = 46
-    volunteer_font_size = 160
-    text_y = 700
-    text_y_bw = 1780
-    text_sep_y = 100
-    extra_text_sep_y_url = 0
-    extra_text_sep_y_url_2lines = 20
-    scale_all = 1.0
-    crop_width = 750
-    banner_text_y = 640
-
-    # generate output file-paths...
-
-    extra_tokens = ""
+    two_lines = num_lines > 1
+    settings = {
+        "extra_tokens": "",
+        "text_colour": text_colour_green,
+        "template": (
+            "logo_long_template_2.png" if two_lines else "logo_long_template.png"
+        ),
+        "scaled": True,
+        "text_y": text_y_bw,
+        "volunteer": False,
+        "invert": False,
+    }
 
     if image_style == ImageStyle.BLACK_AND_WHITE:
-        extra_tokens += "-bw"
-        text_colour = (0, 0, 0)
+        settings["extra_tokens"] = "-bw"
+        settings["text_colour"] = (0, 0, 0)
+        settings["template"] = (
+            "logo_blackwhitealpha_2line.png"
+            if two_lines
+            else "logo_blackwhitealpha_1line.png"
+        )
     elif image_style == ImageStyle.BLACK_AND_WHITE_VOLUNTEER:
-        extra_tokens += "-bwv"
-        text_colour = (0, 0, 0)
+        settings["extra_tokens"] = "-bwv"
+        settings["text_colour"] = (0, 0, 0)
+        settings["template"] = "logo_blackwhitealpha_volunteer.png"
+        settings["volunteer"] = True
     elif image_style == ImageStyle.GREEN_ALPHA:
-        extra_tokens += "-ga"
+        settings["extra_tokens"] = "-ga"
+        settings["template"] = (
+            "logo_greenalpha_2line.png" if two_lines else "logo_greenalpha_1line.png"
+        )
     elif image_style == ImageStyle.GREEN:
-        extra_tokens += "-g"
+        settings["extra_tokens"] = "-g"
+        settings["template"] = (
+            "logo_green_2line.png" if two_lines else "logo_green_1line.png"
+        )
     elif image_style == ImageStyle.GREEN_ALPHA_VOLUNTEER:
-        extra_tokens += "-gav"
+        settings["extra_tokens"] = "-gav"
+        settings["template"] = "logo_greenalpha_volunteer.png"
+        settings["volunteer"] = True
     elif image_style == ImageStyle.WHITE_ALPHA:
-        extra_tokens += "-wa"
-        text_colour = (0, 0, 0)
+        # Rendered exactly like BLACK_AND_WHITE, then inverted
+        settings["extra_tokens"] = "-wa"
+        settings["text_colour"] = (0, 0, 0)
+        settings["template"] = (
+            "logo_blackwhitealpha_2line.png"
+            if two_lines
+            else "logo_blackwhitealpha_1line.png"
+        )
+        settings["invert"] = True
     elif image_style == ImageStyle.BANNER_ON_WHITE:
-        text_y = banner_text_y
+        settings["scaled"] = False
+        settings["text_y"] = banner_text_y
     elif image_style == ImageStyle.BANNER_ON_GREEN:
-        extra_tokens += "-bnr-g"
-        text_y = banner_text_y
-        text_colour = (255, 255, 255)
-
-    logo_path = f"proc/images/resources/logo/logo-{net}{extra_tokens}.png"
-    logo_thumb_path = f"proc/images/resources/logo/logo-{net}{extra_tokens}-thumb.png"
+        settings["extra_tokens"] = "-bnr-g"
+        settings["text_colour"] = (255, 255, 255)
+        settings["template"] = (
+            "logo_bannerongreen_2line.png"
+            if two_lines
+            else "logo_bannerongreen_1line.png"
+        )
+        settings["scaled"] = False
+        settings["text_y"] = banner_text_y
 
-    # ... and see if they already exist on s3:
-    if force_generate is False:
-        if image_exists_on_s3(logo_path) and image_exists_on_s3(logo_thumb_path):
-            return
+    return settings
 
-    # Mocked network name, replace with actual logic to fetch based on 'net'
-    network_info = get_network_info(net)
-    selected_network_logo_name = network_info.get("logoName") or network_info.get(
-        "fullName"
-    )
 
-    # Split network-name into lines (delimited by "|")
-    lines = selected_network_logo_name.split("|")
+def render_text_mask(size, lines, scaled, text_y, volunteer):
+    """
+    Rasterise the logo text (name lines, URL and optional "Volunteer" label) into a coverage mask.
 
-    # load taller image if more than 1 line
-    image_path = (
-        "logo_long_template_2.png" if len(lines) > 1 else "logo_long_template.png"
-    )
+    The mask depends only on the template geometry and the text, so it is shared by every style with the same layout; colour variants are then applied with `apply_text_mask`.
 
-    if (
-        image_style == ImageStyle.BLACK_AND_WHITE
-        or image_style == ImageStyle.WHITE_ALPHA
-    ):
-        image_path = (
-            "logo_blackwhitealpha_2line.png"
-            if len(lines) > 1
-            else "logo_blackwhitealpha_1line.png"
-        )
-    elif image_style == ImageStyle.BLACK_AND_WHITE_VOLUNTEER:
-        image_path = "logo_blackwhitealpha_volunteer.png"
-    elif image_style == ImageStyle.GREEN_ALPHA:
-        image_path = (
-            "logo_greenalpha_2line.png"
-            if len(lines) > 1
-            else "logo_greenalpha_1line.png"
-        )
-    elif image_style == image_style == ImageStyle.GREEN:
-        image_path = (
-            "logo_green_2line.png" if len(lines) > 1 else "logo_green_1line.png"
-        )
-    elif image_style == ImageStyle.GREEN_ALPHA_VOLUNTEER:
-        image_path = "logo_greenalpha_volunteer.png"
-    elif image_style == image_style == ImageStyle.BANNER_ON_GREEN:
-        image_path = (
-            "logo_bannerongreen_2line.png"
-            if len(lines) > 1
-            else "logo_bannerongreen_1line.png"
-        )
+    Parameters:
+        size (tuple): Template size (width, height) in pixels.
+        lines (list[str]): Network display name lines.
+        scaled (bool): Whether font sizes and spacing are scaled by the template width.
+        text_y (int): Y position of the first name line.
+        volunteer (bool): Whether to draw the "Volunteer" label.
+
+    Returns:
+        PIL.Image.Image: An "L" mask where 255 is fully covered by text.
+    """
+    image_width = size[0]
+    scale_all = image_width / crop_width if scaled else 1.0
+    line_font_size = int(font_size * scale_all) if scaled else font_size
+    line_sep_y = int(text_sep_y * scale_all) if scaled else text_sep_y
+    url_font_size = int(url_text_size * scale_all) if scaled else url_text_size
 
-    # Load the image
-    image = Image.open(os.path.join(base_dir, "source", image_path)).convert("RGBA")
-    draw = ImageDraw.Draw(image)
-
-    # Get image dimensions
-    image_width, image_height = image.size
-
-    # If scaling needed, adjust font sizes
-    if image_style in (
-        ImageStyle.BLACK_AND_WHITE,
-        ImageStyle.BLACK_AND_WHITE_VOLUNTEER,
-        ImageStyle.WHITE_ALPHA,
-        ImageStyle.GREEN,
-        ImageStyle.GREEN_ALPHA,
-        ImageStyle.GREEN_ALPHA_VOLUNTEER,
-    ):
-        scale_all = image_width / crop_width
-        font_size = int(font_size * scale_all)
-        text_y = text_y_bw
-        text_sep_y = int(text_sep_y * scale_all)
-        extra_text_sep_y_url = int(extra_text_sep_y_url * scale_all)
-        url_text_size = int(url_text_size * scale_all)
-
-    # Load the font
-    font = ImageFont.truetype(font_path, font_size)
+    mask = Image.new("L", size, 0)
+    draw = ImageDraw.Draw(mask)
 
     # Draw the lines of text
+    font = get_font(font_path, line_font_size)
     for line in lines:
-        text_bbox = draw.textbbox((0, 0), line, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
+        text_width = measure_text(font_path, line_font_size, line)[0]
         line_x = (image_width / 2) - (text_width / 2)
-        draw.text((line_x, text_y), line, fill=text_colour, font=font)
-        text_y += text_sep_y
+        draw.text((line_x, text_y), line, fill=255, font=font)
+        text_y += line_sep_y
 
     # Draw URL text
-    extra_text_sep_y_url = (
-        extra_text_sep_y_url_2lines if len(lines) > 1 else extra_text_sep_y_url
+    url_sep_y = (
+        extra_text_sep_y_url_2lines
+        if len(lines) > 1
+        else int(extra_text_sep_y_url * scale_all)
     )
-    url_font = ImageFont.truetype(font_path, url_text_size)
-    url_text = "litternetworks.org"
-    text_bbox = draw.textbbox((0, 0), url_text, font=url_font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
+    url_font = get_font(font_path, url_font_size)
+    text_width = measure_text(font_path, url_font_size, url_text)[0]
     line_x = (image_width / 2) - (text_width / 2)
-    draw.text(
-        (line_x, text_y + extra_text_sep_y_url),
-        url_text,
-        fill=text_colour,
-        font=url_font,
-    )
+    draw.text((line_x, text_y + url_sep_y), url_text, fill=255, font=url_font)
 
     # Draw volunteer text if required
-    if image_style in (
-        ImageStyle.BLACK_AND_WHITE_VOLUNTEER,
-        ImageStyle.GREEN_ALPHA_VOLUNTEER,
-    ):
-        font_bold = ImageFont.truetype(
-            font_path_bold, int(volunteer_font_size * scale_all)
-        )
-        volunteer_text = "Volunteer"
-        text_bbox = draw.textbbox((0, 0), volunteer_text, font=font_bold)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
+    if volunteer:
+        volunteer_size = int(volunteer_font_size * scale_all)
+        font_bold = get_font(font_path_bold, volunteer_size)
+        text_width = measure_text(font_path_bold, volunteer_size, volunteer_text)[0]
         line_x = (image_width / 2) - (text_width / 2)
 
         extra_text_sep_y_vol = 340 if len(lines) > 1 else 380
@@ -201,38 +190,180 @@ def generate_logo(net, image_style=ImageStyle.BANNER_ON_WHITE, force_generate=Fa
         draw.text(
             (line_x, text_y + extra_text_sep_y_vol),
             volunteer_text,
-            fill=text_colour,
+            fill=255,
             font=font_bold,
         )
 
-        if len(lines) < 2:
+    return mask
+
+
+def apply_text_mask(template, mask, text_colour):
+    """
+    Colour the text mask onto a template.
+
+    Parameters:
+        template (PIL.Image.Image): RGBA template to draw on (modified in place).
+        mask (PIL.Image.Image): Text coverage mask from `render_text_mask`.
+        text_colour (tuple): RGB text colour.
+
+    Returns:
+        PIL.Image.Image: The rendered RGBA logo (the template itself).
+    """
+    template.paste(text_colour + (255,), (0, 0), mask)
+    return template
+
+
+def invert_rgb(image):
+    """
+    Invert the RGB bands of an RGBA image while keeping its alpha band.
+
+    Returns:
+        PIL.Image.Image: A new RGBA image.
+    """
+    r, g, b, a = image.split()
+    inverted_rgb = ImageChops.invert(Image.merge("RGB", (r, g, b)))
+    return Image.merge("RGBA", (*inverted_rgb.split(), a))
+
+
+def get_logo_paths(net, image_style, num_lines):
+    """
+    Return the S3 keys (full, thumbnail) of a network logo in the given style.
+    """
+    extra_tokens = get_style_settings(image_style, num_lines)["extra_tokens"]
+    return (
+        f"proc/images/resources/logo/logo-{net}{extra_tokens}.png",
+        f"proc/images/resources/logo/logo-{net}{extra_tokens}-thumb.png",
+    )
+
+
+# Function to generate the image and upload it to S3
+def generate_logo(net, image_style=ImageStyle.BANNER_ON_WHITE, force_generate=False):
+    """
+    Generate and upload a styled network logo and its thumbnail pyramid to S3.
+
+    Creates a full-size PNG and its thumbnail pyramid for the given network ID using the specified ImageStyle, rendering the network display name (from `logoName` or `fullName`, split on "|" into separate lines), a centered "litternetworks.org" URL line, and an optional "Volunteer" label for volunteer styles. If every output file already exists on S3, were generated from the current inputs, and `force_generate` is False, the function returns without modifying remote assets. The final images are uploaded to S3 at paths of the form `proc/images/resources/logo/logo-{net}{extra_tokens}.png`, with the pyramid levels (`...-thumb.png`, `...-w640.png` and so on) alongside.
+
+    Parameters:
+        net (str): Network identifier used to look up display name and to name output files.
+        image_style (ImageStyle): Visual style to apply (controls template, colors, scaling, and whether a "Volunteer" label is included).
+        force_generate (bool): If True, regenerate and upload images even if they already exist on S3; if False, skip generation when all files are present and up to date.
+    """
+    generate_logo_set(net, [image_style], force_generate=force_generate)
+
+
+def generate_logo_set(net, styles=None, force_generate=False, upload=True):
+    """
+    Generate several logo styles for a network in one pass.
+
+    Network info is fetched once, the text is laid out and rasterised once per template geometry, and each style is derived from that shared mask by colouring it onto its template (styles sharing template and colour, such as BLACK_AND_WHITE and WHITE_ALPHA, also share the render). Styles whose outputs are present and up to date are skipped unless `force_generate` is set.
+
+    Parameters:
+        net (str): Network identifier used to look up display name and to name output files.
+        styles (iterable[ImageStyle] | None): Styles to generate; defaults to every `ImageStyle`.
+        force_generate (bool): If True, regenerate every requested style even if it is up to date on S3.
+        upload (bool): If True, upload each full-size image and its thumbnail pyramid to S3; if False, return the rendered images instead.
+
+    Returns:
+        dict: Mapping of each generated `ImageStyle` to its uploaded `(full_key, thumb_key)` pair, or to its `(image, thumbnail)` pair when `upload` is False.
+
+    Raises:
+        LookupError: If the network's info cannot be retrieved or has no name; nothing is rendered.
+    """
+    styles = list(styles) if styles is not None else list(ImageStyle)
+
+    network_info = require_network_info(net, ("fullName",))
+    selected_network_logo_name = network_info.get("logoName") or network_info.get(
+        "fullName"
+    )
+
+    # Split network-name into lines (delimited by "|")
+    lines = selected_network_logo_name.split("|")
+
+    plans = []
+    for image_style in styles:
+        settings = get_style_settings(image_style, len(lines))
+        template_path = os.path.join(base_dir, "source", settings["template"])
+        plans.append((image_style, settings, template_path))
+
+    # Renders are shared between styles, but each is released once its last style is done
+    render_uses = Counter(
+        (template_path, settings["text_colour"]) for _, settings, template_path in plans
+    )
+
+    masks = {}
+    renders = {}
+    results = {}
+
+    for image_style, settings, template_path in plans:
+        logo_path, logo_thumb_path = get_logo_paths(net, image_style, len(lines))
+        render_key = (template_path, settings["text_colour"])
+        render_uses[render_key] -= 1
+        if render_uses[render_key]:
+            image = renders.get(render_key)
+        else:
+            image = renders.pop(render_key, None)
+
+        input_fingerprint = compute_fingerprint(
+            "logo",
+            RENDERER_VERSION,
+            {"logoName": selected_network_logo_name, "style": image_style.name},
+            [template_path, font_path, font_path_bold],
+        )
+
+        # ... and see if they already exist, up to date, on s3:
+        if force_generate is False:
+            if assets_are_current(pyramid_keys(logo_path), input_fingerprint):
+                continue
+
+        start_stages()
+        if image is None:
+            # Load the image
+            image = get_template(template_path)
+            end_stage("load")
+
+            mask_key = (
+                image.size,
+                settings["scaled"],
+                settings["text_y"],
+                settings["volunteer"],
+            )
+            mask = masks.get(mask_key)
+            if mask is None:
+                mask = render_text_mask(image.size, lines, *mask_key[1:])
+                masks[mask_key] = mask
+                end_stage("text")
+
+            image = apply_text_mask(image, mask, settings["text_colour"])
+            if render_uses[render_key]:
+                renders[render_key] = image
+
+        if settings["invert"]:
+            image = invert_rgb(image)
+
+        image_width, image_height = image.size
+        if settings["volunteer"] and len(lines) < 2:
             image_height -= 350
             image = image.crop((0, 0, image_width, image_height))
+        end_stage("composite")
 
-    if image_style == ImageStyle.WHITE_ALPHA:
-        # Separate alpha channel
-        r, g, b, a = image.split()
-        # Invert RGB channels
-        rgb_image = Image.merge("RGB", (r, g, b))
-        inverted_rgb = Image.eval(rgb_image, lambda x: 255 - x)
-        # Merge back with alpha
-        image = Image.merge("RGBA", (*inverted_rgb.split(), a))
-
-    # generate thumbnail version:
-    image_thumb = image.resize(
-        (int(image_width / 5), int(image_height / 5)), Image.Resampling.LANCZOS
-    )
+        if upload:
+            # Save the image and every thumbnail size to S3 using prepared paths
+            metadata = {"input-fingerprint": input_fingerprint}
+            save_image_pyramid(image, logo_path, metadata=metadata)
+            record_fingerprint(pyramid_keys(logo_path), input_fingerprint)
+            results[image_style] = (logo_path, logo_thumb_path)
+        else:
+            image_thumb = dict(build_thumbnail_pyramid(image))["-thumb"]
+            results[image_style] = (image, image_thumb)
 
-    # Save images to S3 using prepared paths
-    save_image_to_s3(image, logo_path)
-    save_image_to_s3(image_thumb, logo_thumb_path)
+    return results
 
 
 def main():
     """
     Generate logo images for networks in all predefined styles and upload them to S3.
 
-    When run in single-file mode (isSingleFileMode = True) this generates logos only for the hard-coded network "anfieldlitter". In the default mode it retrieves all network IDs via get_all_network_ids(), iterates them with a tqdm progress bar, and calls generate_logo for each network for the following ImageStyle values: BANNER_ON_WHITE, BANNER_ON_GREEN, BLACK_AND_WHITE, BLACK_AND_WHITE_VOLUNTEER, GREEN, GREEN_ALPHA, GREEN_ALPHA_VOLUNTEER, and WHITE_ALPHA. The local flags isSingleFileMode and isForceGenerate (both False by default) control single-network processing and whether generation is forced even if outputs already exist.
+    When run in single-file mode (isSingleFileMode = True) this generates logos only for the hard-coded network "anfieldlitter". In the default mode it retrieves all network IDs via get_all_network_ids(), iterates them with a tqdm progress bar, and calls generate_logo_set for each network to render every ImageStyle value in one pass. The local flags isSingleFileMode and isForceGenerate (both False by default) control single-network processing and whether generation is forced even if outputs already exist.
     """
     isSingleFileMode = False
     isForceGenerate = False
@@ -249,46 +380,11 @@ def main():
 
         from tqdm import tqdm
 
-        # Loop over each uniqueId and perform the desired action
+        # Loop over each uniqueId and generate every style in one pass
         for unique_id in tqdm(unique_ids, desc="Processing Logo Images"):
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.BANNER_ON_WHITE,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.BANNER_ON_GREEN,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.BLACK_AND_WHITE,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.BLACK_AND_WHITE_VOLUNTEER,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.GREEN,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.GREEN_ALPHA,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
-                net=unique_id,
-                image_style=ImageStyle.GREEN_ALPHA_VOLUNTEER,
-                force_generate=isForceGenerate,
-            )
-            generate_logo(
+            generate_logo_set(
                 net=unique_id,
-                image_style=ImageStyle.WHITE_ALPHA,
+                styles=list(ImageStyle),
                 force_generate=isForceGenerate,
             )
 
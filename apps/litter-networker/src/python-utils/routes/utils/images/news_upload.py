@@ -7,14 +7,28 @@ os.environ.setdefault("AWS_PROFILE", "ln")
 os.environ.setdefault("AWS_REGION", "eu-west-2")
 
 import boto3
+from botocore.exceptions import ClientError
+import concurrent.futures
 import hashlib
+import base64
+import json
+import math
+import multiprocessing
+import threading
+import warnings
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
 import requests
-from PIL import Image
+from PIL import Image, ImageCms, ImageFilter, ImageOps
 from io import BytesIO
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Initialize boto3 clients
-dynamodb = boto3.resource("dynamodb")
-s3 = boto3.client("s3")
+from routes.utils.batch.aws_concurrency import CLIENT_CONFIG, throttled_call
+from routes.utils.images.storage import S3Storage
 
 # Configuration
 DYNAMODB_TABLE = "LN-PressCuttings"
@@ -22,8 +36,94 @@ S3_BUCKET = "lnweb-public"
 S3_PREFIX = "proc/images/news/"
 TARGET_WIDTH = 800
 
-# DynamoDB table
-table = dynamodb.Table(DYNAMODB_TABLE)
+# Widths each news image is stored at. The `TARGET_WIDTH` rendition keeps the plain
+# "<hash>.jpg" key the site already uses; the others are stored as "<hash>-w<width>.jpg"
+RENDITION_WIDTHS = (320, 640, 800, 1200)
+
+# Width of the blurred placeholder written to each press cutting as a data URI
+PLACEHOLDER_WIDTH = 16
+
+# Attributes written back to each press cutting: the pixel size of its largest rendition
+# and the placeholder data URI
+IMAGE_ATTRIBUTES = ("imageWidth", "imageHeight", "imagePlaceholder")
+
+# Bump whenever a change to this module alters the stored JPEGs, so cached sources are
+# processed again on the next run
+NEWS_RENDER_VERSION = 3
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# sRGB profile that colour-managed sources are converted to
+SRGB_PROFILE = ImageCms.createProfile("sRGB")
+
+
+@dataclass
+class JpegProfile:
+    """
+    Settings for encoding news images as JPEG.
+
+    Attributes:
+        quality (int): libjpeg quality 1-95.
+        progressive (bool): Write a progressive JPEG, which renders a coarse preview early on slow connections.
+        optimize (bool): Compute optimised Huffman tables (smaller files, same pixels).
+        subsampling (str): Chroma subsampling, e.g. "4:2:0".
+    """
+
+    quality: int = 82
+    progressive: bool = True
+    optimize: bool = True
+    subsampling: str = "4:2:0"
+
+
+# Encoder profile used for every stored news image, and for the inline placeholders
+JPEG_PROFILE = JpegProfile()
+PLACEHOLDER_PROFILE = JpegProfile(quality=40, progressive=False)
+
+# Local file remembering the HTTP validators and content hash of each source image
+DEFAULT_VALIDATOR_CACHE = os.path.join(
+    os.path.expanduser("~"), ".cache", "litternetworks", "news-validators.json"
+)
+
+# DynamoDB table and S3 bucket (both called through the shared concurrency controller),
+# created by `connect` on first use so that importing this module, as every spawned
+# encode worker does, needs no AWS session
+table = None
+storage = None
+
+# Download settings: worker threads, concurrent requests per host (so one slow or
+# rate-limiting site cannot take every worker) and (connect, read) timeouts in seconds
+max_download_workers = 16
+max_requests_per_host = 4
+request_timeout = (5, 30)
+
+# Per-image limits: largest source download in bytes, and the largest decoded image
+# (at 4 bytes per pixel, after any reduced-scale JPEG decode) a worker may hold in memory
+max_image_bytes = 25 * 1024 * 1024
+max_image_memory = 256 * 1024 * 1024
+
+# Bytes read per chunk when streaming a download
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# Largest JPEG draft-mode reduction (1/8 scale per side)
+JPEG_MAX_REDUCTION = 8
+
+
+class OversizeImageError(Exception):
+    """
+    Raised when a source image exceeds the download size or decode memory limit. The image is skipped and reported; the rest of the batch carries on.
+    """
+
+
+def connect():
+    """
+    Create the DynamoDB table and S3 storage used by `process_images`, unless already set.
+    """
+    global table, storage
+    if table is None:
+        table = boto3.resource("dynamodb", config=CLIENT_CONFIG).Table(DYNAMODB_TABLE)
+    if storage is None:
+        storage = S3Storage(S3_BUCKET)
 
 
 # Hash function
@@ -59,91 +159,750 @@ def resize_image(image, width):
     return image
 
 
-# Check if file exists in S3
-def file_exists_in_s3(bucket, key):
+def rendition_keys(image_url):
     """
-    Check whether an object exists in the specified S3 bucket at the given key.
+    Return the S3 key of each rendition of a source image.
 
     Parameters:
-        bucket (str): Name of the S3 bucket.
-        key (str): S3 object key to check.
+        image_url (str): The source image URL.
 
     Returns:
-        bool: `True` if the object exists, `False` otherwise.
+        dict: Mapping of width to S3 key, for every width in `RENDITION_WIDTHS`.
     """
-    try:
-        s3.head_object(Bucket=bucket, Key=key)
+    hashed_image_name = hash_image_url(image_url)
+    return {
+        width: (
+            f"{S3_PREFIX}{hashed_image_name}.jpg"
+            if width == TARGET_WIDTH
+            else f"{S3_PREFIX}{hashed_image_name}-w{width}.jpg"
+        )
+        for width in RENDITION_WIDTHS
+    }
+
+
+def iter_press_cuttings():
+    """
+    Yield every item of the press cuttings table, reading the scan one page at a time.
+
+    Follows `LastEvaluatedKey` until the scan is complete, so items are processed while later pages are still to be read.
+
+    Yields:
+        dict: Table items.
+    """
+    params = {}
+    while True:
+        response = throttled_call("dynamodb", table.scan, **params)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def build_session(per_host=None):
+    """
+    Create a pooled HTTP session for downloading images.
+
+    Connections are kept alive and reused per host, and connection errors and 429/5xx responses are retried with backoff.
+
+    Parameters:
+        per_host (int, optional): Connections kept open per host; defaults to `max_requests_per_host`.
+
+    Returns:
+        requests.Session: The session.
+    """
+    per_host = per_host or max_requests_per_host
+    retry = Retry(
+        total=2,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max_download_workers, pool_maxsize=per_host, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HostLimiter:
+    """
+    Limits the number of concurrent requests to each host.
+    """
+
+    def __init__(self, limit):
+        """
+        Parameters:
+            limit (int): Requests allowed in flight per host.
+        """
+        self.limit = limit
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def slot(self, url):
+        """
+        Return the semaphore guarding the host of a URL (use it as a context manager).
+        """
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.limit)
+            return self._slots[host]
+
+
+class ValidatorCache:
+    """
+    Remembers, per source image URL, the HTTP validators (ETag / Last-Modified) and content hash of the last download, and the render version its JPEG was made with.
+
+    Lets later runs revalidate sources with conditional GETs and only reprocess images whose bytes actually changed. Persisted as a JSON file between runs.
+    """
+
+    def __init__(self, path=None):
+        """
+        Parameters:
+            path (str | None): JSON file to load from and save to; `None` keeps the cache in memory only.
+        """
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Return the entry for a URL (`etag`, `lastModified`, `hash`, `renderVersion`, `image`), or `None`.
+        """
+        return self._entries.get(url)
+
+    def record(self, url, etag=None, last_modified=None, content_hash=None, image=None):
+        """
+        Record the validators and content hash of a source whose JPEGs are current, with the image attributes written back to its press cuttings.
+        """
+        with self._lock:
+            self._entries[url] = {
+                "etag": etag,
+                "lastModified": last_modified,
+                "hash": content_hash,
+                "renderVersion": NEWS_RENDER_VERSION,
+                "image": image,
+            }
+
+    def load(self):
+        """
+        Load the cache from `path`, if it exists.
+
+        Returns:
+            bool: `True` if a cache was loaded.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            print(f"Warning: Ignoring unreadable validator cache {self.path}")
+            return False
+        with self._lock:
+            self._entries = data.get("entries", {})
         return True
-    except s3.exceptions.ClientError:
-        return False
+
+    def save(self):
+        """
+        Write the cache to `path` (no-op when no path is configured).
+        """
+        if not self.path:
+            return
+        with self._lock:
+            data = {"entries": dict(self._entries)}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(data, handle)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class NewsRender:
+    """
+    The stored renditions of one source image and the attributes describing them.
+
+    Attributes:
+        renditions (dict): Mapping of width (from `RENDITION_WIDTHS`) to JPEG data.
+        width (int): Pixel width of the largest rendition (sources are never upscaled).
+        height (int): Pixel height of the largest rendition.
+        placeholder (str): Tiny blurred preview as a `data:image/jpeg;base64,` URI.
+    """
+
+    renditions: dict
+    width: int
+    height: int
+    placeholder: str
+
+    def attributes(self):
+        """
+        Return the attributes written back to the press cutting items (named in `IMAGE_ATTRIBUTES`).
+        """
+        return dict(zip(IMAGE_ATTRIBUTES, (self.width, self.height, self.placeholder)))
+
+
+@dataclass
+class Download:
+    """
+    Result of downloading a source image.
+
+    Attributes:
+        data (bytes | None): The image data, or `None` when the server answered 304 Not Modified.
+        etag (str | None): The response ETag.
+        last_modified (str | None): The response Last-Modified header.
+    """
+
+    data: Optional[bytes]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
 
 
 # Download image from the given URL
-def download_image(url):
+def download_image(session, url, host_limiter=None, validators=None, max_bytes=None):
     """
-    Download an image from the given URL and return it as a PIL Image.
+    Download an image from the given URL, conditionally when validators from an earlier download are given.
+
+    The body is streamed and abandoned as soon as it is known to exceed `max_bytes`: straight away when the Content-Length header says so, else once that many bytes have been read.
 
     Parameters:
+        session (requests.Session): Pooled session to download with (see `build_session`).
         url (str): The HTTP(S) URL of the image to download.
+        host_limiter (HostLimiter, optional): Limits concurrent requests to the URL's host.
+        validators (dict, optional): Cache entry with `etag` / `lastModified`, sent as If-None-Match / If-Modified-Since.
+        max_bytes (int, optional): Largest body to accept. Defaults to `max_image_bytes`.
 
     Returns:
-        Image.Image: A PIL Image object opened from the downloaded content.
+        Download: The image data (`None` if not modified) and the response validators.
 
     Raises:
-        Exception: If the HTTP GET response status is not 200.
+        OversizeImageError: If the body is larger than `max_bytes`.
+        Exception: If the HTTP GET response status is not 200 (or 304 for a conditional request).
+        requests.RequestException: If the request fails or times out.
     """
-    response = requests.get(url)
-    if response.status_code == 200:
-        return Image.open(BytesIO(response.content))
-    else:
-        raise Exception(f"Failed to download image: {url}")
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("lastModified"):
+            headers["If-Modified-Since"] = validators["lastModified"]
+
+    max_bytes = max_bytes or max_image_bytes
+
+    with host_limiter.slot(url) if host_limiter else nullcontext():
+        with session.get(
+            url, headers=headers, timeout=request_timeout, stream=True
+        ) as response:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if response.status_code == 304 and headers:
+                return Download(None, etag, last_modified)
+            if response.status_code != 200:
+                raise Exception(f"Failed to download image: {url}")
+
+            content_length = response.headers.get("Content-Length", "")
+            if content_length.isdigit() and int(content_length) > max_bytes:
+                raise OversizeImageError(
+                    f"{url} is {int(content_length)} bytes (limit {max_bytes})"
+                )
 
+            body = bytearray()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                body += chunk
+                if len(body) > max_bytes:
+                    raise OversizeImageError(
+                        f"{url} is over the {max_bytes}-byte limit"
+                    )
+    return Download(bytes(body), etag, last_modified)
 
-# Main function to process images
-def process_images(force=False):
-    # Scan the DynamoDB table
+
+def open_for_width(data, width):
     """
-    Process image URLs stored in the DynamoDB table and upload resized JPEGs to S3.
+    Open an image, letting the JPEG decoder downscale it while decoding when it is much wider than needed.
 
-    Scans all items in the configured DynamoDB table, and for each item with an `imageUrl`:
-    - Computes a deterministic hashed filename and target S3 key.
-    - Skips uploading if the S3 key already exists unless `force` is True.
-    - Downloads the image, resizes it to the configured target width, encodes it as JPEG, and uploads it to the configured S3 bucket with content type `image/jpeg`.
-    - Prints progress messages for skipped, uploaded, and error cases.
+    JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale using the DCT, which costs a fraction of a full decode. The largest reduction that keeps the (EXIF-oriented) image at least `width` wide is chosen, so the final resize still filters properly.
 
     Parameters:
-        force (bool): If True, reprocess and upload images even when the target S3 key already exists. Defaults to False.
-    """
-    response = table.scan()
-    for item in response["Items"]:
-        image_url = item.get("imageUrl")
-        if image_url:
-            hashed_image_name = hash_image_url(image_url)
-            s3_key = f"{S3_PREFIX}{hashed_image_name}.jpg"
-
-            # Skip if file exists and force is not set
-            if not force and file_exists_in_s3(S3_BUCKET, s3_key):
-                print(f"File already exists: {s3_key}, skipping.")
-                continue
+        data (bytes): The encoded image.
+        width (int): Width the image will be resized to.
+
+    Returns:
+        PIL.Image.Image: The opened (possibly reduced) image, not yet loaded.
+    """
+    image = Image.open(BytesIO(data))
+    if image.format == "JPEG":
+        transposed = image.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS
+        shown_width = image.height if transposed else image.width
+        if shown_width > width:
+            scale = width / shown_width
+            image.draft(
+                None, (math.ceil(image.width * scale), math.ceil(image.height * scale))
+            )
+    return image
+
+
+@contextmanager
+def pixel_limit(max_pixels):
+    """
+    Temporarily set Pillow's decompression bomb limit, so opening an image of more than `max_pixels` raises `Image.DecompressionBombError` (and smaller ones do not warn).
+
+    Pillow counts pixels when an image is opened, before any reduced-scale decode, so its process-wide default would reject large JPEGs that decode cheaply in draft mode. Only used around single `Image.open` calls in encode worker processes, which run one image at a time; the limit is restored on exit.
+
+    Parameters:
+        max_pixels (int): Largest pixel count to open.
+    """
+    previous = Image.MAX_IMAGE_PIXELS
+    # Pillow warns above MAX_IMAGE_PIXELS and raises above twice it
+    Image.MAX_IMAGE_PIXELS = max_pixels // 2
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            yield
+    finally:
+        Image.MAX_IMAGE_PIXELS = previous
+
+
+def to_srgb(image):
+    """
+    Convert a decoded image to RGB (or keep greyscale) suitable for a JPEG.
+
+    Sources with an embedded ICC profile (including CMYK press photos) are colour-converted to sRGB; transparent areas are flattened onto white.
+
+    Parameters:
+        image (PIL.Image.Image): The decoded image.
+
+    Returns:
+        PIL.Image.Image: An "RGB" or "L" image.
+    """
+    # Read the profile first: conversions and flattening return images without it
+    icc_profile = image.info.get("icc_profile")
+
+    if image.mode in ("P", "PA") or image.mode.startswith("I"):
+        image = image.convert("RGBA" if image.mode in ("P", "PA") else "L")
+    if image.mode in ("RGBA", "LA", "RGBa", "La"):
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert("RGBA")).convert("RGB")
+
+    if icc_profile and image.mode in ("RGB", "CMYK"):
+        try:
+            return ImageCms.profileToProfile(
+                image,
+                ImageCms.ImageCmsProfile(BytesIO(icc_profile)),
+                SRGB_PROFILE,
+                outputMode="RGB",
+            )
+        except (ImageCms.PyCMSError, OSError):
+            pass  # Unusable profile: fall back to a plain conversion
+    return image if image.mode == "L" else image.convert("RGB")
+
+
+def encode_jpeg(image, profile=None):
+    """
+    Encode an RGB or greyscale image as JPEG using an encoder profile.
+
+    Parameters:
+        image (PIL.Image.Image): The image to encode.
+        profile (JpegProfile, optional): Encoder settings; defaults to `JPEG_PROFILE`.
+
+    Returns:
+        bytes: The JPEG data.
+    """
+    profile = profile or JPEG_PROFILE
+    buffer = BytesIO()
+    image.save(
+        buffer,
+        format="JPEG",
+        quality=profile.quality,
+        progressive=profile.progressive,
+        optimize=profile.optimize,
+        subsampling=profile.subsampling,
+    )
+    return buffer.getvalue()
+
+
+def check_image_memory(image, max_memory):
+    """
+    Check, from the header alone, that decoding an opened image stays within a memory budget.
+
+    Parameters:
+        image (PIL.Image.Image): The opened (not yet loaded) image, after any `draft` reduction.
+        max_memory (int): Largest decoded size in bytes, counted at 4 bytes per pixel.
+
+    Raises:
+        OversizeImageError: If the image is over budget.
+    """
+    width, height = image.size
+    needed = width * height * 4
+    if needed > max_memory:
+        raise OversizeImageError(
+            f"{width}x{height} image needs {needed // (1024 * 1024)} MB to decode "
+            f"(limit {max_memory // (1024 * 1024)} MB)"
+        )
+
+
+def encode_placeholder(image):
+    """
+    Return a tiny, heavily compressed preview of an image as a JPEG data URI, for the page to show (blurred) while the real image loads.
+    """
+    jpeg = encode_jpeg(
+        resize_image(image, PLACEHOLDER_WIDTH).filter(ImageFilter.GaussianBlur(0.5)),
+        PLACEHOLDER_PROFILE,
+    )
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+
+
+def encode_news_image(data, max_memory=None):
+    """
+    Decode a downloaded image and encode it as a JPEG at each of `RENDITION_WIDTHS`, plus an inline placeholder.
+
+    JPEG sources are decoded at a reduced scale where possible (see `open_for_width`), EXIF orientation is applied and colours are converted to sRGB before resizing. The pixel count is read from the header and checked against the memory budget before anything is decoded. Each rendition is resized from the next larger one, and sources are never upscaled. Runs in a worker process, so it only takes bytes and returns plain data.
+
+    Parameters:
+        data (bytes): The downloaded image data.
+        max_memory (int, optional): Decode memory budget in bytes. Defaults to `max_image_memory`.
+
+    Returns:
+        NewsRender: The renditions and their attributes.
+
+    Raises:
+        OversizeImageError: If the image is over the memory budget.
+    """
+    max_memory = max_memory or max_image_memory
+
+    # Let Pillow open anything that could fit the budget after a 1/8-scale JPEG decode;
+    # `check_image_memory` then applies the budget to the size actually decoded
+    try:
+        with pixel_limit(max_memory // 4 * JPEG_MAX_REDUCTION**2):
+            image = open_for_width(data, max(RENDITION_WIDTHS))
+    except Image.DecompressionBombError as e:
+        raise OversizeImageError(str(e)) from None
+    check_image_memory(image, max_memory)
+    image = to_srgb(ImageOps.exif_transpose(image))
+
+    renditions = {}
+    largest = None
+    for width in sorted(RENDITION_WIDTHS, reverse=True):
+        image = resize_image(image, width)
+        largest = largest or image.size
+        renditions[width] = encode_jpeg(image)
+
+    return NewsRender(renditions, *largest, encode_placeholder(image))
+
+
+@dataclass
+class NewsJob:
+    """
+    One source image moving through the fetch, encode and upload stages of `process_images`.
+
+    Attributes:
+        image_url (str): The source image URL.
+        s3_keys (dict): S3 key of each rendition (see `rendition_keys`).
+        entry (dict | None): The source's validator cache entry.
+        current (bool): Whether its stored renditions were made by the current render version from the cached source, so it only needs revalidating.
+        download (Download | None): The fetched source, once downloaded.
+        content_hash (str | None): SHA-256 of the downloaded bytes.
+        render (NewsRender | None): The encoded renditions, until they are uploaded.
+    """
+
+    image_url: str
+    s3_keys: dict
+    entry: Optional[dict]
+    current: bool
+    download: Optional[Download] = None
+    content_hash: Optional[str] = None
+    render: Optional[NewsRender] = None
+
+
+def fetch_image(session, host_limiter, job):
+    """
+    Download (or, for a current job, conditionally revalidate) the source image of a job and hash it. Runs on an I/O thread.
+
+    Returns:
+        NewsJob: The job, with `download` and `content_hash` set (`download.data` is `None` if the source was not modified).
+
+    Raises:
+        OversizeImageError: If the source is over the download size limit.
+    """
+    job.download = download_image(
+        session,
+        job.image_url,
+        host_limiter,
+        validators=job.entry if job.current else None,
+    )
+    if job.download.data is not None:
+        job.content_hash = hashlib.sha256(job.download.data).hexdigest()
+    return job
+
+
+def upload_renditions(job):
+    """
+    Upload the encoded renditions of a job to S3. Runs on an I/O thread.
+
+    Returns:
+        NewsJob: The job.
+    """
+    for width, jpeg in job.render.renditions.items():
+        storage.write(job.s3_keys[width], BytesIO(jpeg), "image/jpeg")
+    print(
+        f"Uploaded: {job.s3_keys[TARGET_WIDTH]} ({len(job.render.renditions)} widths)"
+    )
+    return job
+
 
-            try:
-                # Download and process the image
-                image = download_image(image_url)
-                resized_image = resize_image(image, TARGET_WIDTH)
+def record_source(cache, job, image):
+    """
+    Record a job's source validators, content hash and image attributes once its stored renditions are current.
+    """
+    entry = job.entry or {}
+    cache.record(
+        job.image_url,
+        etag=job.download.etag or entry.get("etag"),
+        last_modified=job.download.last_modified or entry.get("lastModified"),
+        content_hash=job.content_hash,
+        image=image,
+    )
 
-                # Save the image to a buffer
-                buffer = BytesIO()
-                resized_image.save(buffer, format="JPEG")
-                buffer.seek(0)
 
-                # Upload to S3
-                s3.put_object(
-                    Bucket=S3_BUCKET, Key=s3_key, Body=buffer, ContentType="image/jpeg"
+def press_cutting_key_names():
+    """
+    Return the names of the press cuttings table's key attributes.
+    """
+    key_schema = throttled_call("dynamodb", lambda: table.key_schema)
+    return [key["AttributeName"] for key in key_schema]
+
+
+def update_press_cutting(key, image):
+    """
+    Set the image attributes of one press cutting, if the item still exists.
+
+    Parameters:
+        key (dict): The item's key attributes.
+        image (dict): Attributes to set (see `NewsRender.attributes`).
+
+    Returns:
+        bool: `True` if the item was updated, `False` if it was deleted since the scan.
+    """
+    names = {f"#{name}": name for name in image}
+    names.update({f"#key{i}": name for i, name in enumerate(key)})
+    try:
+        throttled_call(
+            "dynamodb",
+            table.update_item,
+            Key=key,
+            UpdateExpression="SET " + ", ".join(f"#{n} = :{n}" for n in image),
+            ConditionExpression=" AND ".join(
+                f"attribute_exists(#key{i})" for i in range(len(key))
+            ),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f":{n}": value for n, value in image.items()},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return False
+        raise
+    return True
+
+
+def write_image_attributes(targets, images, pool):
+    """
+    Write the image attributes back to every press cutting whose stored values differ, as one batch of concurrent updates at the end of a run.
+
+    DynamoDB's batch writes can only replace whole items, so each item is updated with its own `UpdateItem` call (touching only the image attributes), run on the given pool through the shared concurrency controller.
+
+    Parameters:
+        targets (list[tuple]): `(primary S3 key, item key, current image attributes)` of each press cutting.
+        images (dict): Image attributes by primary S3 key, for the images processed this run.
+        pool (concurrent.futures.Executor): Pool to run the updates on.
+
+    Returns:
+        dict: Numbers of items "updated", "gone" (deleted since the scan, so not recreated) and "failed".
+    """
+    futures = {}
+    for s3_key, key, current in targets:
+        image = images.get(s3_key)
+        if image and any(current.get(name) != value for name, value in image.items()):
+            futures[pool.submit(update_press_cutting, key, image)] = key
+
+    written = {"updated": 0, "gone": 0, "failed": 0}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            written["updated" if future.result() else "gone"] += 1
+        except Exception as e:
+            written["failed"] += 1
+            print(f"Error updating press cutting {futures[future]}: {str(e)}")
+    return written
+
+
+# Main function to process images
+def process_images(
+    force=False,
+    download_workers=None,
+    encode_workers=None,
+    validator_cache=DEFAULT_VALIDATOR_CACHE,
+):
+    """
+    Process image URLs stored in the DynamoDB table, upload resized JPEGs to S3 and write the image attributes back to the table.
+
+    Streams every page of the configured DynamoDB table, and for each item with an `imageUrl`:
+    - Computes a deterministic hashed filename and the S3 key of each rendition (see `rendition_keys`).
+    - Checks whether every rendition is already stored (against one listing of `S3_PREFIX`, not a request per item).
+    - If it is stored and its source is in the validator cache, revalidates the source with a conditional GET and only reprocesses it if its bytes changed. If it is stored but not cached, skips it unless `force` is True.
+    - Otherwise downloads the image through a pooled session (at most `max_requests_per_host` at once per host, with timeouts), then resizes and encodes it as a JPEG at each of `RENDITION_WIDTHS` in a process pool and uploads them to the configured S3 bucket with content type `image/jpeg`. Each stage is started from this thread when the previous one finishes (see `NewsJob`), so no I/O thread is held waiting for an encode.
+    - Skips and reports sources over `max_image_bytes` or whose decoded size is over `max_image_memory`.
+    - Prints progress messages for uploaded and error cases, and a summary at the end.
+
+    Finally the largest rendition's `imageWidth` / `imageHeight` and an `imagePlaceholder` data URI are set on every item whose values changed, so the news page can pick a width and reserve layout space (see `write_image_attributes`).
+
+    Parameters:
+        force (bool): If True, also download sources that have no validator cache entry and reprocess them, even when the target S3 key already exists. Defaults to False.
+        download_workers (int, optional): Concurrent downloads and uploads. Defaults to `max_download_workers`.
+        encode_workers (int, optional): Resize / encode processes. Defaults to the CPU count.
+        validator_cache (str | None, optional): JSON file persisting source validators between runs. Defaults to `DEFAULT_VALIDATOR_CACHE`; `None` disables it.
+
+    Returns:
+        dict: Counts of images "uploaded", "unchanged" (revalidated), "skipped" (stored and not revalidated, or duplicate), "oversize" and "failed", and of press cuttings "updated" and "gone" (deleted during the run).
+    """
+    connect()
+    download_workers = download_workers or max_download_workers
+    existing = set(storage.list(S3_PREFIX))
+    counts = {
+        "uploaded": 0,
+        "unchanged": 0,
+        "skipped": 0,
+        "oversize": 0,
+        "failed": 0,
+        "updated": 0,
+        "gone": 0,
+    }
+    seen = set()
+
+    # Every press cutting to write image attributes back to, and those attributes by
+    # primary S3 key (duplicate URLs share one entry)
+    key_names = press_cutting_key_names()
+    targets = []
+    images = {}
+
+    cache = ValidatorCache(validator_cache)
+    cache.load()
+
+    session = build_session()
+    host_limiter = HostLimiter(max_requests_per_host)
+
+    # Encode workers are spawned, not forked from this process with its threads, HTTP
+    # session and boto3 clients
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=encode_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as encode_pool, concurrent.futures.ThreadPoolExecutor(
+        max_workers=download_workers
+    ) as io_pool:
+        running = {}
+
+        def finish(job, outcome, image):
+            counts[outcome] += 1
+            record_source(cache, job, image)
+            if image:
+                images[job.s3_keys[TARGET_WIDTH]] = image
+
+        def advance(stage, job, result):
+            # Hand a job whose stage finished on to its next stage; every stage is
+            # started from this thread, and no thread waits on another pool
+            if stage == "fetch":
+                entry = job.entry or {}
+                if job.download.data is None:
+                    counts["unchanged"] += 1
+                    if entry.get("image"):
+                        images[job.s3_keys[TARGET_WIDTH]] = entry["image"]
+                elif job.current and job.content_hash == entry.get("hash"):
+                    finish(job, "unchanged", entry.get("image"))
+                else:
+                    future = encode_pool.submit(
+                        encode_news_image, job.download.data, max_image_memory
+                    )
+                    job.download.data = None
+                    running[future] = ("encode", job)
+            elif stage == "encode":
+                job.render = result
+                running[io_pool.submit(upload_renditions, job)] = ("upload", job)
+            else:
+                image = job.render.attributes()
+                job.render = None
+                finish(job, "uploaded", image)
+
+        def collect(return_when):
+            done, _ = concurrent.futures.wait(running, return_when=return_when)
+            for future in done:
+                stage, job = running.pop(future)
+                try:
+                    advance(stage, job, future.result())
+                except OversizeImageError as e:
+                    counts["oversize"] += 1
+                    print(f"Warning: Skipping oversize image {job.image_url}: {str(e)}")
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"Error processing image {job.image_url}: {str(e)}")
+
+        for item in iter_press_cuttings():
+            image_url = item.get("imageUrl")
+            if not image_url:
+                continue
+            s3_keys = rendition_keys(image_url)
+            s3_key = s3_keys[TARGET_WIDTH]
+            if all(name in item for name in key_names):
+                targets.append(
+                    (
+                        s3_key,
+                        {name: item[name] for name in key_names},
+                        {name: item.get(name) for name in IMAGE_ATTRIBUTES},
+                    )
                 )
-                print(f"Uploaded: {s3_key}")
 
-            except Exception as e:
-                print(f"Error processing image {image_url}: {str(e)}")
+            # Skip duplicates, and stored images that cannot be revalidated unless forced
+            stored = all(key in existing for key in s3_keys.values())
+            if s3_key in seen or (
+                stored and not force and cache.get(image_url) is None
+            ):
+                counts["skipped"] += 1
+                continue
+            seen.add(s3_key)
+
+            # Keep the scan only a little ahead of the downloads
+            while len(running) >= download_workers * 2:
+                collect(concurrent.futures.FIRST_COMPLETED)
+            entry = cache.get(image_url)
+            job = NewsJob(
+                image_url,
+                s3_keys,
+                entry,
+                current=stored
+                and entry is not None
+                and entry.get("renderVersion") == NEWS_RENDER_VERSION,
+            )
+            running[io_pool.submit(fetch_image, session, host_limiter, job)] = (
+                "fetch",
+                job,
+            )
+
+        try:
+            while running:
+                collect(concurrent.futures.FIRST_COMPLETED)
+        finally:
+            cache.save()
+            written = write_image_attributes(targets, images, io_pool)
+            counts["updated"] = written["updated"]
+            counts["gone"] = written["gone"]
+            counts["failed"] += written["failed"]
+
+    print(
+        f"News images: {counts['uploaded']} uploaded, "
+        f"{counts['unchanged']} unchanged at source, "
+        f"{counts['skipped']} skipped, {counts['oversize']} oversize, "
+        f"{counts['failed']} failed; {counts['updated']} press cuttings updated, "
+        f"{counts['gone']} deleted during the run"
+    )
+    return counts
 
 
 if __name__ == "__main__":
@@ -154,8 +913,37 @@ if __name__ == "__main__":
     parser.add_argument(
         "--force",
         action="store_true",
-        help="Force upload even if the file exists in S3",
+        help="Also reprocess stored images whose sources have no cached validators",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help=f"Concurrent downloads (default {max_download_workers})",
+    )
+    parser.add_argument(
+        "--validator-cache",
+        default=DEFAULT_VALIDATOR_CACHE,
+        help="JSON file remembering source ETags / hashes ('' to disable)",
+    )
+    parser.add_argument(
+        "--max-image-mb",
+        type=float,
+        default=max_image_bytes / (1024 * 1024),
+        help="Largest source image to download, in MB",
+    )
+    parser.add_argument(
+        "--max-image-memory-mb",
+        type=float,
+        default=max_image_memory / (1024 * 1024),
+        help="Largest decoded image a worker may hold, in MB",
     )
     args = parser.parse_args()
 
-    process_images(force=args.force)
+    max_image_bytes = int(args.max_image_mb * 1024 * 1024)
+    max_image_memory = int(args.max_image_memory_mb * 1024 * 1024)
+
+    process_images(
+        force=args.force,
+        download_workers=args.workers,
+        validator_cache=args.validator_cache or None,
+    )
@@ -9,8 +9,20 @@ import boto3
 from botocore.exceptions import ClientError
 from urllib.parse import quote_plus
 
-from routes.utils.info.network_info import get_network_info, get_all_network_ids
-from routes.utils.images.image_utils import save_image_to_s3, image_exists_on_s3
+from routes.utils.info.network_info import require_network_info, get_all_network_ids
+from routes.utils.images.image_utils import (
+    save_image_to_s3,
+    apply_transparency_key,
+)
+from routes.utils.images.asset_fingerprints import (
+    compute_fingerprint,
+    assets_are_current,
+    record_fingerprint,
+)
+from routes.utils.images.stage_timing import start_stages, end_stage
+
+# Bump whenever a change to this module alters the generated images
+RENDERER_VERSION = 1
 
 
 def generate_qr(network, no_background=False, force_generate=False):
@@ -20,9 +32,10 @@ def generate_qr(network, no_background=False, force_generate=False):
     Parameters:
         network (str): Network identifier to encode in the QR (use "all" to encode the base URL without a network suffix).
         no_background (bool): If True, remove the image background (make non-black pixels transparent) before saving.
-        force_generate (bool): If True, regenerate and overwrite the image on S3 even if it already exists.
+        force_generate (bool): If True, regenerate and overwrite the image on S3 even if it already exists and is up to date; otherwise it is only regenerated when missing or when its input fingerprint changed.
 
     Raises:
+        LookupError: If the network's info cannot be retrieved or has no short id; nothing is rendered.
         Exception: If the remote QR service returns a non-200 response when fetching the QR image.
     """
     is_all = network == "all"
@@ -34,16 +47,22 @@ def generate_qr(network, no_background=False, force_generate=False):
         else f"proc/images/resources/qr/qr-{network}-nobg.png"
     )
 
-    # ... and see if they already exist on s3:
-    if force_generate is False:
-        if image_exists_on_s3(s3_key):
-            return
-
     selected_network_short_name = None
     if not is_all:
-        selected_network_info = get_network_info(network)
+        selected_network_info = require_network_info(network, ("shortId",))
         selected_network_short_name = selected_network_info["shortId"]
 
+    input_fingerprint = compute_fingerprint(
+        "qr",
+        RENDERER_VERSION,
+        {"shortId": selected_network_short_name, "noBackground": no_background},
+    )
+
+    # ... and see if it already exists, up to date, on s3:
+    if force_generate is False:
+        if assets_are_current([s3_key], input_fingerprint):
+            return
+
     # Construct the QR code image URL
     base_data_url = "https://www.litternetworks.org"
     if not is_all and selected_network_short_name:
@@ -51,6 +70,7 @@ def generate_qr(network, no_background=False, force_generate=False):
     image_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&data={quote_plus(base_data_url)}"
 
     # Fetch the QR code image
+    start_stages()
     try:
         response = requests.get(image_url, timeout=10)
         response.raise_for_status()
@@ -58,13 +78,17 @@ def generate_qr(network, no_background=False, force_generate=False):
         raise RuntimeError(f"Failed to fetch QR image for network '{network}'") from exc
 
     image = Image.open(BytesIO(response.content))
+    image.load()
+    end_stage("load")
 
     # If no background flag is set, remove the background
     if no_background:
         image = remove_background(image)
+    end_stage("composite")
 
     # save image to s3:
-    save_image_to_s3(image, s3_key)
+    save_image_to_s3(image, s3_key, metadata={"input-fingerprint": input_fingerprint})
+    record_fingerprint([s3_key], input_fingerprint)
 
 
 def remove_background(image):
@@ -75,19 +99,10 @@ def remove_background(image):
         image (PIL.Image.Image): Image to process; will be converted to RGBA if needed.
 
     Returns:
-        PIL.Image.Image: The same image object with every pixel whose RGB components are not all zero replaced by (0, 0, 0, 0) (fully transparent).
+        PIL.Image.Image: An RGBA image with every pixel whose RGB components are not all zero replaced by (0, 0, 0, 0) (fully transparent).
     """
-    image = image.convert("RGBA")
-    width, height = image.size
-
-    # Loop through each pixel and make non-black pixels transparent
-    for y in range(height):
-        for x in range(width):
-            r, g, b, _ = image.getpixel((x, y))
-            if r != 0 or g != 0 or b != 0:
-                image.putpixel((x, y), (0, 0, 0, 0))  # Make pixel fully transparent
-
-    return image
+    # Key on pure black and keep only the matching pixels
+    return apply_transparency_key(image, colour=(0, 0, 0), invert=True)
 
 
 def main():
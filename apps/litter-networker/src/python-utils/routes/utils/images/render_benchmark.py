@@ -0,0 +1,375 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+from unittest import mock
+
+import PIL
+from PIL import Image
+
+from routes.utils.images import (
+    asset_fingerprints,
+    flyer_generate,
+    image_utils,
+    logo_generate,
+    qr_generate,
+)
+from routes.utils.images.encoding import ENCODER_POLICIES
+from routes.utils.images.logo_generate import ImageStyle
+from routes.utils.images.stage_timing import collect_stage_timings
+from routes.utils.info import network_info
+
+# Synthetic network records covering short, long and "|"-split names
+SYNTHETIC_NETWORKS = [
+    {
+        "uniqueId": "bench-short",
+        "shortId": "bootle",
+        "fullName": "Bootle",
+        "logoName": "Bootle",
+        "contactEmail": "",
+    },
+    {
+        "uniqueId": "bench-long",
+        "shortId": "muchwenlockanddistrict",
+        "fullName": "Much Wenlock and District Community",
+        "logoName": "",
+        "contactEmail": "much.wenlock.and.district.community@litternetworks.org",
+    },
+    {
+        "uniqueId": "bench-two-line",
+        "shortId": "anfield",
+        "fullName": "Anfield",
+        "logoName": "Anfield|Litter Pickers",
+        "contactEmail": "anfield@litternetworks.org",
+    },
+    {
+        "uniqueId": "bench-long-two-line",
+        "shortId": "stokenorth",
+        "fullName": "Stoke-on-Trent North and Kidsgrove",
+        "logoName": "Stoke-on-Trent North|and Kidsgrove Volunteers",
+        "contactEmail": "stoke.north@litternetworks.org",
+    },
+]
+
+
+class BenchmarkStorage:
+    """
+    In-memory storage backend that records what the generators write, so rendering is measured without any I/O.
+    """
+
+    location = "memory://benchmark"
+
+    def __init__(self):
+        self.objects = {}
+
+    def exists(self, key):
+        return key in self.objects
+
+    def read(self, key, length=None):
+        data = self.objects.get(key)
+        return data[:length] if data is not None and length else data
+
+    def write(self, key, body, content_type, cache_control=None, metadata=None):
+        self.objects[key] = body.read()
+
+    def list(self, prefix, start_after=None):
+        return {}
+
+
+def synthetic_qr_png(seed, size=300, modules=29):
+    """
+    Return PNG bytes of a black-and-white QR-like grid, standing in for the remote QR service.
+    """
+    rng = random.Random(seed)
+    grid = Image.new("1", (modules, modules), 1)
+    grid.putdata([rng.random() < 0.5 for _ in range(modules * modules)])
+    image = grid.resize((size, size), Image.Resampling.NEAREST).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def build_cases(networks=None):
+    """
+    Return the benchmark cases as `(name, kind, network_id, func, args)` tuples: both QR variants, the flyer and each logo style for every record.
+    """
+    networks = SYNTHETIC_NETWORKS if networks is None else networks
+    cases = []
+    for info in networks:
+        net = info["uniqueId"]
+        cases.append(
+            (f"qr:{net}", "qr", net, qr_generate.generate_qr, (net, False, True))
+        )
+        cases.append(
+            (f"qr-nobg:{net}", "qr", net, qr_generate.generate_qr, (net, True, True))
+        )
+        cases.append(
+            (f"flyer:{net}", "flyer", net, flyer_generate.generate_flyer, (net, True))
+        )
+        for style in ImageStyle:
+            cases.append(
+                (
+                    f"logo-{style.name.lower()}:{net}",
+                    "logo",
+                    net,
+                    logo_generate.generate_logo_set,
+                    (net, [style], True),
+                )
+            )
+    return cases
+
+
+@contextmanager
+def stubbed_environment(networks, storage):
+    """
+    Point the generators at synthetic network records, a synthetic QR service and in-memory storage.
+    """
+    by_id = {info["uniqueId"]: info for info in networks}
+    qr_pngs = {info["shortId"]: synthetic_qr_png(info["shortId"]) for info in networks}
+
+    def fake_get(url, timeout=None):
+        short_id = url.rsplit("%2F", 1)[-1]
+        return mock.Mock(content=qr_pngs.get(short_id, synthetic_qr_png(short_id)))
+
+    settings = image_utils.output_settings()
+    inventory = image_utils.asset_inventory
+    fingerprint_store = asset_fingerprints.fingerprint_store
+    with ExitStack() as stack:
+        stack.enter_context(
+            mock.patch.object(network_info, "get_network_info", by_id.__getitem__)
+        )
+        stack.enter_context(mock.patch.object(qr_generate.requests, "get", fake_get))
+        image_utils.use_storage(storage)
+        image_utils.use_asset_inventory(None)
+        asset_fingerprints.use_fingerprint_store(None)
+        try:
+            yield
+        finally:
+            image_utils.apply_output_settings(settings)
+            image_utils.use_asset_inventory(inventory)
+            asset_fingerprints.use_fingerprint_store(fingerprint_store)
+
+
+def run_case(func, args, storage, trace_memory=False):
+    """
+    Run one generator call and measure it.
+
+    Returns:
+        dict: Wall time, per-stage seconds, output bytes and object count, plus the tracemalloc peak when `trace_memory` is set.
+    """
+    before = dict(storage.objects)
+    if trace_memory:
+        tracemalloc.reset_peak()
+
+    with collect_stage_timings() as stages:
+        start = time.perf_counter()
+        func(*args)
+        wall = time.perf_counter() - start
+
+    written = {
+        key: data
+        for key, data in storage.objects.items()
+        if before.get(key) is not data
+    }
+    result = {
+        "wall_s": wall,
+        "stages_s": dict(stages),
+        "output_bytes": sum(len(data) for data in written.values()),
+        "outputs": len(written),
+    }
+    if trace_memory:
+        result["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    return result
+
+
+def run_benchmark(
+    networks=None,
+    repeat=3,
+    png_policy="optimized",
+    companions=(),
+    trace_memory=True,
+    kinds=None,
+):
+    """
+    Render the synthetic corpus and report per-case timings, memory and output size.
+
+    Each case is timed `repeat` times without tracing (tracemalloc slows Python code down), then run once more under tracemalloc for its Python-heap peak. Pillow allocates pixel buffers outside the Python allocator, so the process-wide peak RSS is reported as well.
+
+    Parameters:
+        networks (list[dict], optional): Network records to render; defaults to `SYNTHETIC_NETWORKS`.
+        repeat (int): Timed runs per case.
+        png_policy (str): PNG encoder policy name from `ENCODER_POLICIES`.
+        companions (iterable[str]): Companion formats to encode as well (e.g. ["webp"]).
+        trace_memory (bool): Whether to measure tracemalloc peaks.
+        kinds (iterable[str], optional): Restrict to case kinds ("qr", "flyer", "logo").
+
+    Returns:
+        dict: Machine-readable results with keys `environment` (commit, versions, settings), `cases` (per-case `wall_s`, `wall_min_s`, `stages_s`, `output_bytes`, `outputs` and `tracemalloc_peak_bytes`), `totals` (per case kind) and `peak_rss_bytes`.
+    """
+    networks = SYNTHETIC_NETWORKS if networks is None else networks
+    storage = BenchmarkStorage()
+    cases = [case for case in build_cases(networks) if not kinds or case[1] in kinds]
+
+    results = []
+    with stubbed_environment(networks, storage):
+        image_utils.use_encoder_policy(ENCODER_POLICIES[png_policy])
+        image_utils.use_companion_formats(companions)
+
+        for name, kind, net, func, args in cases:
+            runs = [run_case(func, args, storage) for _ in range(repeat)]
+            walls = [run["wall_s"] for run in runs]
+            stage_names = sorted({stage for run in runs for stage in run["stages_s"]})
+            case = {
+                "name": name,
+                "kind": kind,
+                "network": net,
+                "wall_s": statistics.median(walls),
+                "wall_min_s": min(walls),
+                "stages_s": {
+                    stage: statistics.mean(
+                        run["stages_s"].get(stage, 0.0) for run in runs
+                    )
+                    for stage in stage_names
+                },
+                "output_bytes": runs[-1]["output_bytes"],
+                "outputs": runs[-1]["outputs"],
+            }
+            if trace_memory:
+                tracemalloc.start()
+                try:
+                    traced = run_case(func, args, storage, trace_memory=True)
+                finally:
+                    tracemalloc.stop()
+                case["tracemalloc_peak_bytes"] = traced["tracemalloc_peak_bytes"]
+            results.append(case)
+
+    return {
+        "environment": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "png_policy": png_policy,
+            "companions": list(companions),
+            "repeat": repeat,
+        },
+        "cases": results,
+        "totals": _totals(results),
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def _totals(cases):
+    totals = {}
+    for case in cases:
+        kind = totals.setdefault(
+            case["kind"], {"cases": 0, "wall_s": 0.0, "output_bytes": 0, "stages_s": {}}
+        )
+        kind["cases"] += 1
+        kind["wall_s"] += case["wall_s"]
+        kind["output_bytes"] += case["output_bytes"]
+        for stage, seconds in case["stages_s"].items():
+            kind["stages_s"][stage] = kind["stages_s"].get(stage, 0.0) + seconds
+    return totals
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline, current):
+    """
+    Return per-case wall-time and output-size ratios of two benchmark results (current / baseline).
+    """
+    previous = {case["name"]: case for case in baseline["cases"]}
+    comparison = {}
+    for case in current["cases"]:
+        before = previous.get(case["name"])
+        if not before or not before["wall_s"]:
+            continue
+        comparison[case["name"]] = {
+            "wall": case["wall_s"] / before["wall_s"],
+            "output_bytes": (
+                case["output_bytes"] / before["output_bytes"]
+                if before["output_bytes"]
+                else None
+            ),
+        }
+    return comparison
+
+
+def main():
+    """
+    Run the rendering benchmark from the command line and write the results as JSON.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark flyer, logo and QR rendering"
+    )
+    parser.add_argument("--output", "-o", help="JSON file to write (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument(
+        "--png-policy",
+        choices=sorted(ENCODER_POLICIES),
+        default="optimized",
+        help="PNG encoder policy",
+    )
+    parser.add_argument(
+        "--companions", default="", help="Comma-separated companion formats to encode"
+    )
+    parser.add_argument(
+        "--kinds", default="", help="Comma-separated case kinds: qr, flyer, logo"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Skip the tracemalloc runs"
+    )
+    parser.add_argument(
+        "--compare", help="Earlier results JSON to compare wall times and sizes with"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        repeat=args.repeat,
+        png_policy=args.png_policy,
+        companions=[name for name in args.companions.split(",") if name],
+        trace_memory=not args.no_memory,
+        kinds=[kind for kind in args.kinds.split(",") if kind],
+    )
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            results["comparison"] = compare_results(json.load(handle), results)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
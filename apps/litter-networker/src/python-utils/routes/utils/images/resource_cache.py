@@ -0,0 +1,104 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+
+from PIL import Image, ImageFont
+
+# Decoded resources shared across renders, keyed by (path, size/mode)
+_fonts = {}
+_images = {}
+_lock = threading.Lock()
+
+
+def get_font(path, size):
+    """
+    Return a FreeType font for the given file and size, loading it at most once per process.
+
+    The same font instance is shared between callers; fonts are not modified by drawing.
+
+    Parameters:
+        path (str): Path of the TrueType/OpenType font file.
+        size (int | float): Font size in pixels; fractional sizes are kept as given.
+
+    Returns:
+        PIL.ImageFont.FreeTypeFont: The loaded font.
+
+    Raises:
+        OSError: If the font file cannot be read.
+    """
+    key = (path, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = ImageFont.truetype(path, size)
+        with _lock:
+            font = _fonts.setdefault(key, font)
+    return font
+
+
+def _decode(path, mode):
+    with Image.open(path) as source:
+        image = source.convert(mode)
+    image.load()
+    return image
+
+
+def get_template(path, mode="RGBA"):
+    """
+    Return a copy of a decoded template image, decoding the file at most once per process.
+
+    The cached image is never handed out directly; each caller gets its own copy that it is free to draw on.
+
+    Parameters:
+        path (str): Path of the image file.
+        mode (str): Mode to convert the image to before caching.
+
+    Returns:
+        PIL.Image.Image: A fresh copy of the decoded image.
+
+    Raises:
+        OSError: If the image file cannot be opened or decoded.
+    """
+    key = (path, mode)
+    image = _images.get(key)
+    if image is None:
+        image = _decode(path, mode)
+        with _lock:
+            image = _images.setdefault(key, image)
+    return image.copy()
+
+
+def get_composite(*paths):
+    """
+    Return a copy of the alpha composite of several RGBA images, compositing them at most once per process.
+
+    Useful for layers that are identical for every render (e.g. a background under a template), so each render starts from a ready-made canvas instead of repeating a full-frame composite. Only the composite is cached: the layers are decoded for it and then released.
+
+    Parameters:
+        *paths (str): Paths of same-sized image files, bottom layer first.
+
+    Returns:
+        PIL.Image.Image: A fresh RGBA copy of the composite.
+
+    Raises:
+        OSError: If any image file cannot be opened or decoded.
+        ValueError: If the images differ in size.
+    """
+    key = ("composite", paths)
+    image = _images.get(key)
+    if image is None:
+        image = _decode(paths[0], "RGBA")
+        for path in paths[1:]:
+            image = Image.alpha_composite(image, _decode(path, "RGBA"))
+        with _lock:
+            image = _images.setdefault(key, image)
+    return image.copy()
+
+
+def clear_resource_cache():
+    """
+    Drop all cached fonts, templates and composites (e.g. after the source files change).
+    """
+    with _lock:
+        _fonts.clear()
+        _images.clear()
@@ -0,0 +1,76 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Seconds spent per stage while a collection is active; None when not collecting
+_timings = None
+_lock = threading.Lock()
+
+# Per-thread time of the last stage boundary, for `start_stages` / `end_stage`
+_marks = threading.local()
+
+
+@contextmanager
+def collect_stage_timings():
+    """
+    Collect the time the generators spend in each rendering stage (load, composite, text, resize, encode, store) while the block runs.
+
+    Outside such a block the stage markers cost a single global lookup.
+
+    Yields:
+        dict: Mapping of stage name to accumulated seconds, filled in as stages complete.
+    """
+    global _timings
+    timings = defaultdict(float)
+    with _lock:
+        _timings = timings
+    try:
+        yield timings
+    finally:
+        with _lock:
+            _timings = None
+
+
+def _add(name, seconds):
+    timings = _timings
+    if timings is not None:
+        with _lock:
+            timings[name] += seconds
+
+
+@contextmanager
+def timed_stage(name):
+    """
+    Attribute the time spent in the block to a stage.
+    """
+    if _timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(name, time.perf_counter() - start)
+
+
+def start_stages():
+    """
+    Mark the start of a sequence of stages on this thread (see `end_stage`).
+    """
+    if _timings is not None:
+        _marks.last = time.perf_counter()
+
+
+def end_stage(name):
+    """
+    Attribute the time since the previous stage boundary on this thread to a stage.
+    """
+    if _timings is None:
+        return
+    now = time.perf_counter()
+    _add(name, now - getattr(_marks, "last", now))
+    _marks.last = now
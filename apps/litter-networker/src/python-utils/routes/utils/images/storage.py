@@ -0,0 +1,225 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import os
+import shutil
+
+import boto3
+from botocore.exceptions import ClientError
+
+from routes.utils.batch.aws_concurrency import CLIENT_CONFIG, throttled_call
+
+
+class S3Storage:
+    """
+    Stores generated images as objects in an S3 bucket.
+
+    Every request goes through the shared "s3" concurrency controller (see `aws_concurrency`), which limits and retries it.
+    """
+
+    def __init__(self, bucket, client=None):
+        """
+        Parameters:
+            bucket (str): Bucket holding the objects.
+            client: boto3 S3 client; a new one is created when omitted.
+        """
+        self.bucket = bucket
+        self.client = client or boto3.client("s3", config=CLIENT_CONFIG)
+
+    def __getstate__(self):
+        # Clients cannot be pickled; workers create their own
+        state = self.__dict__.copy()
+        del state["client"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.client = boto3.client("s3", config=CLIENT_CONFIG)
+
+    @property
+    def location(self):
+        """
+        Identify the storage, e.g. for checking that a cached listing belongs to it.
+        """
+        return self.bucket
+
+    def exists(self, key):
+        """
+        Return `True` if an object exists at the key.
+
+        Raises:
+            ClientError: Any S3 error other than a 404 (not found).
+        """
+        try:
+            throttled_call("s3", self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "404":
+                return False
+            raise
+
+    def read(self, key, length=None):
+        """
+        Return the contents of an object, or `None` if it does not exist.
+
+        Parameters:
+            key (str): Object key.
+            length (int, optional): Only fetch the first `length` bytes (a ranged GET), e.g. to read a file header.
+        """
+        params = {"Bucket": self.bucket, "Key": key}
+        if length:
+            params["Range"] = f"bytes=0-{length - 1}"
+        try:
+            response = throttled_call("s3", self.client.get_object, **params)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def write(self, key, body, content_type, cache_control=None, metadata=None):
+        """
+        Write an object.
+
+        Parameters:
+            key (str): Object key.
+            body (file-like): Readable binary stream with the contents.
+            content_type (str): MIME type stored with the object.
+            cache_control (str, optional): Cache-Control header stored with the object.
+            metadata (dict, optional): User metadata stored with the object.
+        """
+        params = {
+            "Bucket": self.bucket,
+            "Key": key,
+            "Body": body,
+            "ContentType": content_type,
+        }
+        if cache_control:
+            params["CacheControl"] = cache_control
+        if metadata:
+            params["Metadata"] = metadata
+
+        # A single PUT streams straight from the body; generated images are far below
+        # the multipart threshold, so the transfer manager's buffering is not needed.
+        # Rewind before every attempt, as a failed attempt may have read part of the body.
+        def upload():
+            body.seek(0)
+            self.client.put_object(**params)
+
+        throttled_call("s3", upload)
+
+    def list(self, prefix, start_after=None):
+        """
+        List all objects under a prefix, following continuation tokens.
+
+        Parameters:
+            prefix (str): Key prefix to list.
+            start_after (str, optional): Only list keys sorting after this one.
+
+        Returns:
+            dict: Mapping of key to `{"etag": ..., "size": ...}`.
+        """
+        params = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            params["StartAfter"] = start_after
+
+        # Page by hand, so each page request is limited and retried on its own
+        objects = {}
+        while True:
+            page = throttled_call("s3", self.client.list_objects_v2, **params)
+            for entry in page.get("Contents", []):
+                objects[entry["Key"]] = {
+                    "etag": entry.get("ETag", "").strip('"') or None,
+                    "size": entry.get("Size"),
+                }
+            if not page.get("IsTruncated"):
+                return objects
+            params["ContinuationToken"] = page["NextContinuationToken"]
+
+
+class LocalStorage:
+    """
+    Stores generated images as files under a local directory, using the object keys as relative paths.
+
+    Used to render without touching S3, e.g. for profiling, diffing renders between commits or staging a release. Content types, cache headers and metadata are not stored.
+    """
+
+    def __init__(self, root):
+        """
+        Parameters:
+            root (str): Directory to store files under; created on first write.
+        """
+        self.root = os.path.abspath(root)
+
+    @property
+    def location(self):
+        """
+        Identify the storage, e.g. for checking that a cached listing belongs to it.
+        """
+        return f"file://{self.root}"
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        """
+        Return `True` if a file exists for the key.
+        """
+        return os.path.isfile(self._path(key))
+
+    def read(self, key, length=None):
+        """
+        Return the contents of the file for a key (only the first `length` bytes when given), or `None` if it does not exist.
+        """
+        try:
+            with open(self._path(key), "rb") as handle:
+                return handle.read(length if length else -1)
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, body, content_type, cache_control=None, metadata=None):
+        """
+        Write the file for a key (see `S3Storage.write`; only the contents are stored).
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as handle:
+            shutil.copyfileobj(body, handle)
+        os.replace(tmp_path, path)
+
+    def list(self, prefix, start_after=None):
+        """
+        List all files under a key prefix (see `S3Storage.list`); the ETag is the MD5 of the contents, as for single-part S3 uploads.
+        """
+        # Only walk the directory the prefix points into
+        top = self._path(prefix.rpartition("/")[0]) if "/" in prefix else self.root
+        objects = {}
+        for directory, _, file_names in os.walk(top):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not key.startswith(prefix) or key.endswith(".tmp"):
+                    continue
+                if start_after and key <= start_after:
+                    continue
+                with open(path, "rb") as handle:
+                    etag = hashlib.md5(handle.read(), usedforsecurity=False)
+                objects[key] = {"etag": etag.hexdigest(), "size": os.path.getsize(path)}
+        return objects
+
+
+def build_storage(location):
+    """
+    Create a storage backend from a location string.
+
+    Parameters:
+        location (str): "s3://<bucket>" for S3; a directory path (optionally prefixed "file://") for local files.
+
+    Returns:
+        S3Storage | LocalStorage: The backend.
+    """
+    if location.startswith("s3://"):
+        return S3Storage(location[len("s3://") :].strip("/"))
+    if location.startswith("file://"):
+        location = location[len("file://") :]
+    return LocalStorage(location)
@@ -0,0 +1,60 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from functools import lru_cache
+
+from routes.utils.images.resource_cache import get_font
+
+
+@lru_cache(maxsize=65536)
+def measure_text(font_path, size, text):
+    """
+    Return the ink size of a line of text, memoised per (font, size, text) for the life of the process.
+
+    Measurements include kerning, and match `ImageDraw.textbbox((0, 0), text, font)`. Fonts come from the shared resource cache, so each (font, size) is loaded once.
+
+    Parameters:
+        font_path (str): Path of the TrueType/OpenType font file.
+        size (int | float): Font size in pixels.
+        text (str): Single line of text.
+
+    Returns:
+        tuple: (width, height) of the text's bounding box.
+
+    Raises:
+        OSError: If the font file cannot be read.
+    """
+    left, top, right, bottom = get_font(font_path, size).getbbox(text)
+    return right - left, bottom - top
+
+
+def fit_font_size(font_path, text, max_width, max_size, min_size=1):
+    """
+    Return the largest font size, up to `max_size`, at which a line of text is at most `max_width` wide.
+
+    `max_size` is returned unchanged when the text already fits. Otherwise the largest whole-pixel size is found by binary search between `min_size` and `max_size`; each probe goes through `measure_text`, so repeated fits of the same text are free.
+
+    Parameters:
+        font_path (str): Path of the TrueType/OpenType font file.
+        text (str): Single line of text.
+        max_width (int | float): Available width in pixels.
+        max_size (int | float): Preferred (largest) font size.
+        min_size (int): Smallest size to return, even if the text still overflows at it.
+
+    Returns:
+        int | float: The chosen font size.
+
+    Raises:
+        OSError: If the font file cannot be read.
+    """
+    if measure_text(font_path, max_size, text)[0] <= max_width:
+        return max_size
+
+    low, high = min_size, int(max_size)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if measure_text(font_path, mid, text)[0] <= max_width:
+            low = mid
+        else:
+            high = mid - 1
+    return low
@@ -0,0 +1,135 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+from PIL import Image
+
+from routes.utils.images.image_utils import save_image_to_s3
+from routes.utils.images.stage_timing import timed_stage
+
+# Downscaled levels written next to each full-size image, as (key suffix, size).
+# A float size is a fraction of the full size; an int size is a fixed width.
+THUMBNAIL_LEVELS = [
+    ("-half", 1 / 2),
+    ("-quarter", 1 / 4),
+    ("-thumb", 1 / 5),
+    ("-w1280", 1280),
+    ("-w640", 640),
+    ("-w320", 320),
+]
+
+
+def level_key(s3_key, suffix):
+    """
+    Return the key of a pyramid level, e.g. ("logo-x.png", "-w640") -> "logo-x-w640.png".
+    """
+    base, extension = os.path.splitext(s3_key)
+    return f"{base}{suffix}{extension}"
+
+
+def pyramid_keys(s3_key, levels=None):
+    """
+    Return the full-size key followed by the keys of every pyramid level.
+
+    Parameters:
+        s3_key (str): Key of the full-size image.
+        levels (list, optional): `(suffix, size)` pairs; defaults to `THUMBNAIL_LEVELS`.
+
+    Returns:
+        list[str]: All keys written by `save_image_pyramid`.
+    """
+    levels = THUMBNAIL_LEVELS if levels is None else levels
+    return [s3_key] + [level_key(s3_key, suffix) for suffix, _ in levels]
+
+
+def level_size(full_size, size):
+    """
+    Return the pixel size of a pyramid level, never larger than the full image.
+
+    Parameters:
+        full_size (tuple): Full image (width, height).
+        size (float | int): Fraction of the full size, or a fixed width.
+
+    Returns:
+        tuple: The level (width, height).
+    """
+    width, height = full_size
+    if isinstance(size, float):
+        return (max(int(width * size), 1), max(int(height * size), 1))
+    if size >= width:
+        return full_size
+    return (size, max(round(height * size / width), 1))
+
+
+def iter_thumbnail_pyramid(image, levels=None):
+    """
+    Build the downscaled levels of an image one at a time, largest first, each resampled from a previous level rather than from the full image.
+
+    Each level is resampled from the smallest level built so far that is at least twice its width (falling back to the full image), so every step still filters properly while most of the work happens on small images. `Image.resize` with a reducing gap applies `Image.reduce` first for large ratios. Only levels that can still serve as a source are kept, so a caller that encodes and drops each level as it arrives holds little more than the full image.
+
+    Parameters:
+        image (PIL.Image.Image): The full-size image.
+        levels (list, optional): `(suffix, size)` pairs; defaults to `THUMBNAIL_LEVELS`.
+
+    Yields:
+        tuple: `(suffix, image)` pairs, largest level first.
+    """
+    levels = THUMBNAIL_LEVELS if levels is None else levels
+    sizes = {suffix: level_size(image.size, size) for suffix, size in levels}
+
+    sources = []
+    for suffix in sorted(sizes, key=lambda s: sizes[s][0], reverse=True):
+        size = sizes[suffix]
+        if size == image.size:
+            yield suffix, image
+            continue
+
+        source = next(
+            (level for level in reversed(sources) if level.width >= size[0] * 2),
+            image,
+        )
+        level = source.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        # Later levels are smaller, so sources larger than this one are never used again
+        sources = [kept for kept in sources if kept.width <= source.width]
+        sources.append(level)
+        yield suffix, level
+
+
+def build_thumbnail_pyramid(image, levels=None):
+    """
+    Build every downscaled level of an image (see `iter_thumbnail_pyramid`).
+
+    Parameters:
+        image (PIL.Image.Image): The full-size image.
+        levels (list, optional): `(suffix, size)` pairs; defaults to `THUMBNAIL_LEVELS`.
+
+    Returns:
+        list: `(suffix, image)` pairs in the order of `levels`.
+    """
+    levels = THUMBNAIL_LEVELS if levels is None else levels
+    built = dict(iter_thumbnail_pyramid(image, levels))
+    return [(suffix, built[suffix]) for suffix, _ in levels]
+
+
+def save_image_pyramid(image, s3_key, metadata=None, levels=None):
+    """
+    Save a full-size image and every level of its thumbnail pyramid (for `srcset`).
+
+    Each level is encoded and handed on as soon as it is built, so the levels are not all held in memory at once.
+
+    Parameters:
+        image (PIL.Image.Image): The full-size image.
+        s3_key (str): Key of the full-size image; level keys are derived from it.
+        metadata (dict, optional): User metadata stored on every object.
+        levels (list, optional): `(suffix, size)` pairs; defaults to `THUMBNAIL_LEVELS`.
+    """
+    save_image_to_s3(image, s3_key, metadata=metadata)
+    pyramid = iter_thumbnail_pyramid(image, levels)
+    while True:
+        with timed_stage("resize"):
+            entry = next(pyramid, None)
+        if entry is None:
+            break
+        suffix, level = entry
+        save_image_to_s3(level, level_key(s3_key, suffix), metadata=metadata)
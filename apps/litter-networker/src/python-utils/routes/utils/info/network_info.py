@@ -4,6 +4,8 @@
 import boto3
 from botocore.exceptions import ClientError
 
+from routes.utils.batch.aws_concurrency import CLIENT_CONFIG, throttled_call
+
 all_info = {"shortId": "all", "uniqueId": "all", "fullName": "Litter Networks"}
 
 
@@ -22,14 +24,16 @@ def get_network_info(queryUniqueId):
         return all_info
 
     # Initialize the DynamoDB client
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = boto3.resource("dynamodb", config=CLIENT_CONFIG)
 
     # Reference the LN-NetworksInfo table
     table = dynamodb.Table("LN-NetworksInfo")
 
     try:
         # Query the table with the supplied uniqueId (hash-key)
-        response = table.get_item(Key={"uniqueId": queryUniqueId})
+        response = throttled_call(
+            "dynamodb", table.get_item, Key={"uniqueId": queryUniqueId}
+        )
 
         # Check if an item was found
         if "Item" in response:
@@ -45,17 +49,46 @@ def get_network_info(queryUniqueId):
         return {"Error": str(e)}
 
 
+def require_network_info(queryUniqueId, fields):
+    """
+    Retrieve network information like `get_network_info`, but raise instead of returning an error dictionary.
+
+    Generators use this before fingerprinting, so a failed lookup cannot look like changed inputs and overwrite a good asset with one rendered from empty fields.
+
+    Parameters:
+        queryUniqueId (str): The uniqueId of the network to look up, or "all".
+        fields (iterable[str]): Attributes that must be present and non-empty.
+
+    Returns:
+        dict: The network's attributes.
+
+    Raises:
+        LookupError: If the lookup failed or a required field is missing.
+    """
+    info = get_network_info(queryUniqueId)
+    if "Error" in info:
+        raise LookupError(
+            f"Cannot get network info for '{queryUniqueId}': {info['Error']}"
+        )
+    missing = [field for field in fields if not info.get(field)]
+    if missing:
+        raise LookupError(
+            f"Network '{queryUniqueId}' has no {', '.join(missing)} in LN-NetworksInfo"
+        )
+    return info
+
+
 def get_all_network_ids():
     """
     Retrieve all `uniqueId` values from the LN-NetworksInfo DynamoDB table.
 
-    Handles DynamoDB scan pagination to collect `uniqueId` from every item in the table.
+    Handles DynamoDB scan pagination to collect `uniqueId` from every item in the table. Each page is read through the shared "dynamodb" concurrency controller, so throttled pages are retried.
 
     Returns:
         list: A list of `uniqueId` strings from all items in the LN-NetworksInfo table.
     """
     # Initialize a session using AWS credentials and region.
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = boto3.resource("dynamodb", config=CLIENT_CONFIG)
     # Specify your DynamoDB table name
     table_name = "LN-NetworksInfo"
     # Define your table object
@@ -63,7 +96,7 @@ def get_all_network_ids():
     unique_ids = []
 
     # Start a scan of the entire table
-    response = table.scan()
+    response = throttled_call("dynamodb", table.scan)
     data = response.get("Items", [])
 
     # Collect uniqueId from the items
@@ -72,7 +105,9 @@ def get_all_network_ids():
 
     # Handle pagination in case the scan result is too large
     while "LastEvaluatedKey" in response:
-        response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
+        response = throttled_call(
+            "dynamodb", table.scan, ExclusiveStartKey=response["LastEvaluatedKey"]
+        )
         data = response.get("Items", [])
         for item in data:
             unique_ids.append(item["uniqueId"])
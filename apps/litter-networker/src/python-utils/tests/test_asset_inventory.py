@@ -0,0 +1,131 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+
+from routes.utils.images import image_utils
+from routes.utils.images.asset_inventory import AssetInventory
+from routes.utils.images.storage import LocalStorage, S3Storage
+
+
+class FakeS3:
+    def __init__(self, keys):
+        self.keys = keys
+        self.calls = []
+        self.uploads = []
+
+    def list_objects_v2(self, **params):
+        self.calls.append(params)
+        prefix = params["Prefix"]
+        start_after = params.get("StartAfter", "")
+        contents = [
+            {"Key": key, "ETag": '"abc"', "Size": 10}
+            for key in sorted(self.keys)
+            if key.startswith(prefix) and key > start_after
+        ]
+        return {"Contents": contents, "IsTruncated": False}
+
+    def put_object(self, Bucket, Key, Body, **params):
+        self.uploads.append((Key, Body.read()))
+
+
+def test_refresh_answers_existence_locally():
+    client = FakeS3(["qr/qr-a.png", "logo/logo-a.png", "other/x.png"])
+    inventory = AssetInventory(prefixes=["qr/", "logo/"], bucket="b", client=client)
+
+    assert inventory.refresh() == 2
+    assert inventory.exists("qr/qr-a.png")
+    assert not inventory.exists("qr/qr-b.png")
+    assert inventory.get("logo/logo-a.png") == {"etag": "abc", "size": 10}
+    assert not inventory.covers("other/x.png")
+
+
+def test_incremental_refresh_lists_after_last_known_key(tmp_path):
+    cache_path = str(tmp_path / "inventory.json")
+    client = FakeS3(["qr/qr-a.png"])
+    inventory = AssetInventory(
+        prefixes=["qr/"], bucket="b", client=client, cache_path=cache_path
+    )
+    inventory.refresh()
+    inventory.save()
+
+    client.keys.append("qr/qr-b.png")
+    reloaded = AssetInventory(
+        prefixes=["qr/"], bucket="b", client=client, cache_path=cache_path
+    )
+    assert reloaded.load()
+    assert reloaded.refresh(incremental=True) == 1
+    assert client.calls[-1]["StartAfter"] == "qr/qr-a.png"
+    assert reloaded.keys() == ["qr/qr-a.png", "qr/qr-b.png"]
+
+
+def test_skip_unchanged_compares_content_with_listed_etag(monkeypatch):
+    client = FakeS3([])
+    inventory = AssetInventory(prefixes=["qr/"], bucket="b", client=client)
+    inventory.record("qr/qr-a.png", etag=hashlib.md5(b"same").hexdigest(), size=4)
+    monkeypatch.setattr(image_utils, "storage", S3Storage("b", client))
+    monkeypatch.setattr(image_utils, "asset_inventory", inventory)
+    monkeypatch.setattr(image_utils, "skip_unchanged", True)
+    image_utils.reset_upload_counts()
+
+    assert not image_utils.upload_image_bytes(b"same", "qr/qr-a.png")
+    assert image_utils.upload_image_bytes(b"new", "qr/qr-a.png")
+    assert image_utils.upload_image_bytes(b"new", "other/x.png")
+
+    assert [key for key, _ in client.uploads] == ["qr/qr-a.png", "other/x.png"]
+    assert inventory.get("qr/qr-a.png")["etag"] == hashlib.md5(b"new").hexdigest()
+    assert image_utils.reset_upload_counts() == {"uploaded": 2, "unchanged": 1}
+
+
+def test_skip_unchanged_ignores_etags_only_loaded_from_the_cache(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "inventory.json")
+    client = FakeS3([])
+    inventory = AssetInventory(
+        prefixes=["qr/"], bucket="b", client=client, cache_path=cache_path
+    )
+    same = hashlib.md5(b"same").hexdigest()
+    inventory.record("qr/qr-a.png", etag=same, size=4)
+    inventory.record("qr/qr-b.png", etag=same, size=4)
+    inventory.save()
+
+    # qr-a was deleted out of band; qr-b is new to the listing after the cache
+    reloaded = AssetInventory(
+        prefixes=["qr/"], bucket="b", client=client, cache_path=cache_path
+    )
+    assert reloaded.load()
+    client.keys.append("qr/qr-c.png")
+    reloaded.refresh(incremental=True)
+    reloaded.record("qr/qr-b.png", etag=same, size=4)
+    assert not reloaded.is_current("qr/qr-a.png")
+    assert reloaded.is_current("qr/qr-c.png")
+
+    monkeypatch.setattr(image_utils, "storage", S3Storage("b", client))
+    monkeypatch.setattr(image_utils, "asset_inventory", reloaded)
+    monkeypatch.setattr(image_utils, "skip_unchanged", True)
+    image_utils.reset_upload_counts()
+
+    assert image_utils.upload_image_bytes(b"same", "qr/qr-a.png")
+    assert not image_utils.upload_image_bytes(b"same", "qr/qr-a.png")
+    assert not image_utils.upload_image_bytes(b"same", "qr/qr-b.png")
+
+    assert [key for key, _ in client.uploads] == ["qr/qr-a.png"]
+    assert image_utils.reset_upload_counts() == {"uploaded": 1, "unchanged": 2}
+
+
+def test_local_storage_round_trip_and_listing(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(image_utils, "storage", storage)
+    monkeypatch.setattr(image_utils, "asset_inventory", None)
+
+    assert not image_utils.image_exists_on_s3("qr/qr-a.png")
+    image_utils.upload_image_bytes(b"data", "qr/qr-a.png")
+    image_utils.upload_image_bytes(b"other", "logo/logo-a.png")
+
+    assert image_utils.image_exists_on_s3("qr/qr-a.png")
+    assert storage.read("qr/qr-a.png") == b"data"
+    inventory = AssetInventory(prefixes=["qr/"], storage=storage)
+    assert inventory.refresh() == 1
+    assert inventory.get("qr/qr-a.png") == {
+        "etag": hashlib.md5(b"data").hexdigest(),
+        "size": 4,
+    }
@@ -0,0 +1,82 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+from io import BytesIO
+
+from PIL import Image
+
+from routes.utils.images import image_utils
+from routes.utils.images.asset_inventory import AssetInventory
+from routes.utils.images.asset_manifest import (
+    MANIFEST_KEY,
+    MANIFEST_PREFIXES,
+    parse_asset_key,
+    publish_manifest,
+)
+from routes.utils.images.storage import LocalStorage
+
+LOGO = "proc/images/resources/logo/logo-much-wenlock-2line"
+
+
+def png_bytes(size):
+    buffer = BytesIO()
+    Image.new("RGB", size).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_parse_asset_key_splits_network_variant_level_and_format():
+    networks = {"much", "much-wenlock", "all"}
+
+    assert parse_asset_key(f"{LOGO}-w640.webp", networks) == (
+        "much-wenlock",
+        "logo-2line",
+        "w640",
+        "webp",
+    )
+    assert parse_asset_key("proc/images/resources/qr/qr-all-nobg.png", networks) == (
+        "all",
+        "qr-nobg",
+        "full",
+        "png",
+    )
+    assert parse_asset_key("proc/images/resources/qr/qr-gone.png", networks) is None
+    assert parse_asset_key("proc/images/icons/icon-32x32.png", networks) is None
+
+
+def test_publish_manifest_lists_hashes_sizes_and_dimensions(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    inventory = AssetInventory(
+        prefixes=list(MANIFEST_PREFIXES.values()), storage=storage
+    )
+    monkeypatch.setattr(image_utils, "storage", storage)
+    monkeypatch.setattr(image_utils, "asset_inventory", inventory)
+    monkeypatch.setattr(image_utils, "skip_unchanged", True)
+
+    image_utils.upload_image_bytes(png_bytes((1000, 800)), f"{LOGO}.png")
+    image_utils.upload_image_bytes(png_bytes((640, 512)), f"{LOGO}-w640.png")
+    image_utils.upload_image_bytes(b"webp", f"{LOGO}-w640.webp")
+
+    manifest = publish_manifest(inventory, ["much-wenlock"])
+    entries = manifest["networks"]["much-wenlock"]["logo-2line"]
+    assert [(e["level"], e["format"]) for e in entries] == [
+        ("full", "png"),
+        ("w640", "png"),
+        ("w640", "webp"),
+    ]
+    assert entries[0]["width"] == 1000 and entries[0]["height"] == 800
+    assert entries[2]["width"] == 640 and entries[2]["height"] == 512
+    assert entries[2]["bytes"] == 4
+    assert json.loads(storage.read(MANIFEST_KEY))["revision"] == manifest["revision"]
+
+    # A fresh listing has no dimensions: they come from the previous manifest, and
+    # without one from the stored PNG header
+    relisted = AssetInventory(
+        prefixes=list(MANIFEST_PREFIXES.values()), storage=storage
+    )
+    relisted.refresh()
+    assert publish_manifest(relisted, ["much-wenlock"]) == manifest
+
+    (tmp_path / MANIFEST_KEY).unlink()
+    rebuilt = publish_manifest(relisted, ["much-wenlock"])
+    assert rebuilt["networks"] == manifest["networks"]
@@ -0,0 +1,144 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+
+from PIL import Image
+
+from routes.utils.batch.asset_pipeline import AssetTask, run_task_graph
+from routes.utils.images import image_utils
+from routes.utils.images.storage import LocalStorage
+
+
+def test_task_graph_runs_dependents_after_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def work(name):
+        with lock:
+            order.append(name)
+
+    tasks = [
+        AssetTask("flyer:a", work, ("flyer:a",), deps=["qr:a"]),
+        AssetTask("qr:a", work, ("qr:a",)),
+        AssetTask("logo:a", work, ("logo:a",), deps=["qr:missing"]),
+    ]
+
+    results = run_task_graph(tasks, "test")
+
+    assert sorted(results["done"]) == ["flyer:a", "logo:a", "qr:a"]
+    assert order.index("qr:a") < order.index("flyer:a")
+
+
+def test_task_graph_skips_dependents_of_failed_tasks():
+    def fail():
+        raise RuntimeError("boom")
+
+    tasks = [
+        AssetTask("qr:a", fail),
+        AssetTask("flyer:a", lambda: None, deps=["qr:a"]),
+        AssetTask("logo:a", lambda: None),
+    ]
+
+    results = run_task_graph(tasks, "test")
+
+    assert results == {"done": ["logo:a"], "failed": ["qr:a"], "skipped": ["flyer:a"]}
+
+
+def test_task_graph_bounds_tasks_in_flight_by_bytes():
+    lock = threading.Lock()
+    active = [0, 0]
+
+    def work():
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+
+    tasks = [AssetTask(f"logo:{n}", work, memory_bytes=60) for n in range(6)]
+    tasks.append(AssetTask("flyer:big", work, memory_bytes=500))
+
+    results = run_task_graph(tasks, "test", max_pending=10, max_bytes=100)
+
+    assert len(results["done"]) == 7
+    assert active[1] == 1
+
+
+def test_task_graph_admits_smaller_tasks_behind_a_blocked_large_one():
+    lock = threading.Lock()
+    started = []
+    active = {"bytes": 0, "peak": 0}
+
+    def work(name, size):
+        with lock:
+            started.append(name)
+            active["bytes"] += size
+            active["peak"] = max(active["peak"], active["bytes"])
+        time.sleep(0.02)
+        with lock:
+            active["bytes"] -= size
+
+    sizes = {"logo:a": 480, "logo:b": 480, "flyer:a": 128, "flyer:b": 128}
+    sizes.update({f"qr:{n}": 16 for n in range(4)})
+    tasks = [
+        AssetTask(task_id, work, (task_id, size), memory_bytes=size)
+        for task_id, size in sizes.items()
+    ]
+
+    results = run_task_graph(tasks, "test", max_pending=10, max_bytes=800)
+
+    assert sorted(results["done"]) == sorted(sizes)
+    assert active["peak"] <= 800
+    # Everything but the second logo fits alongside the first
+    assert started.index("logo:b") == len(sizes) - 1
+
+
+def test_task_graph_stops_overtaking_a_task_that_has_waited_long_enough():
+    started = []
+
+    def work(name, seconds):
+        started.append(name)
+        time.sleep(seconds)
+
+    # The first logo outlasts every small task, so without a limit on overtaking the
+    # second would only start once all of them had run
+    tasks = [
+        AssetTask("logo:a", work, ("logo:a", 0.2), memory_bytes=80),
+        AssetTask("logo:b", work, ("logo:b", 0.01), memory_bytes=80),
+    ]
+    tasks += [
+        AssetTask(f"qr:{n}", work, (f"qr:{n}", 0.01), memory_bytes=10) for n in range(8)
+    ]
+
+    run_task_graph(tasks, "test", max_pending=2, max_bytes=100)
+
+    # logo:b is overtaken by at most max_pending small tasks
+    assert started.index("logo:b") <= 1 + 2
+
+
+def shrink_source(s3_key):
+    # Runs in a spawned render process: reads through the parent's storage settings
+    source = image_utils.load_image_from_s3("source.png")
+    image_utils.save_image_to_s3(source.resize((8, 8)), s3_key)
+
+
+def test_process_mode_renders_in_workers_and_uploads_in_parent(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(image_utils, "storage", storage)
+    monkeypatch.setattr(image_utils, "asset_inventory", None)
+    Image.new("RGBA", (64, 64), (0, 128, 0, 255)).save(tmp_path / "source.png")
+
+    tasks = [
+        AssetTask("a", shrink_source, ("out/a.png",)),
+        AssetTask("b", shrink_source, ("out/b.png",), deps=["a"]),
+    ]
+    results = run_task_graph(tasks, "test", use_processes=True, render_workers=2)
+
+    assert results["done"] == ["a", "b"]
+    for name in ("a", "b"):
+        with Image.open(tmp_path / "out" / f"{name}.png") as image:
+            assert image.size == (8, 8)
+            assert image.getpixel((4, 4)) == (0, 128, 0, 255)
@@ -0,0 +1,110 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from routes.utils.batch import aws_concurrency
+from routes.utils.batch.aws_concurrency import AdaptiveLimiter, ServiceController
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "PutObject")
+
+
+def test_limiter_adds_per_round_and_halves_on_throttle():
+    limiter = AdaptiveLimiter(4, maximum=8, cooldown=60)
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 4
+    assert limiter._limit == pytest.approx(4.9, abs=0.1)
+
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 2
+    # Further throttles within the cooldown are the same congestion event
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 2
+
+
+def test_throttled_calls_are_retried_and_counted(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(aws_concurrency.time, "sleep", sleeps.append)
+    controller = ServiceController("s3", rate=1000, burst=10, initial=8, maximum=16)
+    responses = [client_error("SlowDown"), client_error("503"), "ok"]
+
+    def call():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert controller.call(call) == "ok"
+    stats = controller.stats()
+    assert stats["calls"] == 3
+    assert stats["retries"] == 2
+    assert stats["throttles"] == 1
+    assert stats["limit"] == 4
+    assert len(sleeps) == 2 and all(0 <= delay <= 0.2 for delay in sleeps)
+
+
+def test_other_errors_and_exhausted_retries_are_raised(monkeypatch):
+    monkeypatch.setattr(aws_concurrency.time, "sleep", lambda delay: None)
+    controller = ServiceController(
+        "dynamodb", rate=1000, burst=10, initial=2, maximum=4, max_attempts=3
+    )
+
+    def denied():
+        raise client_error("AccessDenied")
+
+    def throttled():
+        raise client_error("ProvisionedThroughputExceededException")
+
+    with pytest.raises(ClientError):
+        controller.call(denied)
+    assert controller.retries == 0
+
+    with pytest.raises(ClientError):
+        controller.call(throttled)
+    assert controller.calls == 4
+    assert controller.throttles == 3
+    assert controller.limiter.in_flight == 0
+
+
+def test_network_errors_are_retried_without_shrinking_the_limit(monkeypatch):
+    monkeypatch.setattr(aws_concurrency.time, "sleep", lambda delay: None)
+    controller = ServiceController(
+        "s3", rate=1000, burst=10, initial=4, maximum=8, max_attempts=4
+    )
+    responses = [
+        EndpointConnectionError(endpoint_url="https://s3.example"),
+        ConnectionClosedError(endpoint_url="https://s3.example"),
+        ReadTimeoutError(endpoint_url="https://s3.example"),
+        "ok",
+    ]
+
+    def call():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert controller.call(call) == "ok"
+    assert controller.retries == 3
+    assert controller.throttles == 0
+    assert controller.limiter.limit == 4
+
+    def unreachable():
+        raise EndpointConnectionError(endpoint_url="https://s3.example")
+
+    with pytest.raises(EndpointConnectionError):
+        controller.call(unreachable)
+    assert controller.calls == 8
+    assert controller.limiter.in_flight == 0
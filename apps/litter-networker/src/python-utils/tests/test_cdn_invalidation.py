@@ -0,0 +1,72 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from routes.utils.batch.cdn_invalidation import InvalidationCollector, collapse_paths
+
+STEMS = ["", "-thumb", "-w640"]
+
+
+def asset_keys(kind, net):
+    return [
+        f"proc/images/resources/{kind}/{kind}-{net}{stem}.{ext}"
+        for stem in STEMS
+        for ext in ("png", "webp")
+    ]
+
+
+def test_collapse_paths_keeps_few_keys_exact():
+    assert collapse_paths(["a/b.png", "a/c.png"]) == ["/a/b.png", "/a/c.png"]
+
+
+def test_collapse_paths_groups_by_asset_within_limit():
+    keys = asset_keys("flyer", "anfield") + asset_keys("logo", "anfield")
+    keys += asset_keys("logo", "bootle")
+
+    paths = collapse_paths(keys, max_paths=3)
+
+    assert paths == [
+        "/proc/images/resources/flyer/flyer-anfield*",
+        "/proc/images/resources/logo/logo-anfield*",
+        "/proc/images/resources/logo/logo-bootle*",
+    ]
+
+
+def test_collapse_paths_always_covers_every_key():
+    keys = [asset_keys("logo", f"net{i}") for i in range(40)]
+    keys = [key for group in keys for key in group]
+
+    paths = collapse_paths(keys, max_paths=15)
+
+    assert len(paths) <= 15
+    for key in keys:
+        assert any(
+            "/" + key == path
+            or (path.endswith("*") and ("/" + key).startswith(path[:-1]))
+            for path in paths
+        )
+
+
+class FakeCloudFront:
+    def __init__(self):
+        self.batches = []
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        self.batches.append(InvalidationBatch)
+        return {"Invalidation": {"Id": "I1", "Status": "InProgress"}}
+
+    def get_invalidation(self, DistributionId, Id):
+        return {"Invalidation": {"Id": Id, "Status": "Completed"}}
+
+
+def test_collector_submits_once_and_polls():
+    client = FakeCloudFront()
+    collector = InvalidationCollector("D", client=client)
+    assert collector.submit() is None
+
+    for key in asset_keys("qr", "anfield"):
+        collector.add(key)
+
+    assert collector.submit() == "I1"
+    assert len(client.batches) == 1
+    assert client.batches[0]["Paths"]["Quantity"] == 6
+    assert collector.poll() == "Completed"
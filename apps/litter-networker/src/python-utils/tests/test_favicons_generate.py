@@ -0,0 +1,65 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+from io import BytesIO
+
+from PIL import Image
+
+from routes.utils.images import image_utils
+from routes.utils.images.favicons_generate import (
+    cdn_base_url,
+    generate_favicons,
+    icon_key,
+    icon_sizes,
+    output_dir,
+)
+from routes.utils.images.render_benchmark import BenchmarkStorage, stubbed_environment
+
+
+def test_generate_favicons_writes_icons_ico_and_manifest():
+    storage = BenchmarkStorage()
+    with stubbed_environment([], storage):
+        image_utils.use_companion_formats([])
+        manifest = generate_favicons(force_generate=True)
+    objects = storage.objects
+
+    expected_icons = {
+        icon_key(size, variant) for size in icon_sizes for variant in ("", "-bw")
+    }
+    assert set(objects) == expected_icons | {
+        output_dir + "favicon.ico",
+        output_dir + "manifest-icons.json",
+    }
+    assert icon_key((32, 32), "-bw") == "proc/images/icons/icon-32x32-bw.png"
+
+    for size in icon_sizes:
+        with Image.open(BytesIO(objects[icon_key(size)])) as icon:
+            assert icon.size == size
+            assert icon.mode == "RGBA"
+            # Rounded corners are see-through, the centre is opaque
+            assert icon.getpixel((0, 0))[3] < 128
+            assert icon.getpixel((size[0] // 2, size[1] // 2))[3] == 255
+        with Image.open(BytesIO(objects[icon_key(size, "-bw")])) as icon:
+            r, g, b, _ = icon.split()
+            assert r.tobytes() == g.tobytes() == b.tobytes()
+
+    with Image.open(BytesIO(objects[output_dir + "favicon.ico"])) as ico:
+        assert ico.format == "ICO"
+        assert ico.info["sizes"] == {(16, 16), (32, 32), (48, 48)}
+        for size in ((16, 16), (32, 32), (48, 48)):
+            ico.size = size
+            assert ico.load() is not None
+            assert ico.size == size
+
+    written = json.loads(objects[output_dir + "manifest-icons.json"])
+    assert written == manifest
+    assert written["icons"] == [
+        {
+            "src": f"{cdn_base_url}proc/images/icons/icon-{n}x{n}.png",
+            "sizes": f"{n}x{n}",
+            "type": "image/png",
+            "purpose": "any",
+        }
+        for n in (192, 512)
+    ]
@@ -0,0 +1,65 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from io import BytesIO
+
+from PIL import Image, ImageChops
+
+from routes.utils.images.encoding import ENCODER_POLICIES, encode_png, reduce_image_mode
+from routes.utils.images.image_utils import (
+    KEY_LUMINANCE,
+    KEY_THRESHOLD,
+    apply_transparency_key,
+)
+from routes.utils.images.qr_generate import remove_background
+
+
+def make_image() -> Image.Image:
+    image = Image.new("RGBA", (4, 1), (0, 0, 0, 255))
+    image.putpixel((1, 0), (255, 255, 255, 255))
+    image.putpixel((2, 0), (3, 2, 1, 128))
+    image.putpixel((3, 0), (200, 200, 200, 255))
+    return image
+
+
+def test_remove_background_keeps_only_black_pixels():
+    result = remove_background(make_image())
+
+    assert result.mode == "RGBA"
+    assert result.getpixel((0, 0)) == (0, 0, 0, 255)
+    assert result.getpixel((1, 0)) == (0, 0, 0, 0)
+    assert result.getpixel((2, 0)) == (0, 0, 0, 0)
+    assert result.getpixel((3, 0)) == (0, 0, 0, 0)
+
+
+def test_threshold_key_tolerates_near_matches():
+    result = apply_transparency_key(make_image(), mode=KEY_THRESHOLD, threshold=3)
+
+    assert result.getpixel((0, 0)) == (0, 0, 0, 0)
+    assert result.getpixel((1, 0)) == (255, 255, 255, 255)
+    assert result.getpixel((2, 0)) == (0, 0, 0, 0)
+
+
+def test_luminance_key_removes_light_pixels():
+    result = apply_transparency_key(make_image(), mode=KEY_LUMINANCE, threshold=190)
+
+    assert result.getpixel((0, 0)) == (0, 0, 0, 255)
+    assert result.getpixel((1, 0)) == (0, 0, 0, 0)
+    assert result.getpixel((3, 0)) == (0, 0, 0, 0)
+
+
+def test_reduce_image_mode_is_lossless():
+    qr = remove_background(make_image())
+    opaque = make_image().convert("RGB")
+    grey = Image.new("RGBA", (2, 1), (10, 10, 10, 255))
+    grey.putpixel((1, 0), (200, 200, 200, 255))
+
+    assert reduce_image_mode(qr).mode == "P"
+    assert (
+        reduce_image_mode(Image.new("RGBA", (2, 2), (255, 255, 255, 255))).mode == "1"
+    )
+    assert reduce_image_mode(grey, max_palette_colours=0).mode == "L"
+    for image in (qr, opaque, grey):
+        decoded = Image.open(BytesIO(encode_png(image, ENCODER_POLICIES["optimized"])))
+        restored = decoded.convert("RGBA")
+        assert ImageChops.difference(restored, image.convert("RGBA")).getbbox() is None
@@ -0,0 +1,54 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from io import BytesIO
+
+from PIL import Image, ImageChops
+
+from routes.utils.images import image_utils, thumbnails
+from routes.utils.images.encoding import EncoderPolicy
+from routes.utils.images.logo_generate import (
+    ImageStyle,
+    generate_logo,
+    generate_logo_set,
+)
+from routes.utils.images.render_benchmark import (
+    SYNTHETIC_NETWORKS,
+    BenchmarkStorage,
+    stubbed_environment,
+)
+
+
+def render_into(storage, render):
+    with stubbed_environment(SYNTHETIC_NETWORKS, storage):
+        image_utils.use_encoder_policy(EncoderPolicy(compress_level=1))
+        image_utils.use_companion_formats([])
+        render()
+    return storage.objects
+
+
+def test_logo_set_matches_rendering_each_style_on_its_own(monkeypatch):
+    # Fast encoding and a single pyramid level keep the comparison quick
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_LEVELS", [("-thumb", 1 / 5)])
+    # One-line name, so the volunteer styles are also cropped
+    net = "bench-short"
+
+    def one_at_a_time():
+        for style in ImageStyle:
+            generate_logo(net, style, force_generate=True)
+
+    separate = render_into(BenchmarkStorage(), one_at_a_time)
+    together = render_into(
+        BenchmarkStorage(), lambda: generate_logo_set(net, force_generate=True)
+    )
+
+    assert sorted(together) == sorted(separate)
+    assert f"proc/images/resources/logo/logo-{net}-wa.png" in together
+    assert f"proc/images/resources/logo/logo-{net}-wa-thumb.png" in together
+    for key, data in separate.items():
+        with Image.open(BytesIO(data)) as expected, Image.open(
+            BytesIO(together[key])
+        ) as actual:
+            assert actual.mode == expected.mode, key
+            assert actual.size == expected.size, key
+            assert ImageChops.difference(actual, expected).getbbox() is None, key
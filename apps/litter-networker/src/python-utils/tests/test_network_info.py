@@ -0,0 +1,47 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+from routes.utils.images import flyer_generate, logo_generate, qr_generate
+from routes.utils.info import network_info
+from routes.utils.info.network_info import require_network_info
+
+
+def test_require_network_info_raises_on_error_or_missing_fields(monkeypatch):
+    records = {
+        "anfield": {"uniqueId": "anfield", "shortId": "anfield", "fullName": ""},
+    }
+    monkeypatch.setattr(
+        network_info,
+        "get_network_info",
+        lambda net: records.get(net, {"Error": f"No item found for uniqueId: {net}"}),
+    )
+
+    assert require_network_info("anfield", ("shortId",))["shortId"] == "anfield"
+    with pytest.raises(LookupError, match="fullName"):
+        require_network_info("anfield", ("shortId", "fullName"))
+    with pytest.raises(LookupError, match="No item found"):
+        require_network_info("gone", ())
+
+
+@pytest.mark.parametrize(
+    "generate",
+    [
+        lambda: qr_generate.generate_qr("gone", force_generate=True),
+        lambda: flyer_generate.generate_flyer("gone", force_generate=True),
+        lambda: logo_generate.generate_logo_set("gone", force_generate=True),
+    ],
+)
+def test_generators_do_not_render_when_lookup_fails(monkeypatch, generate):
+    monkeypatch.setattr(
+        network_info, "get_network_info", lambda net: {"Error": "Throttled"}
+    )
+    monkeypatch.setattr(
+        qr_generate.requests,
+        "get",
+        lambda *a, **kw: pytest.fail("QR service called"),
+    )
+
+    with pytest.raises(LookupError, match="Throttled"):
+        generate()
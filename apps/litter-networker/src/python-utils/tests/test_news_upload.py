@@ -0,0 +1,419 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError
+from PIL import Image
+
+from routes.utils.images.storage import LocalStorage
+
+# news_upload selects the "ln" AWS profile on import; keep that out of the other tests
+with mock.patch.dict(os.environ):
+    from routes.utils.images import news_upload
+    from routes.utils.images.news_upload import HostLimiter
+
+
+def jpeg_bytes(size, colour=(10, 120, 200)):
+    buffer = BytesIO()
+    Image.new("RGB", size, colour).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None, chunk_size=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = dict(headers or {})
+        self.chunk_size = chunk_size
+        self.read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        chunk_size = self.chunk_size or chunk_size
+        for start in range(0, len(self.body), chunk_size):
+            self.read += chunk_size
+            yield self.body[start : start + chunk_size]
+
+
+class FakeSession:
+    """
+    Serves `bodies` by URL, answering 304 when the sent ETag matches and 404 otherwise.
+    """
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, dict(headers or {})))
+        if url not in self.bodies:
+            return FakeResponse(404)
+        etag = f'"{len(self.bodies[url])}"'
+        if (headers or {}).get("If-None-Match") == etag:
+            return FakeResponse(304, headers={"ETag": etag})
+        return FakeResponse(
+            200,
+            self.bodies[url],
+            {"ETag": etag, "Content-Length": str(len(self.bodies[url]))},
+        )
+
+
+class FakeTable:
+    key_schema = [{"AttributeName": "uniqueId", "KeyType": "HASH"}]
+
+    def __init__(self, items):
+        self.items = {item["uniqueId"]: dict(item) for item in items}
+
+    def scan(self, **params):
+        return {"Items": [dict(item) for item in self.items.values()]}
+
+    def update_item(
+        self, Key, ExpressionAttributeNames, ExpressionAttributeValues, **kw
+    ):
+        item = self.items[Key["uniqueId"]]
+        for name, attribute in ExpressionAttributeNames.items():
+            value = ExpressionAttributeValues.get(f":{name[1:]}")
+            if value is not None:
+                item[attribute] = value
+
+
+def test_host_limiter_limits_each_host_separately():
+    limiter = HostLimiter(2)
+    lock = threading.Lock()
+    active = {}
+    peak = {}
+
+    def fetch(url):
+        host = url.split("/")[2].lower()
+        with limiter.slot(url):
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+
+    urls = [
+        f"https://{host}/{n}.jpg" for host in ("a.test", "B.test") for n in range(6)
+    ]
+    threads = [threading.Thread(target=fetch, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == {"a.test": 2, "b.test": 2}
+
+
+def test_process_images_encodes_uploads_and_skips(tmp_path, monkeypatch):
+    base = "https://news.test/"
+    session = FakeSession({base + "a.jpg": jpeg_bytes((1600, 1000))})
+    table = FakeTable(
+        [
+            {"uniqueId": "1", "imageUrl": base + "a.jpg"},
+            {"uniqueId": "2", "imageUrl": base + "a.jpg"},
+            {"uniqueId": "3", "imageUrl": base + "gone.jpg"},
+            {"uniqueId": "4"},
+        ]
+    )
+    monkeypatch.setattr(news_upload, "table", table)
+    monkeypatch.setattr(news_upload, "storage", LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(news_upload, "build_session", lambda: session)
+
+    counts = news_upload.process_images(encode_workers=1, validator_cache=None)
+
+    assert counts["uploaded"] == 1
+    assert counts["skipped"] == 1  # the duplicate URL
+    assert counts["failed"] == 1
+    keys = news_upload.rendition_keys(base + "a.jpg")
+    for width, s3_key in keys.items():
+        with Image.open(tmp_path / s3_key) as image:
+            assert image.width == width
+    assert counts["updated"] == 2
+    assert table.items["2"]["imageWidth"] == 1200
+    assert table.items["2"]["imageHeight"] == 750
+
+
+def test_validator_cache_round_trips_through_its_file(tmp_path):
+    path = str(tmp_path / "cache" / "validators.json")
+    cache = news_upload.ValidatorCache(path)
+    assert not cache.load()
+    cache.record("https://news.test/a.jpg", '"1"', "Mon", "abc", {"imageWidth": 1})
+    cache.save()
+
+    loaded = news_upload.ValidatorCache(path)
+    assert loaded.load()
+    assert loaded.get("https://news.test/a.jpg") == {
+        "etag": '"1"',
+        "lastModified": "Mon",
+        "hash": "abc",
+        "renderVersion": news_upload.NEWS_RENDER_VERSION,
+        "image": {"imageWidth": 1},
+    }
+
+    (tmp_path / "cache" / "validators.json").write_text("{not json")
+    assert not news_upload.ValidatorCache(path).load()
+
+
+def test_download_image_sends_validators_and_handles_not_modified():
+    url = "https://news.test/a.jpg"
+    session = FakeSession({url: b"jpeg"})
+
+    download = news_upload.download_image(session, url)
+    assert (download.data, download.etag) == (b"jpeg", '"4"')
+
+    revalidated = news_upload.download_image(
+        session, url, validators={"etag": '"4"', "lastModified": "Mon"}
+    )
+    assert revalidated.data is None
+    assert session.requests[-1][1] == {
+        "If-None-Match": '"4"',
+        "If-Modified-Since": "Mon",
+    }
+
+
+def test_process_images_revalidates_and_rerenders_on_version_change(
+    tmp_path, monkeypatch
+):
+    url = "https://news.test/a.jpg"
+    session = FakeSession({url: jpeg_bytes((900, 600))})
+    cache_path = str(tmp_path / "validators.json")
+    monkeypatch.setattr(
+        news_upload, "table", FakeTable([{"uniqueId": "1", "imageUrl": url}])
+    )
+    monkeypatch.setattr(news_upload, "storage", LocalStorage(str(tmp_path / "s3")))
+    monkeypatch.setattr(news_upload, "build_session", lambda: session)
+
+    def run():
+        return news_upload.process_images(encode_workers=1, validator_cache=cache_path)
+
+    assert run()["uploaded"] == 1
+    # A current source is only revalidated, and a 304 leaves it alone
+    assert run()["unchanged"] == 1
+    assert session.requests[-1][1].get("If-None-Match") == '"%d"' % len(
+        session.bodies[url]
+    )
+
+    # Renditions from an older render version are made again, without validators
+    monkeypatch.setattr(
+        news_upload, "NEWS_RENDER_VERSION", news_upload.NEWS_RENDER_VERSION + 1
+    )
+    assert run()["uploaded"] == 1
+    assert "If-None-Match" not in session.requests[-1][1]
+
+    # Stored renditions whose source has no cache entry are skipped unless forced
+    os.remove(cache_path)
+    assert run()["skipped"] == 1
+
+
+def test_open_for_width_decodes_large_jpegs_at_reduced_scale():
+    image = news_upload.open_for_width(jpeg_bytes((4000, 3000)), 800)
+    assert image.size == (1000, 750)
+
+    # Never reduced below the target width
+    assert news_upload.open_for_width(jpeg_bytes((1500, 1000)), 800).size == (
+        1500,
+        1000,
+    )
+
+
+def test_open_for_width_uses_the_oriented_width():
+    source = Image.new("RGB", (3200, 1000))
+    exif = source.getexif()
+    exif[0x0112] = 6  # rotated 90 degrees: shown 1000 wide
+    buffer = BytesIO()
+    source.save(buffer, format="JPEG", exif=exif)
+
+    assert news_upload.open_for_width(buffer.getvalue(), 800).size == (3200, 1000)
+
+
+def test_to_srgb_flattens_transparency_onto_white_and_converts_cmyk():
+    transparent = Image.new("RGBA", (4, 4), (255, 0, 0, 0))
+    assert news_upload.to_srgb(transparent).getpixel((0, 0)) == (255, 255, 255)
+
+    palette = Image.new("P", (4, 4))
+    palette.info["transparency"] = 0
+    converted = news_upload.to_srgb(palette)
+    assert (converted.mode, converted.getpixel((0, 0))) == ("RGB", (255, 255, 255))
+
+    assert news_upload.to_srgb(Image.new("CMYK", (4, 4))).mode == "RGB"
+    assert news_upload.to_srgb(Image.new("L", (4, 4))).mode == "L"
+
+
+def test_to_srgb_applies_the_profile_of_transparent_sources(monkeypatch):
+    converted = []
+    profile_to_profile = news_upload.ImageCms.profileToProfile
+
+    def spy(image, *args, **kwargs):
+        converted.append(image.mode)
+        return profile_to_profile(image, *args, **kwargs)
+
+    monkeypatch.setattr(news_upload.ImageCms, "profileToProfile", spy)
+    source = Image.new("RGBA", (4, 4), (200, 10, 10, 128))
+    source.info["icc_profile"] = news_upload.ImageCms.ImageCmsProfile(
+        news_upload.SRGB_PROFILE
+    ).tobytes()
+
+    assert news_upload.to_srgb(source).mode == "RGB"
+    assert converted == ["RGB"]
+
+
+def test_encode_jpeg_writes_a_progressive_jpeg():
+    data = news_upload.encode_jpeg(Image.new("RGB", (64, 64), (0, 100, 0)))
+    with Image.open(BytesIO(data)) as image:
+        assert image.format == "JPEG"
+        assert image.info.get("progressive")
+
+
+def test_download_image_rejects_oversize_bodies_early():
+    url = "https://news.test/a.jpg"
+
+    labelled = FakeResponse(200, b"x" * 5000, {"Content-Length": "5000"})
+    session = mock.Mock(get=mock.Mock(return_value=labelled))
+    with pytest.raises(news_upload.OversizeImageError):
+        news_upload.download_image(session, url, max_bytes=1000)
+    assert labelled.read == 0
+
+    # Without a Content-Length the body is abandoned once it passes the cap
+    streamed = FakeResponse(200, b"x" * 5000, chunk_size=500)
+    session = mock.Mock(get=mock.Mock(return_value=streamed))
+    with pytest.raises(news_upload.OversizeImageError):
+        news_upload.download_image(session, url, max_bytes=1000)
+    assert streamed.read == 1500
+
+    fits = FakeResponse(200, b"x" * 800, chunk_size=500)
+    session = mock.Mock(get=mock.Mock(return_value=fits))
+    assert news_upload.download_image(session, url, max_bytes=1000).data == b"x" * 800
+
+
+def test_check_image_memory_uses_the_header_size():
+    image = Image.open(BytesIO(jpeg_bytes((1000, 1000))))
+    news_upload.check_image_memory(image, 4 * 1000 * 1000)
+    with pytest.raises(news_upload.OversizeImageError):
+        news_upload.check_image_memory(image, 4 * 1000 * 1000 - 1)
+
+
+def test_encode_news_image_guards_memory_without_changing_the_global_limit():
+    limit = Image.MAX_IMAGE_PIXELS
+    large = jpeg_bytes((9600, 7200))
+
+    # Decoded at 1/8 scale, a JPEG well past the global limit still fits the budget
+    render = news_upload.encode_news_image(large, max_memory=8 * 1024 * 1024)
+    assert render.width == 1200
+    assert Image.MAX_IMAGE_PIXELS == limit
+
+    with pytest.raises(news_upload.OversizeImageError):
+        news_upload.encode_news_image(large, max_memory=1024 * 1024)
+
+    buffer = BytesIO()
+    Image.new("L", (3000, 3000)).save(buffer, format="PNG")
+    with pytest.raises(news_upload.OversizeImageError):
+        news_upload.encode_news_image(buffer.getvalue(), max_memory=16 * 1024 * 1024)
+    assert Image.MAX_IMAGE_PIXELS == limit
+
+
+def test_process_images_skips_and_reports_oversize_images(tmp_path, monkeypatch):
+    base = "https://news.test/"
+    session = FakeSession(
+        {base + "big.jpg": b"x" * 20000, base + "ok.jpg": jpeg_bytes((400, 300))}
+    )
+    table = FakeTable(
+        [
+            {"uniqueId": "1", "imageUrl": base + "big.jpg"},
+            {"uniqueId": "2", "imageUrl": base + "ok.jpg"},
+        ]
+    )
+    monkeypatch.setattr(news_upload, "table", table)
+    monkeypatch.setattr(news_upload, "storage", LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(news_upload, "build_session", lambda: session)
+    monkeypatch.setattr(news_upload, "max_image_bytes", 10000)
+
+    counts = news_upload.process_images(encode_workers=1, validator_cache=None)
+
+    assert (counts["oversize"], counts["uploaded"], counts["failed"]) == (1, 1, 0)
+
+
+def test_rendition_keys_keep_the_plain_key_for_the_target_width():
+    url = "https://news.test/a.jpg"
+    hashed = news_upload.hash_image_url(url)
+
+    keys = news_upload.rendition_keys(url)
+
+    assert keys[news_upload.TARGET_WIDTH] == f"proc/images/news/{hashed}.jpg"
+    assert keys[320] == f"proc/images/news/{hashed}-w320.jpg"
+    assert sorted(keys) == sorted(news_upload.RENDITION_WIDTHS)
+
+
+def test_encode_news_image_renders_every_width_without_upscaling():
+    render = news_upload.encode_news_image(jpeg_bytes((2000, 1000)))
+    sizes = {}
+    for width, data in render.renditions.items():
+        with Image.open(BytesIO(data)) as image:
+            sizes[width] = image.size
+    assert sizes == {
+        320: (320, 160),
+        640: (640, 320),
+        800: (800, 400),
+        1200: (1200, 600),
+    }
+    assert (render.width, render.height) == (1200, 600)
+
+    small = news_upload.encode_news_image(jpeg_bytes((500, 300)))
+    assert sorted(small.renditions) == sorted(news_upload.RENDITION_WIDTHS)
+    assert (small.width, small.height) == (500, 300)
+
+
+def test_encode_placeholder_is_a_tiny_jpeg_data_uri():
+    prefix = "data:image/jpeg;base64,"
+    placeholder = news_upload.encode_placeholder(Image.new("RGB", (800, 400), "red"))
+
+    assert placeholder.startswith(prefix)
+    data = base64.b64decode(placeholder[len(prefix) :])
+    with Image.open(BytesIO(data)) as image:
+        assert image.size == (news_upload.PLACEHOLDER_WIDTH, 8)
+    assert len(placeholder) < 1000
+
+
+def test_write_image_attributes_updates_changed_items_and_counts_deleted_ones():
+    image = {"imageWidth": 1200, "imageHeight": 600, "imagePlaceholder": "data:"}
+
+    class Table:
+        updated = []
+
+        def update_item(self, Key, **kwargs):
+            if Key["uniqueId"] == "gone":
+                raise ClientError(
+                    {"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem"
+                )
+            if Key["uniqueId"] == "bad":
+                raise ClientError(
+                    {"Error": {"Code": "ValidationException"}}, "UpdateItem"
+                )
+            self.updated.append(Key["uniqueId"])
+
+    targets = [
+        ("a", {"uniqueId": "new"}, {}),
+        ("a", {"uniqueId": "same"}, dict(image)),
+        ("a", {"uniqueId": "gone"}, {}),
+        ("a", {"uniqueId": "bad"}, {}),
+        ("b", {"uniqueId": "unprocessed"}, {}),
+    ]
+    with mock.patch.object(news_upload, "table", Table()):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            written = news_upload.write_image_attributes(targets, {"a": image}, pool)
+
+    assert written == {"updated": 1, "gone": 1, "failed": 1}
+    assert Table.updated == ["new"]
@@ -0,0 +1,32 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from routes.utils.images import image_utils
+from routes.utils.images.render_benchmark import (
+    SYNTHETIC_NETWORKS,
+    compare_results,
+    run_benchmark,
+)
+
+
+def test_run_benchmark_reports_stages_and_restores_storage():
+    storage = image_utils.storage
+
+    results = run_benchmark(
+        networks=SYNTHETIC_NETWORKS[:1], repeat=1, png_policy="default", kinds=["qr"]
+    )
+
+    assert image_utils.storage is storage
+    assert [case["name"] for case in results["cases"]] == [
+        "qr:bench-short",
+        "qr-nobg:bench-short",
+    ]
+    for case in results["cases"]:
+        assert case["outputs"] == 1
+        assert case["output_bytes"] > 0
+        assert {"load", "composite", "encode", "store"} <= set(case["stages_s"])
+        assert case["tracemalloc_peak_bytes"] > 0
+    assert results["totals"]["qr"]["cases"] == 2
+
+    comparison = compare_results(results, results)
+    assert comparison["qr:bench-short"]["wall"] == 1.0
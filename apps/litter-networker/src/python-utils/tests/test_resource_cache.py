@@ -0,0 +1,29 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from PIL import Image
+
+from routes.utils.images import resource_cache
+from routes.utils.images.resource_cache import clear_resource_cache, get_composite
+
+
+def test_get_composite_caches_only_the_composite(tmp_path):
+    background = str(tmp_path / "background.png")
+    template = str(tmp_path / "template.png")
+    Image.new("RGBA", (8, 8), (0, 0, 255, 255)).save(background)
+    overlay = Image.new("RGBA", (8, 8), (0, 0, 0, 0))
+    overlay.putpixel((0, 0), (255, 0, 0, 255))
+    overlay.save(template)
+
+    clear_resource_cache()
+    try:
+        image = get_composite(background, template)
+        assert image.getpixel((0, 0)) == (255, 0, 0, 255)
+        assert image.getpixel((1, 1)) == (0, 0, 255, 255)
+        assert list(resource_cache._images) == [("composite", (background, template))]
+
+        # Callers get copies they can draw on
+        image.putpixel((1, 1), (0, 0, 0, 255))
+        assert get_composite(background, template).getpixel((1, 1)) == (0, 0, 255, 255)
+    finally:
+        clear_resource_cache()
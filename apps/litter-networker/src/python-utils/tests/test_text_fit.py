@@ -0,0 +1,42 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+from PIL import Image, ImageDraw
+
+from routes.utils.images.resource_cache import get_font
+from routes.utils.images.text_fit import fit_font_size, measure_text
+
+FONT_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "routes",
+    "utils",
+    "images",
+    "fonts",
+    "Poppins-Medium.otf",
+)
+
+
+def test_measure_text_matches_textbbox():
+    draw = ImageDraw.Draw(Image.new("RGBA", (10, 10)))
+    left, top, right, bottom = draw.textbbox(
+        (0, 0), "Anfield Litter", font=get_font(FONT_PATH, 76)
+    )
+
+    assert measure_text(FONT_PATH, 76, "Anfield Litter") == (right - left, bottom - top)
+
+
+def test_fit_font_size_keeps_preferred_size_when_text_fits():
+    assert fit_font_size(FONT_PATH, "short", 1000, 76.5) == 76.5
+
+
+def test_fit_font_size_finds_largest_fitting_size():
+    text = "a.very.long.contact.address@litternetworks.org"
+
+    size = fit_font_size(FONT_PATH, text, 1050, 76)
+
+    assert size < 76
+    assert measure_text(FONT_PATH, size, text)[0] <= 1050
+    assert measure_text(FONT_PATH, size + 1, text)[0] > 1050
@@ -0,0 +1,46 @@
+# Copyright Clean and Green Communities CIC / Litter Networks
+# SPDX-License-Identifier: Apache-2.0
+
+from PIL import Image, ImageChops, ImageDraw
+
+from routes.utils.images.thumbnails import (
+    THUMBNAIL_LEVELS,
+    build_thumbnail_pyramid,
+    pyramid_keys,
+)
+
+
+def test_pyramid_keys_keep_thumb_key():
+    keys = pyramid_keys("proc/images/resources/flyer/flyer-x.png")
+
+    assert keys[0] == "proc/images/resources/flyer/flyer-x.png"
+    assert "proc/images/resources/flyer/flyer-x-thumb.png" in keys
+    assert "proc/images/resources/flyer/flyer-x-w640.png" in keys
+    assert len(keys) == len(THUMBNAIL_LEVELS) + 1
+
+
+def test_build_thumbnail_pyramid_sizes_and_quality():
+    image = Image.new("RGBA", (2000, 1000), (255, 255, 255, 255))
+    ImageDraw.Draw(image).ellipse((200, 100, 1800, 900), fill=(155, 187, 60, 255))
+
+    levels = dict(build_thumbnail_pyramid(image))
+
+    assert levels["-half"].size == (1000, 500)
+    assert levels["-quarter"].size == (500, 250)
+    assert levels["-thumb"].size == (400, 200)
+    assert levels["-w1280"].size == (1280, 640)
+    assert levels["-w320"].size == (320, 160)
+
+    # Stepping down from an earlier level stays close to a direct resize
+    direct = image.resize((400, 200), Image.Resampling.LANCZOS)
+    extrema = ImageChops.difference(levels["-thumb"], direct).getextrema()
+    assert max(high for _, high in extrema) <= 16
+
+
+def test_build_thumbnail_pyramid_never_upscales():
+    image = Image.new("RGB", (600, 300))
+
+    levels = dict(build_thumbnail_pyramid(image))
+
+    assert levels["-w640"].size == (600, 300)
+    assert levels["-w1280"].size == (600, 300)